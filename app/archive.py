@@ -0,0 +1,67 @@
+import argparse
+import asyncio
+import datetime
+import json
+from app.config import logging, TRANSACTION_ARCHIVE_AFTER_MONTHS
+from app.logs import setup_logging
+from app.storage import storage
+from app.storage.base import month_of
+
+logger = logging.getLogger(__name__)
+
+
+def months_before(month: str, count: int) -> str:
+
+    year, number = map(int, month.split("_"))
+    index = year * 12 + number - 1 - count
+    return f"{index // 12:04d}_{index % 12 + 1:02d}"
+
+
+async def archive_transactions(keep_months: int = TRANSACTION_ARCHIVE_AFTER_MONTHS, dry_run: bool = False,
+                               now: datetime.datetime = None) -> dict:
+    """Compact the Transaction buckets of months before the last `keep_months` into archive files.
+
+    Archived months stay readable through storage.transactions (reports,
+    exports, portfolio rebuilds), from the files instead of the database.
+    Returns {month: transactions archived}.
+    """
+
+    cutoff = months_before(month_of(now or datetime.datetime.now(datetime.UTC)), keep_months)
+    report = {}
+
+    for month in await storage.transactions.months():
+        if month >= cutoff:
+            break
+
+        if dry_run:
+            report[month] = await storage.transactions.count_month(month)
+            continue
+
+        report[month] = await storage.transactions.archive_month(month)
+        logger.info("Archived %s transactions of %s to %s", report[month], month, storage.transactions.archive.path(month))
+
+    return report
+
+
+async def main(keep_months: int, dry_run: bool):
+
+    await storage.connect()
+
+    try:
+        report = await archive_transactions(keep_months, dry_run)
+    finally:
+        await storage.close()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Move old months of the transaction ledger into compressed archive files")
+    parser.add_argument("--keep-months", type=int, default=TRANSACTION_ARCHIVE_AFTER_MONTHS,
+                        help="months before the current one that stay in the database")
+    parser.add_argument("--dry-run", action="store_true", help="only report the months that would be archived")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.keep_months, args.dry_run))
@@ -1,12 +1,14 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from jose import JWTError, jwt
-from passlib.context import CryptContext
 import datetime
 from datetime import timedelta
-from app.database import db
+from app.storage import storage
 from app.models import User
-from app.config import logging
+from app.config import logging, PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL
+from app.logs import SAMPLED
+from app.cache import TTLCache
+from app.singleflight import SingleFlight
+from app.hashing import hashing_pool
 
 SECRET_KEY = "NestorAndresMartinez"
 ALGORITHM = "HS256"
@@ -14,51 +16,57 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
 logger = logging.getLogger(__name__)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# token -> (claims, User), tagged by email so user writes can drop every token of that user.
+# Entries never outlive the token; the TTL bounds staleness for writes made by other workers.
+principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
 
-def verify_password(plain_password, hashed_password):
-    """Verify a plain password against a hashed password."""
-    return pwd_context.verify(plain_password, hashed_password)
+# Parallel requests of one client miss the cache together; they share the User read.
+# Flights are keyed on (email, principal_cache generation): a request arriving after
+# invalidate_user does not join a read that started before the write.
+user_lookups = SingleFlight()
 
 
-def get_password_hash(password):
-    """Hash a password for storing in the database"""
-    return pwd_context.hash(password)
+def invalidate_user(email: str):
+    """Drop cached principals for a user after a write that changes it."""
+    principal_cache.invalidate_tag(email)
 
 
 async def authenticate_user(username: str, password: str):
     """Authenticate a user with email and password."""
 
-    logger.info(f"Authenticating user with email: {username}")
+    logger.info("Authenticating user with email: %s", username, extra=SAMPLED)
 
-    user = await db['User'].find_one({"email": username})
+    user = await user_lookups.do((username, principal_cache.generation(username)), storage.users.find_by_email, username)
 
     if not user:
-        logger.warning(f"Authentication failed: user not found for email {username}")
+        logger.warning("Authentication failed: user not found for email %s", username)
         return False
 
-    if not verify_password(password, user.get("hashed_password")):
+    if not await hashing_pool.verify(password, user.get("hashed_password")):
 
-        logger.warning(f"Authentication failed: incorrect password for email {username}")
+        logger.warning("Authentication failed: incorrect password for email %s", username)
         return False
     
-    logger.info(f"Authentication successful for email {username}")
+    logger.info("Authentication successful for email %s", username, extra=SAMPLED)
     return User(**user)
 
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """Create a new access token based on the user email."""
 
-    logger.info(f"Creating access token for {data.get('sub')}")
+    logger.info("Creating access token for %s", data.get('sub'), extra=SAMPLED)
     to_encode = data.copy()
 
     expire = datetime.datetime.now(datetime.UTC) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
 
+    # python-jose is imported on first use to keep it out of the app's import time
+    from jose import jwt
+
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    logger.info(f"Access token created for {data.get('sub')}")
+    logger.info("Access token created for %s", data.get('sub'), extra=SAMPLED)
 
     return encoded_jwt
 
@@ -66,7 +74,7 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     """Get the current user from the request."""    
 
-    logger.info("Getting current user from token.")
+    logger.debug("Getting current user from token.")
 
     # create the Exception object if there is no valid user
     credentials_exception = HTTPException(
@@ -75,6 +83,15 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+    cached = principal_cache.get(token)
+
+    if cached is not None:
+        claims, user = cached
+        logger.info("Current user (cached): %s", claims['sub'], extra=SAMPLED)
+        return user
+
+    from jose import JWTError, jwt
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -87,11 +104,30 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         logger.warning("JWTError during token decode.")
         raise credentials_exception
     
-    user = await db['User'].find_one({"email": username})
+    # a write invalidating the user while it is read must not leave the old User cached
+    generation = principal_cache.generation(username)
+    user = await user_lookups.do((username, generation), storage.users.find_by_email, username)
     
     if user is None:
-        logger.warning(f"User not found for email {username}.")
+        logger.warning("User not found for email %s.", username)
         raise credentials_exception
     
-    logger.info(f"Current user: {username}")
-    return User(**user)
+    user = User(**user)
+    expires_in = payload.get("exp", 0) - datetime.datetime.now(datetime.UTC).timestamp()
+    principal_cache.set(token, (payload, user), ttl=expires_in, tag=username, generation=generation)
+
+    logger.info("Current user: %s", username, extra=SAMPLED)
+    return user
+
+
+def is_admin(user: User):
+    return "Admin" in user.roles
+
+
+async def get_current_admin(user: User = Depends(get_current_user)):
+    """Get the current user, requiring the Admin role."""
+
+    if not is_admin(user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
+
+    return user
@@ -0,0 +1,137 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries also expire after a TTL.
+
+    Entries can carry a tag so that every entry belonging to the same owner
+    (e.g. all tokens of one user) can be dropped at once. A value read from
+    the source before an invalidation must not be stored after it: take
+    generation(tag) before the read and pass it to set(), which then skips
+    the value if the tag was invalidated in between.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, clock=time.monotonic):
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()  # key -> (expires_at, tag, value)
+        self._tags = {}             # tag -> set of keys
+        self._generations = OrderedDict()  # tag -> value of _counter at its last invalidation
+        self._counter = 0
+        self._floor = 0  # generation of the tags forgotten to keep _generations within maxsize
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Return the cached value, or `default` when missing or expired."""
+
+        entry = self._data.get(key)
+
+        if entry is None or entry[0] <= self._clock():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def generation(self, tag):
+        """Token for set(): changes whenever `tag` is invalidated."""
+
+        return self._generations.get(tag, self._floor)
+
+    def set(self, key, value, ttl: float = None, tag=None, generation=None):
+        """Store a value; `ttl` may only shorten the cache-wide TTL.
+
+        With `generation`, the value is dropped if `tag` was invalidated since
+        that generation was taken.
+        """
+
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+
+        if generation is not None and generation != self.generation(tag):
+            return
+
+        if key in self._data:
+            self._remove(key)
+
+        self._data[key] = (self._clock() + ttl, tag, value)
+        if tag is not None:
+            self._tags.setdefault(tag, set()).add(key)
+
+        while len(self._data) > self.maxsize:
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def pop(self, key):
+        """Remove a single entry."""
+
+        if key in self._data:
+            self._remove(key)
+            self.invalidations += 1
+
+    def invalidate_tag(self, tag):
+        """Remove every entry stored with `tag`."""
+
+        for key in list(self._tags.get(tag, ())):
+            self._remove(key)
+            self.invalidations += 1
+
+        self._counter += 1
+        self._generations.pop(tag, None)
+        self._generations[tag] = self._counter
+
+        # a forgotten tag reports the newest generation dropped, so a read
+        # taken before its invalidation still does not match
+        while len(self._generations) > max(self.maxsize, 1):
+            _, self._floor = self._generations.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+        self._tags.clear()
+
+        # reads in flight were taken before the clear
+        self._counter += 1
+        self._generations.clear()
+        self._floor = self._counter
+
+    def _remove(self, key):
+
+        _, tag, _ = self._data.pop(key)
+
+        if tag is not None:
+            keys = self._tags.get(tag)
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
+
+    def stats(self):
+        """Snapshot of size and hit/miss counters."""
+
+        lookups = self.hits + self.misses
+
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+import time
+from typing import List
+from bson import ObjectId
+from pydantic import TypeAdapter
+from app.config import logging, CATALOG_REFRESH_SECONDS
+from app.models import InvestmentFund
+from app.storage import storage
+from app.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+fund_list = TypeAdapter(List[InvestmentFund])
+
+
+class FundCatalog:
+    """Process-local copy of the InvestmentFund collection.
+
+    Writers bump a version counter in storage; every worker compares it with
+    the version it loaded at most once per `refresh_interval` seconds (or
+    right away on an unknown id) and reloads when it changed. With a replica
+    set, `watch()` reloads on change-stream events instead of waiting.
+
+    Concurrent refreshes share one version check (and reload), so a burst of
+    requests after the interval, or for a fund the worker has not seen yet,
+    costs one query.
+
+    Each load also validates the funds once and keeps the `/funds/list`
+    response body as JSON bytes, so requests do no per-fund work.
+    """
+
+    def __init__(self, refresh_interval: float):
+
+        self.refresh_interval = refresh_interval
+        self.version = None
+        self.etag = None
+        self.body = b"[]"
+        self._funds = {}
+        self._loaded = False
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+        self.refreshes = SingleFlight()
+
+    async def load(self):
+        """Read the whole collection and the version it corresponds to."""
+
+        async with self._lock:
+            version = await storage.funds.get_version()
+            funds = await storage.funds.find_all()
+
+            self._funds = {str(fund["_id"]): fund for fund in funds}
+            self.version = version
+            self.body = fund_list.dump_json(fund_list.validate_python(funds), by_alias=True)
+            self.etag = '"' + hashlib.sha1(self.body).hexdigest() + '"'
+            self._loaded = True
+            self._checked_at = time.monotonic()
+
+        logger.info("Fund catalog loaded: %s funds, version %s", len(funds), version)
+
+    async def refresh(self, force: bool = False):
+        """Reload if another worker changed the catalog since it was loaded."""
+
+        if self._loaded and not force and time.monotonic() - self._checked_at < self.refresh_interval:
+            return
+
+        await self.refreshes.do("version", self._refresh)
+
+    async def _refresh(self):
+
+        if not self._loaded or await storage.funds.get_version() != self.version:
+            await self.load()
+        else:
+            self._checked_at = time.monotonic()
+
+    async def get(self, fund_id: str):
+        """Return the fund document for an id, or None."""
+
+        if not ObjectId.is_valid(fund_id):
+            return None
+
+        await self.refresh()
+        fund = self._funds.get(fund_id)
+
+        if fund is None:
+            # may have been created by another worker since the last check
+            await self.refresh(force=True)
+            fund = self._funds.get(fund_id)
+
+        return fund
+
+    async def list(self):
+        """Return every fund document."""
+
+        await self.refresh()
+        return list(self._funds.values())
+
+    async def serialized(self):
+        """Return (JSON body, ETag) of the whole catalog."""
+
+        await self.refresh()
+        return self.body, self.etag
+
+    async def invalidate(self):
+        """Record a write to the catalog so every worker reloads it."""
+
+        await storage.funds.bump_version()
+        await self.load()
+
+    async def watch(self):
+        """Reload on every InvestmentFund change (requires a replica set)."""
+
+        async for _ in storage.funds.watch():
+            await self.load()
+
+
+fund_catalog = FundCatalog(CATALOG_REFRESH_SECONDS)
@@ -1,13 +1,98 @@
 import logging
-from typing import Any
+import os
+from dotenv import load_dotenv
+from app.logs import parse_levels
 
-from bson import ObjectId
-from pydantic import GetJsonSchemaHandler
-from pydantic_core import CoreSchema
+load_dotenv()
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s %(message)s'
-)
+# Logging (see app.logs): root level, "json" or "text" lines, per-logger levels
+# such as "app.auth=WARNING,uvicorn.access=ERROR", and the share of per-request
+# INFO lines that are kept
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_LEVELS = parse_levels(os.getenv("LOG_LEVELS", ""))
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1))
 
+# MongoDB connection and pool (see app.database); MONGO_COMPRESSORS is a
+# comma-separated list such as "zstd,zlib", empty for no wire compression
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "BTG_DB")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "")
 
+# /health/ready fails once the p99 wait for a pooled connection exceeds this
+READY_MAX_CHECKOUT_WAIT_MS = float(os.getenv("READY_MAX_CHECKOUT_WAIT_MS", 500))
+
+# Password hashing executor: "thread", "process" or "inline" (on the event loop)
+HASH_EXECUTOR = os.getenv("HASH_EXECUTOR", "thread")
+HASH_MAX_WORKERS = int(os.getenv("HASH_MAX_WORKERS", os.cpu_count() or 1))
+HASH_MAX_CONCURRENCY = int(os.getenv("HASH_MAX_CONCURRENCY", HASH_MAX_WORKERS))
+
+# Authenticated-principal cache used by get_current_user
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", 30))
+
+# Let concurrent identical reads (user and fund catalog lookups) share one query
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+# Record per-route request metrics and serve them on /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Directory where each worker process saves its metrics so /metrics sums every
+# worker (app.server sets it when running several); empty serves this process only
+METRICS_MULTIPROCESS_DIR = os.getenv("METRICS_MULTIPROCESS_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", 5))
+
+# Database command profiler (see app.profiler): on/off, the duration from which a
+# command is logged and explained, and how many slow commands are kept
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "true").lower() == "true"
+PROFILER_SLOW_MS = float(os.getenv("PROFILER_SLOW_MS", 100))
+PROFILER_SLOW_LOG_SIZE = int(os.getenv("PROFILER_SLOW_LOG_SIZE", 100))
+
+# Explain the router queries at startup and log the ones that scan a whole collection
+INDEX_CHECK = os.getenv("INDEX_CHECK", "false").lower() == "true"
+
+# Wrap subscribe/cancel writes in a multi-document transaction (requires a replica set)
+MONGO_TRANSACTIONS = os.getenv("MONGO_TRANSACTIONS", "false").lower() == "true"
+
+# Fund catalog: seconds between checks for writes made by other workers,
+# and whether to follow a change stream instead (requires a replica set)
+CATALOG_REFRESH_SECONDS = float(os.getenv("CATALOG_REFRESH_SECONDS", 5))
+CATALOG_CHANGE_STREAM = os.getenv("CATALOG_CHANGE_STREAM", "false").lower() == "true"
+
+# Idempotency-Key handling (see app.idempotency): how long stored responses are
+# replayed, how many are kept in process, how long a duplicate waits for the
+# request still running, and after how long a claim left by a dead worker expires
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", 86400))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10000))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", 10))
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", 60))
+
+# Notification dispatch (see app.notifications)
+NOTIFICATION_SENDER = os.getenv("NOTIFICATION_SENDER", "fake")
+NOTIFICATION_WORKERS = int(os.getenv("NOTIFICATION_WORKERS", 4))
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", 50))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", 5))
+NOTIFICATION_BACKOFF_SECONDS = float(os.getenv("NOTIFICATION_BACKOFF_SECONDS", 2))
+NOTIFICATION_POLL_SECONDS = float(os.getenv("NOTIFICATION_POLL_SECONDS", 5))
+
+# Production server (see app.server): worker processes default to the CPUs this
+# process may run on; each worker exits after SERVER_MAX_REQUESTS requests (plus
+# up to SERVER_MAX_REQUESTS_JITTER, 0 to never recycle) and is replaced, and
+# in-flight requests get SERVER_GRACEFUL_TIMEOUT seconds to finish on shutdown
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", 8000))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1))
+SERVER_MAX_REQUESTS = int(os.getenv("SERVER_MAX_REQUESTS", 0))
+SERVER_MAX_REQUESTS_JITTER = int(os.getenv("SERVER_MAX_REQUESTS_JITTER", 0))
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", 30))
+
+# Transaction ledger archive (see app.archive): months older than this many
+# months are compacted into files under TRANSACTION_ARCHIVE_DIR
+TRANSACTION_ARCHIVE_DIR = os.getenv("TRANSACTION_ARCHIVE_DIR", "archive")
+TRANSACTION_ARCHIVE_AFTER_MONTHS = int(os.getenv("TRANSACTION_ARCHIVE_AFTER_MONTHS", 12))
+
+# Storage engine: "mongo", or "memory" for tests, benchmarks and local development
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")
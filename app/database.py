@@ -1,17 +1,120 @@
-
-import os
+import collections
+import threading
+import time
+from urllib.parse import urlsplit
 from motor.motor_asyncio import AsyncIOMotorClient
-from dotenv import load_dotenv
-from app.config import logging
+from pymongo import monitoring
+from app.config import logging, MONGO_URI, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_WAIT_QUEUE_TIMEOUT_MS, \
+    MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_COMPRESSORS, PROFILER_ENABLED
+from app.profiler import query_profiler
 
 logger = logging.getLogger(__name__)
 
-load_dotenv()
 
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
-MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "BTG_DB")
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Connection counts and checkout wait times of the Motor connection pools.
+
+    Checkouts that wait longer than the pool can serve show up here first:
+    `waiting` grows and the wait percentiles climb before requests time out.
+    Percentiles cover the checkouts of the last `window` seconds.
+    """
+
+    def __init__(self, max_pool_size=MONGO_MAX_POOL_SIZE, window=10, samples=10000, clock=time.monotonic):
+
+        self.max_pool_size = max_pool_size
+        self.window = window
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.open = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.failed = 0
+        self.waits = collections.deque(maxlen=samples)  # (time, checkout wait in ms)
+
+    def connection_check_out_started(self, event):
+        with self.lock:
+            self.waiting += 1
+
+    def connection_checked_out(self, event):
+        with self.lock:
+            self.waiting -= 1
+            self.checked_out += 1
+            self.waits.append((self.clock(), event.duration * 1000))
+
+    def connection_check_out_failed(self, event):
+        with self.lock:
+            self.waiting -= 1
+            self.failed += 1
+            self.waits.append((self.clock(), event.duration * 1000))
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self.lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self.lock:
+            self.open -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def stats(self):
+
+        since = self.clock() - self.window
+
+        with self.lock:
+            waits = sorted(wait for at, wait in self.waits if at >= since)
+
+            return {
+                "max_pool_size": self.max_pool_size,
+                "open": self.open,
+                "checked_out": self.checked_out,
+                "waiting": self.waiting,
+                "checkout_failures": self.failed,
+                "checkout_wait_p50_ms": round(waits[len(waits) // 2], 3) if waits else 0.0,
+                "checkout_wait_p99_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.99))], 3) if waits else 0.0,
+            }
+
+
+pool_monitor = PoolMonitor()
+
+
+def redact(uri: str) -> str:
+    """The URI without credentials, for logs."""
+
+    parts = urlsplit(uri)
+    return parts._replace(netloc=parts.netloc.rpartition("@")[2]).geturl()
+
+
+def create_client() -> AsyncIOMotorClient:
+    """Motor client with the pool, timeout and compression settings from app.config."""
+
+    logger.info("Connecting to MongoDB at %s, pool %s-%s", redact(MONGO_URI), MONGO_MIN_POOL_SIZE, MONGO_MAX_POOL_SIZE)
 
-logger.info(f"Connecting to MongoDB at {MONGO_URI}, DB: {MONGO_DB_NAME}")
+    listeners = [pool_monitor, query_profiler] if PROFILER_ENABLED else [pool_monitor]
 
-client = AsyncIOMotorClient(MONGO_URI)
-db = client[MONGO_DB_NAME]
+    return AsyncIOMotorClient(
+        MONGO_URI,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        compressors=MONGO_COMPRESSORS or None,
+        event_listeners=listeners,
+    )
@@ -0,0 +1,78 @@
+import csv
+import datetime
+import io
+import json
+from bson import ObjectId
+
+EXPORT_BATCH_SIZE = 1000
+
+# Columns of an exported transaction, in CSV order
+EXPORT_FIELDS = ["_id", "customerId", "customerName", "amount", "type", "fundName", "fundCategory", "timestamp"]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _row(document: dict) -> dict:
+
+    row = {field: document.get(field) for field in EXPORT_FIELDS}
+    row["customerId"] = document.get("customer_id")
+    return row
+
+
+def _default(value):
+
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+async def _batches(cursor, batch_size: int):
+    """Group the documents of an async iterator into lists of up to `batch_size`."""
+
+    batch = []
+    async for document in cursor:
+        batch.append(_row(document))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+async def ndjson_lines(cursor, batch_size: int = EXPORT_BATCH_SIZE):
+    """One JSON document per line, a chunk per batch."""
+
+    async for batch in _batches(cursor, batch_size):
+        yield "".join(json.dumps(document, default=_default) + "\n" for document in batch)
+
+
+async def csv_lines(cursor, batch_size: int = EXPORT_BATCH_SIZE):
+    """A header line followed by one CSV line per document, a chunk per batch."""
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+
+    async for batch in _batches(cursor, batch_size):
+        for document in batch:
+            document["_id"] = str(document["_id"])
+            document["timestamp"] = document["timestamp"].isoformat()
+            writer.writerow(document)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+WRITERS = {
+    "ndjson": ndjson_lines,
+    "csv": csv_lines,
+}
@@ -0,0 +1,272 @@
+import argparse
+import asyncio
+import codecs
+import csv
+import json
+import os
+from pydantic import ValidationError
+from app.config import logging
+from app.logs import setup_logging
+from app.models import InvestmentFundCreate
+from app.catalog import fund_catalog
+from app.storage import storage
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 64 * 1024
+MAX_REPORTED_ERRORS = 1000
+FORMATS = ("json", "ndjson", "csv")
+
+
+def detect_format(filename: str) -> str:
+    """Import format from a file extension (.json, .ndjson/.jsonl, .csv)."""
+
+    extension = os.path.splitext(filename or "")[1].lower().lstrip(".")
+    return {"jsonl": "ndjson"}.get(extension, extension)
+
+
+async def decode(read, encoding="utf-8-sig"):
+    """Text chunks from an async `read(size)` returning bytes."""
+
+    decoder = codecs.getincrementaldecoder(encoding)()
+
+    while True:
+        data = await read(READ_SIZE)
+        if not data:
+            break
+        yield decoder.decode(data)
+
+    yield decoder.decode(b"", final=True)
+
+
+async def _lines(chunks):
+
+    pending = ""
+
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def read_ndjson(chunks):
+    """(row number, object, error) for each non-blank line."""
+
+    number = 0
+
+    async for line in _lines(chunks):
+        number += 1
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line), None
+        except ValueError as e:
+            yield number, None, f"Invalid JSON: {e}"
+
+
+async def read_csv(chunks):
+    """(row number, object, error) for each line after the header.
+
+    Fields are split line by line, so quoted values cannot contain newlines.
+    """
+
+    header = None
+    number = 0
+
+    async for line in _lines(chunks):
+        if not line.strip():
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        number += 1
+        if len(values) != len(header):
+            yield number, None, f"Expected {len(header)} columns, got {len(values)}"
+        else:
+            yield number, dict(zip(header, values)), None
+
+
+def _element_end(buffer: str, position: int):
+    """Index of the "," or "]" ending the array element at `position`, or None if it is not in `buffer` yet."""
+
+    depth = 0
+    in_string = escaped = False
+
+    for index in range(position, len(buffer)):
+        char = buffer[index]
+
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "[{":
+            depth += 1
+        elif char in "]}" and depth > 0:
+            depth -= 1
+        elif char in ",]" and depth == 0:
+            return index
+
+    return None
+
+
+async def read_json_array(chunks):
+    """(row number, object, error) for each element of a top-level JSON array.
+
+    Elements are decoded as soon as they are complete, so the array is never
+    held in memory as a whole. A malformed element is reported and skipped up
+    to the next "," or "]" outside strings and brackets.
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = ""
+    number = 0
+    opened = closed = False
+
+    async for chunk in chunks:
+        buffer += chunk
+        position = 0
+
+        while not closed:
+            while position < len(buffer) and (buffer[position].isspace() or (opened and buffer[position] == ",")):
+                position += 1
+            if position == len(buffer):
+                break
+            if not opened:
+                if buffer[position] != "[":
+                    yield 0, None, "Expected a JSON array"
+                    return
+                opened = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                closed = True
+                position += 1
+                break
+            try:
+                element, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                end = _element_end(buffer, position)
+                if end is None:
+                    break  # incomplete element, wait for more data
+                number += 1
+                yield number, None, f"Invalid JSON: {e}"
+                position = end
+                continue
+            number += 1
+            yield number, element, None
+
+        buffer = buffer[position:]
+
+    if not closed or buffer.strip():
+        yield number + 1, None, "Malformed or truncated JSON array"
+
+
+READERS = {
+    "json": read_json_array,
+    "ndjson": read_ndjson,
+    "csv": read_csv,
+}
+
+
+def _describe(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors())
+
+
+class ImportReport:
+    """Counts and per-row errors of an import."""
+
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, row: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def as_dict(self):
+        return {"inserted": self.inserted, "failed": self.failed, "errors": self.errors}
+
+
+async def _insert(chunk, report: ImportReport):
+
+    inserted, errors = await storage.funds.insert_many([document for _, document in chunk])
+    report.inserted += inserted
+
+    for index, message in errors:
+        report.error(chunk[index][0], message)
+
+
+async def import_funds(rows, chunk_size: int = 500) -> dict:
+    """Validate `rows` as InvestmentFundCreate and insert them in unordered chunks.
+
+    Invalid rows and rejected inserts are reported by row number without
+    stopping the rest of the import.
+    """
+
+    report = ImportReport()
+    chunk = []
+
+    async for number, row, error in rows:
+
+        if error is None:
+            try:
+                chunk.append((number, InvestmentFundCreate.model_validate(row).model_dump()))
+            except ValidationError as e:
+                error = _describe(e)
+
+        if error is not None:
+            report.error(number, error)
+
+        if len(chunk) >= chunk_size:
+            await _insert(chunk, report)
+            chunk = []
+
+    if chunk:
+        await _insert(chunk, report)
+
+    if report.inserted:
+        await fund_catalog.invalidate()
+
+    logger.info("Fund import finished: %s inserted, %s failed", report.inserted, report.failed)
+    return report.as_dict()
+
+
+async def main(path: str, import_format: str, chunk_size: int):
+
+    await storage.connect()
+
+    with open(path, "rb") as file:
+
+        async def read(size):
+            return file.read(size)
+
+        try:
+            report = await import_funds(READERS[import_format](decode(read)), chunk_size)
+        finally:
+            await storage.close()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Import investment funds from a JSON array, NDJSON or CSV file")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS, help="defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.path, args.format or detect_format(args.path), args.chunk_size))
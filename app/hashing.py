@@ -0,0 +1,119 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from app.config import logging, HASH_EXECUTOR, HASH_MAX_WORKERS, HASH_MAX_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+
+@functools.cache
+def password_context():
+    """The bcrypt context, built on first use so importing the app does not load passlib."""
+
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def verify_password(plain_password, hashed_password):
+    """Verify a plain password against a hashed password."""
+    return password_context().verify(plain_password, hashed_password)
+
+
+def get_password_hash(password):
+    """Hash a password for storing in the database"""
+    return password_context().hash(password)
+
+
+class HashingPool:
+    """Runs bcrypt work on an executor so it never blocks the event loop.
+
+    `kind` is "thread", "process" or "inline" (run on the loop, as before).
+    At most `max_concurrency` hashes run at once; the rest wait on a semaphore,
+    which is where queue depth and wait time are measured.
+    """
+
+    def __init__(self, kind: str = "thread", max_workers: int = 1, max_concurrency: int = None):
+
+        if kind not in ("thread", "process", "inline"):
+            raise ValueError(f"Unknown hashing executor: {kind}")
+
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency or max_workers
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._executor: Executor = None
+
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _get_executor(self):
+        if self._executor is None and self.kind != "inline":
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+            logger.info("Started %s hashing executor with %s workers", self.kind, self.max_workers)
+        return self._executor
+
+    async def run(self, fn, *args):
+        """Run `fn(*args)` on the executor once a concurrency slot is free."""
+
+        self.waiting += 1
+        queued_at = time.perf_counter()
+
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        wait = time.perf_counter() - queued_at
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.in_flight += 1
+
+        try:
+            if self.kind == "inline":
+                return fn(*args)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    async def verify(self, plain_password, hashed_password):
+        """Verify a password without blocking the event loop."""
+        return await self.run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password):
+        """Hash a password without blocking the event loop."""
+        return await self.run(get_password_hash, password)
+
+    def stats(self):
+        """Snapshot of queue depth, concurrency and wait times."""
+
+        return {
+            "executor": self.kind,
+            "max_workers": self.max_workers,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.waiting,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "avg_wait_ms": (self.total_wait / self.completed * 1000) if self.completed else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+    def shutdown(self):
+        """Stop the executor, waiting for running hashes to finish."""
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+hashing_pool = HashingPool(HASH_EXECUTOR, HASH_MAX_WORKERS, HASH_MAX_CONCURRENCY)
@@ -0,0 +1,226 @@
+import asyncio
+import datetime
+import hashlib
+import time
+from starlette.routing import Match
+from app.config import logging, IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_WAIT_SECONDS, \
+    IDEMPOTENCY_LOCK_SECONDS
+from app.cache import TTLCache
+from app.serialization import dumps
+from app.storage import storage
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+# Route templates whose POST responses are stored under an Idempotency-Key
+IDEMPOTENT_ROUTES = {"/funds/subscribe/{fund_id}", "/funds/cancel/{fund_id}", "/auth/register"}
+
+# How often a duplicate checks storage while another worker runs the request
+POLL_SECONDS = 0.05
+
+# record key -> (fingerprint, response) of completed requests, in front of storage.idempotency
+response_cache = TTLCache(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL_SECONDS)
+
+
+def utcnow():
+    return datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+
+
+def digest(*parts: bytes) -> str:
+    return hashlib.sha256(b"\0".join(parts)).hexdigest()
+
+
+def error_response(status_code: int, detail: str) -> dict:
+
+    body = dumps({"detail": detail})
+    return {"status_code": status_code, "body": body,
+            "headers": [["content-type", "application/json"], ["content-length", str(len(body))]]}
+
+
+async def send_response(send, response: dict, replayed: bool = False):
+
+    headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in response["headers"]]
+    if replayed:
+        headers.append((REPLAYED_HEADER.lower().encode("latin-1"), b"true"))
+
+    await send({"type": "http.response.start", "status": response["status_code"], "headers": headers})
+    await send({"type": "http.response.body", "body": response["body"]})
+
+
+async def read_body(receive) -> bytes:
+
+    chunks = []
+
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if message["type"] != "http.request" or not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def replay_body(body: bytes, receive):
+    """An ASGI receive that hands the already-read body to the app, then defers to the server."""
+
+    pending = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive_body():
+        return pending.pop() if pending else await receive()
+
+    return receive_body
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware that answers a retried POST with the response of its first attempt.
+
+    Applies to `routes` when the request carries an Idempotency-Key header. Keys
+    are scoped to the Authorization header, so a client never gets another's
+    response, and reusing one with a different path or body answers 422. The
+    first response below 500 is stored in `storage.idempotency` for
+    IDEMPOTENCY_TTL_SECONDS, the most recent ones also in `response_cache`, and
+    replays skip authentication and the handler entirely. A duplicate arriving
+    while the first attempt runs waits for it: behind a future on the same
+    worker, by polling storage from others, with 409 after IDEMPOTENCY_WAIT_SECONDS.
+    """
+
+    def __init__(self, app, routes, cache=None, wait=IDEMPOTENCY_WAIT_SECONDS):
+        self.app = app
+        self.routes = routes
+        self.cache = response_cache if cache is None else cache
+        self.wait = wait
+        self.in_flight = {}  # record key -> future resolved when the request holding it is done
+
+    def match(self, scope):
+        """Scope of the idempotent route the request is for, or None."""
+
+        for route in self.routes:
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                return child_scope
+
+        return None
+
+    async def __call__(self, scope, receive, send):
+
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        idempotency_key = headers.get(IDEMPOTENCY_HEADER.lower().encode("latin-1"))
+        child_scope = self.match(scope) if idempotency_key is not None else None
+
+        if child_scope is None:
+            return await self.app(scope, receive, send)
+
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            detail = f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters"
+            return await send_response(send, error_response(400, detail))
+
+        body = await read_body(receive)
+        key = digest(headers.get(b"authorization", b""), idempotency_key)
+        fingerprint = digest(scope["path"].encode(), body)
+
+        try:
+            stored = await self.stored_response(key, fingerprint)
+        except TimeoutError:
+            logger.warning("Request with %s still in progress after %ss", IDEMPOTENCY_HEADER, self.wait)
+            return await send_response(send, error_response(409, f"A request with this {IDEMPOTENCY_HEADER} is in progress"))
+
+        if stored is None:
+            return await self.run(scope, replay_body(body, receive), send, key, fingerprint)
+
+        if stored[0] != fingerprint:
+            detail = f"{IDEMPOTENCY_HEADER} was already used for a different request"
+            return await send_response(send, error_response(422, detail))
+
+        # the route labels metrics and profiles as if the handler had run
+        scope.update(child_scope)
+        await send_response(send, stored[1], replayed=True)
+
+    async def stored_response(self, key, fingerprint):
+        """(fingerprint, response) stored for `key`, or None once this request holds the key.
+
+        Raises TimeoutError when the request holding it does not finish within `wait`.
+        """
+
+        deadline = time.monotonic() + self.wait
+
+        while True:
+            stored = self.cache.get(key)
+            if stored is not None:
+                return stored
+
+            future = self.in_flight.get(key)
+            if future is None:
+                break
+
+            # another request on this worker is running it, or waiting on another worker
+            await asyncio.wait_for(asyncio.shield(future), max(0.0, deadline - time.monotonic()))
+
+        self.in_flight[key] = asyncio.get_running_loop().create_future()
+        holding = False
+
+        try:
+            while True:
+                now = utcnow()
+                record = await storage.idempotency.get(key, now)
+
+                if record is not None and record["status"] == "completed":
+                    stored = (record["fingerprint"], record["response"])
+                    self.cache.set(key, stored, ttl=(record["expires_at"] - now).total_seconds())
+                    return stored
+
+                locked_until = now + datetime.timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)
+                expires_at = now + datetime.timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+                if await storage.idempotency.claim(key, fingerprint, now, locked_until, expires_at):
+                    holding = True
+                    return None
+
+                if time.monotonic() >= deadline:
+                    raise TimeoutError
+
+                await asyncio.sleep(POLL_SECONDS)
+        finally:
+            if not holding:
+                self.finish(key)
+
+    async def run(self, scope, receive, send, key, fingerprint):
+        """Run the request holding `key` and store its response, or free the key if it fails."""
+
+        response = {"status_code": 500, "headers": [], "body": b""}
+        chunks = []
+
+        async def capture(message):
+
+            if message["type"] == "http.response.start":
+                response["status_code"] = message["status"]
+                response["headers"] = [[name.decode("latin-1"), value.decode("latin-1")] for name, value in message["headers"]]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+            await send(message)
+
+        completed = False
+
+        try:
+            await self.app(scope, receive, capture)
+            completed = response["status_code"] < 500
+        finally:
+            try:
+                if completed:
+                    response["body"] = b"".join(chunks)
+                    await storage.idempotency.complete(key, response)
+                    self.cache.set(key, (fingerprint, response))
+                else:
+                    await storage.idempotency.release(key)
+            finally:
+                self.finish(key)
+
+    def finish(self, key):
+        """Wake the requests waiting on this worker for `key`."""
+
+        future = self.in_flight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(None)
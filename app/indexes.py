@@ -0,0 +1,152 @@
+import argparse
+import asyncio
+import re
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from app.config import logging
+from app.logs import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Indexes every collection needs, ensured at startup by the app lifespan
+INDEXES = {
+    "User": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "InvestmentFund": [
+        IndexModel([("category", ASCENDING), ("name", ASCENDING), ("_id", ASCENDING)], name="category_name"),
+        IndexModel([("category", ASCENDING), ("minimumFee", ASCENDING), ("_id", ASCENDING)], name="category_fee"),
+        IndexModel([("name", ASCENDING), ("_id", ASCENDING)], name="name"),
+        IndexModel([("minimumFee", ASCENDING), ("_id", ASCENDING)], name="fee"),
+    ],
+    "UserInvestmentFund": [
+        IndexModel([("user_id", ASCENDING), ("fund_id", ASCENDING)], name="user_fund_unique", unique=True),
+    ],
+    "Transaction": [
+        IndexModel([("customer_id", ASCENDING), ("timestamp", ASCENDING)], name="customer_timestamp"),
+    ],
+    "NotificationOutbox": [
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt"),
+        IndexModel([("claim", ASCENDING)], name="claim", sparse=True),
+    ],
+    "IdempotencyKey": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+# Collections stored as one collection per month, "<name>_YYYY_MM"; their
+# indexes are created on every month
+BUCKETED = {"Transaction"}
+
+
+def bucket_name(collection: str, month: str) -> str:
+    return f"{collection}_{month}"
+
+
+async def bucket_collections(db, collection: str) -> list[str]:
+    """Names of the month collections of a bucketed collection, oldest first."""
+
+    pattern = f"^{re.escape(collection)}_\\d{{4}}_\\d{{2}}$"
+    return sorted(await db.list_collection_names(filter={"name": {"$regex": pattern}}))
+
+
+async def ensure_bucket_indexes(db, collection: str, month: str):
+    """Create the indexes of a new month collection (no-op when they exist)."""
+
+    await db[bucket_name(collection, month)].create_indexes(INDEXES[collection])
+
+
+# Query shapes issued by the routers: (collection, filter, sort).
+# check_query_plans() explains each one and flags those that scan the collection.
+ROUTER_QUERIES = [
+    ("User", {"email": "user@example.com"}, None),
+    ("InvestmentFund", {"_id": ObjectId()}, None),
+    ("InvestmentFund", {"category": "FIC"}, [("name", ASCENDING), ("_id", ASCENDING)]),
+    ("InvestmentFund", {"category": "FIC", "minimumFee": {"$gte": 0}}, [("minimumFee", ASCENDING), ("_id", ASCENDING)]),
+    ("InvestmentFund", {"name": {"$regex": "^Tech"}}, [("name", ASCENDING), ("_id", ASCENDING)]),
+    ("InvestmentFund", {"minimumFee": {"$lte": 1000}}, [("minimumFee", ASCENDING), ("_id", ASCENDING)]),
+    ("UserInvestmentFund", {"user_id": "user", "fund_id": "fund"}, None),
+    ("Transaction", {"customer_id": "user"}, [("timestamp", ASCENDING)]),
+]
+
+
+async def ensure_indexes(db):
+    """Create the declared indexes; existing ones are left untouched."""
+
+    for logical, indexes in INDEXES.items():
+        for collection in await bucket_collections(db, logical) if logical in BUCKETED else [logical]:
+            try:
+                names = await db[collection].create_indexes(indexes)
+                logger.info("Indexes ensured on %s: %s", collection, names)
+            except OperationFailure as e:
+                # e.g. duplicated emails prevent the unique index; keep serving and report it
+                logger.error("Could not create indexes on %s: %s", collection, e)
+
+
+def uses_collection_scan(plan) -> bool:
+    """True if an explain plan (or any of its stages) is a COLLSCAN."""
+
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            return True
+        return any(uses_collection_scan(value) for value in plan.values())
+
+    if isinstance(plan, list):
+        return any(uses_collection_scan(value) for value in plan)
+
+    return False
+
+
+async def check_query_plans(db, queries=ROUTER_QUERIES):
+    """Explain the router queries and return the ones that do not use an index.
+
+    Queries on a bucketed collection are explained on its latest month.
+    """
+
+    unindexed = []
+
+    for collection, query, sort in queries:
+        target = collection
+        if collection in BUCKETED:
+            buckets = await bucket_collections(db, collection)
+            if not buckets:
+                continue
+            target = buckets[-1]
+
+        cursor = db[target].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+
+        explain = await cursor.explain()
+
+        if uses_collection_scan(explain.get("queryPlanner", {}).get("winningPlan")):
+            logger.warning("Unindexed query on %s: filter=%s sort=%s", collection, list(query), sort)
+            unindexed.append((collection, query, sort))
+
+    return unindexed
+
+
+async def main(check: bool):
+
+    from app.storage import storage
+
+    await storage.connect()
+
+    try:
+        await storage.ensure_indexes()
+        unindexed = await storage.check_query_plans() if check else []
+    finally:
+        await storage.close()
+
+    raise SystemExit(1 if unindexed else 0)
+
+
+if __name__ == "__main__":
+
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Ensure MongoDB indexes")
+    parser.add_argument("--check", action="store_true", help="fail if a router query does not use an index")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.check))
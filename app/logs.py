@@ -0,0 +1,138 @@
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+
+# Pass as `extra=SAMPLED` on high-volume per-request lines; LOG_SAMPLE_RATE of them are kept.
+SAMPLED = {"sampled": True}
+
+# Attributes every LogRecord has; anything else was passed through `extra`.
+RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any `extra` fields."""
+
+    def format(self, record):
+
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.UTC).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+
+        for key, value in vars(record).items():
+            if key not in RECORD_FIELDS and key != "sampled":
+                entry[key] = value
+
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep `rate` of the records logged with `extra=SAMPLED`; warnings and above always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not getattr(record, "sampled", False):
+            return True
+        return random.random() < self.rate
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    The stock handler renders the message before enqueueing it, which is the
+    work we want off the event loop. Records keep their args instead, so log
+    values (strings, ids, numbers), not documents that may change afterwards.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+_listener = None
+
+
+def parse_levels(spec: str) -> dict:
+    """"app.auth=WARNING,uvicorn.access=ERROR" -> {"app.auth": "WARNING", "uvicorn.access": "ERROR"}"""
+
+    levels = {}
+
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = item.partition("=")
+        levels[name.strip()] = level.strip().upper()
+
+    return levels
+
+
+def configure_logging(level="INFO", fmt="json", levels=None, sample_rate=1.0, stream=None):
+    """Route the root logger through a queue to a single writer thread.
+
+    Loggers only build a LogRecord and put it on the queue; the listener
+    thread formats it (`json` or `text`) and writes to `stream` (stderr).
+    `levels` overrides the level of individual loggers.
+    """
+
+    global _listener
+
+    stop_logging()
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+
+    records = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(records)
+
+    if sample_rate < 1:
+        queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level.upper())
+
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+
+    # flush what is still queued when the process exits
+    atexit.unregister(stop_logging)
+    atexit.register(stop_logging)
+
+
+def setup_logging():
+    """configure_logging() with the LOG_* settings of app.config.
+
+    Called at lifespan startup and by the command-line entry points rather
+    than at import, so importing the app starts no thread.
+    """
+
+    from app.config import LOG_LEVEL, LOG_FORMAT, LOG_LEVELS, LOG_SAMPLE_RATE
+
+    configure_logging(LOG_LEVEL, LOG_FORMAT, LOG_LEVELS, LOG_SAMPLE_RATE)
+
+
+def stop_logging():
+    """Flush the queue and stop the writer thread."""
+
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
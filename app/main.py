@@ -1,7 +1,20 @@
-from fastapi import FastAPI, Request
-from app.config import logging
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
+from app.config import logging, INDEX_CHECK, CATALOG_CHANGE_STREAM, METRICS_ENABLED, METRICS_MULTIPROCESS_DIR, \
+    PROFILER_ENABLED
+from app.logs import setup_logging
+from app.metrics import CONTENT_TYPE, MetricsMiddleware, flush_periodically, registry
+from app.profiler import ProfilerMiddleware, query_profiler
+from app.idempotency import IDEMPOTENT_ROUTES, IdempotencyMiddleware
+from app.storage import storage
+from app.hashing import hashing_pool
+from app.catalog import fund_catalog
+from app.notifications import dispatcher
 from app.routers.funds_routers import router as founds_router
 from app.routers.auth_router import router as auth_router
+from app.routers.admin_router import router as admin_router
+from app.routers.health_router import router as health_router
 import logging
 import warnings
 
@@ -10,9 +23,66 @@ warnings.filterwarnings("ignore", category=DeprecationWarning)
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+
+    setup_logging()
+    await storage.connect()
+
+    if PROFILER_ENABLED and storage.client is not None:
+        query_profiler.start(storage.client)
+
+    await storage.ensure_indexes()
+
+    if INDEX_CHECK:
+        await storage.check_query_plans()
+
+    await fund_catalog.load()
+    watcher = asyncio.create_task(fund_catalog.watch()) if CATALOG_CHANGE_STREAM else None
+    dispatcher.start()
+
+    sharing_metrics = METRICS_ENABLED and METRICS_MULTIPROCESS_DIR
+    flusher = asyncio.create_task(flush_periodically(METRICS_MULTIPROCESS_DIR)) if sharing_metrics else None
+
+    yield
+
+    if flusher:
+        flusher.cancel()
+        registry.write(METRICS_MULTIPROCESS_DIR)
+
+    await dispatcher.stop()
+
+    if watcher:
+        watcher.cancel()
+
+    hashing_pool.shutdown()
+    await storage.close()
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(auth_router)
 app.include_router(founds_router)
+app.include_router(admin_router)
+app.include_router(health_router)
+
+app.add_middleware(IdempotencyMiddleware, routes=[
+    route for router in (auth_router, founds_router) for route in router.routes if route.path in IDEMPOTENT_ROUTES
+])
+
+if PROFILER_ENABLED:
+    app.add_middleware(ProfilerMiddleware)
+
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get('/metrics', include_in_schema=False)
+    async def metrics():
+
+        # rendered on the loop thread, where MetricsMiddleware adds label sets
+        if not METRICS_MULTIPROCESS_DIR:
+            return Response(registry.render(), media_type=CONTENT_TYPE)
+
+        registry.write(METRICS_MULTIPROCESS_DIR)
+        return Response(registry.render_directory(METRICS_MULTIPROCESS_DIR), media_type=CONTENT_TYPE)
 
 @app.get('/')
 def root(request: Request = None):
@@ -0,0 +1,235 @@
+import asyncio
+import bisect
+import copy
+import json
+import os
+import time
+from app.config import METRICS_FLUSH_SECONDS
+
+# Latency histogram upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _labels(names, values):
+
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+
+    kind = "counter"
+    live = False
+
+    def __init__(self, name, help, labels):
+        self.name, self.help, self.labels = name, help, labels
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def state(self):
+        return [[list(labels), value] for labels, value in self.values.items()]
+
+    def merge(self, state):
+        for labels, value in state:
+            self.inc(*labels, amount=value)
+
+    def render(self):
+
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+        for labels, value in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.labels, labels)} {value}"
+
+
+class Gauge(Counter):
+
+    kind = "gauge"
+    live = True  # only the values of running workers are summed
+
+    def dec(self, *labels):
+        self.inc(*labels, amount=-1)
+
+
+class Histogram:
+    """Per-label bucket counts; observe() bumps one bucket, render() accumulates them."""
+
+    live = False
+
+    def __init__(self, name, help, labels, buckets=BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self.values = {}  # labels -> [per-bucket counts (last one is +Inf), sum]
+
+    def observe(self, value, *labels):
+
+        entry = self.values.get(labels)
+
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def state(self):
+        return [[list(labels), counts, total] for labels, (counts, total) in self.values.items()]
+
+    def merge(self, state):
+
+        for labels, counts, total in state:
+            entry = self.values.setdefault(tuple(labels), [[0] * (len(self.buckets) + 1), 0.0])
+            entry[0] = [mine + theirs for mine, theirs in zip(entry[0], counts)]
+            entry[1] += total
+
+    def render(self):
+
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(self.labels + ('le',), labels + (bound,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {cumulative}"
+
+
+def _running(pid: int) -> bool:
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    """Metrics of this process, rendered alone or summed with those of other workers.
+
+    With several worker processes each one write()s its values to a shared
+    directory (one file per pid) and render_directory() sums every file, so a
+    scrape served by any worker covers them all. Counters and histograms of
+    workers that exited are kept, so totals never go backwards when a worker
+    is recycled; gauges only count running workers.
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self, metrics=None) -> str:
+        """All metrics in the Prometheus text exposition format."""
+
+        return "\n".join(line for metric in metrics or self.metrics for line in metric.render()) + "\n"
+
+    def write(self, directory: str):
+        """Save this process's values to `directory` for render_directory()."""
+
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        partial = path + ".partial"
+
+        with open(partial, "w") as file:
+            json.dump({metric.name: metric.state() for metric in self.metrics}, file)
+        os.replace(partial, path)
+
+    def render_directory(self, directory: str) -> str:
+        """The metrics of every worker that wrote to `directory`, summed."""
+
+        merged = []
+        for metric in self.metrics:
+            metric = copy.copy(metric)
+            metric.values = {}
+            merged.append(metric)
+
+        for name in os.listdir(directory):
+            pid, extension = os.path.splitext(name)
+            if extension != ".json" or not pid.isdigit():
+                continue
+
+            try:
+                with open(os.path.join(directory, name)) as file:
+                    states = json.load(file)
+            except (OSError, ValueError):
+                continue  # removed or replaced while listing
+
+            running = _running(int(pid))
+            for metric in merged:
+                if metric.name in states and (running or not metric.live):
+                    metric.merge(states[metric.name])
+
+        return self.render(merged)
+
+
+def prepare_directory(directory: str):
+    """Create the multiprocess directory, dropping the files of a previous run."""
+
+    os.makedirs(directory, exist_ok=True)
+
+    for name in os.listdir(directory):
+        if name.endswith((".json", ".partial")):
+            os.remove(os.path.join(directory, name))
+
+
+async def flush_periodically(directory: str, interval: float = METRICS_FLUSH_SECONDS):
+    """Write this worker's metrics to `directory` every `interval` seconds, for scrapes served by other workers."""
+
+    while True:
+        registry.write(directory)
+        await asyncio.sleep(interval)
+
+
+registry = Registry()
+
+requests_total = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route template and status code", ("method", "route", "status")))
+requests_in_progress = registry.register(Gauge(
+    "http_requests_in_progress", "HTTP requests being served", ("method",)))
+request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template and status code", ("method", "route", "status")))
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording count, in-flight and latency of every HTTP request.
+
+    Requests are labeled with the route template (`/funds/subscribe/{fund_id}`),
+    read from the scope after routing, so label sets stay bounded; paths that
+    match no route are grouped as "unmatched". Latency runs until the last body
+    chunk is sent, so streamed exports count in full.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        requests_in_progress.inc(method)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            labels = (method, getattr(route, "path", "unmatched"), str(status_code))
+
+            requests_in_progress.dec(method)
+            requests_total.inc(*labels)
+            request_duration.observe(time.perf_counter() - started, *labels)
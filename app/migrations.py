@@ -0,0 +1,44 @@
+import asyncio
+from app.config import logging
+from app.logs import setup_logging
+from app.storage import storage
+from app.portfolios import rebuild_portfolios
+
+logger = logging.getLogger(__name__)
+
+
+async def split_transactions_by_month():
+    """Move a single-collection Transaction ledger into month buckets."""
+
+    moved = await storage.transactions.migrate_flat()
+    logger.info("Moved %s transactions into month buckets", moved)
+
+    return moved
+
+
+async def backfill_transaction_details():
+    """Copy customer and fund names into Transaction documents that lack them."""
+
+    updated = await storage.transactions.backfill_details()
+    logger.info("Backfilled details for %s transactions", updated)
+
+    return updated
+
+
+async def main():
+
+    await storage.connect()
+
+    try:
+        await split_transactions_by_month()
+        await backfill_transaction_details()
+        # customers with history from before portfolios existed
+        await rebuild_portfolios()
+    finally:
+        await storage.close()
+
+
+if __name__ == "__main__":
+
+    setup_logging()
+    asyncio.run(main())
@@ -1,6 +1,6 @@
 from datetime import datetime
 from pydantic import BaseModel, BeforeValidator, ConfigDict, EmailStr, Field
-from typing import Annotated, Any, Optional, List
+from typing import Annotated, Any, Literal, Optional, List
 from pydantic_core import core_schema
 
 PyObjectId = Annotated[str, BeforeValidator(str)]
@@ -73,6 +73,10 @@ class Transaction(BaseModel):
     type: str  # Open for Subscription/Close for Cancellation
     amount: float
     timestamp: datetime
+    # Denormalized for the transaction report
+    customerName: Optional[str] = None
+    fundName: Optional[str] = None
+    fundCategory: Optional[str] = None
 
 class TransactionDetails(BaseModel):
 
@@ -89,4 +93,43 @@ class FundResponse(BaseModel):
     
     message: str
     fund_id: str
-    current_balance: float
\ No newline at end of file
+    current_balance: float
+
+class BatchOperation(BaseModel):
+
+    action: Literal["subscribe", "cancel"]
+    fund_id: str
+
+class BatchRequest(BaseModel):
+
+    operations: List[BatchOperation] = Field(min_length=1, max_length=100)
+
+class BatchOperationResult(BaseModel):
+
+    action: str
+    fund_id: str
+    status_code: int
+    detail: str
+
+class BatchResponse(BaseModel):
+
+    results: List[BatchOperationResult]
+    current_balance: float
+
+
+class PortfolioPosition(BaseModel):
+
+    fund_id: str
+    name: Optional[str] = None
+    category: Optional[str] = None
+    amount: float
+    since: datetime
+
+class PortfolioSummary(BaseModel):
+
+    customer_id: str
+    funds: List[PortfolioPosition] = []
+    invested: float = 0.0
+    opens: int = 0
+    closes: int = 0
+    updated_at: Optional[datetime] = None
@@ -0,0 +1,257 @@
+import asyncio
+import datetime
+import random
+import time
+from bson import ObjectId
+from app.config import logging, NOTIFICATION_WORKERS, NOTIFICATION_BATCH_SIZE, NOTIFICATION_MAX_ATTEMPTS, \
+    NOTIFICATION_BACKOFF_SECONDS, NOTIFICATION_POLL_SECONDS, NOTIFICATION_SENDER
+from app.storage import storage
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 60
+
+
+class Sender:
+    """Delivers a batch of notifications for one channel; raising fails the whole batch."""
+
+    async def send(self, channel: str, notifications: list[dict]):
+        raise NotImplementedError
+
+
+class FakeSender(Sender):
+    """Local sender that logs notifications and keeps them in memory."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, channel: str, notifications: list[dict]):
+
+        for notification in notifications:
+            logger.info("[%s] to %s: %s", channel, notification['recipient'], notification['message'])
+        self.sent.extend(notifications)
+
+
+SENDERS = {
+    "fake": FakeSender,
+}
+
+
+def _now():
+    return datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+
+
+def build_notification(user: User, event: str, message: str) -> dict:
+    """Outbox document for one notification to `user` on its preferred channel."""
+
+    now = _now()
+
+    return {
+        "_id": ObjectId(),
+        "user_id": user.id,
+        "recipient": user.email,
+        "channel": user.notification_channel,
+        "event": event,
+        "message": message,
+        "status": "pending",
+        "attempts": 0,
+        "created_at": now,
+        "next_attempt_at": now,
+    }
+
+
+class NotificationDispatcher:
+    """Sends outbox notifications from a pool of async workers.
+
+    enqueue() stores the notification in the outbox before handing
+    it to the in-process queue, so a restart only delays it: the poller picks
+    up pending notifications (and expired leases of crashed workers) from the
+    outbox. Workers group what they take from the queue by channel, claim the
+    batch with a lease so each notification is sent by one worker, and retry
+    failures with exponential backoff until `max_attempts`.
+    """
+
+    def __init__(self, senders: dict, workers: int, batch_size: int, max_attempts: int,
+                 backoff_seconds: float, poll_seconds: float):
+
+        self.senders = senders
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.poll_seconds = poll_seconds
+        self.queue = asyncio.Queue()
+        self._tasks = []
+
+        self.started_at = None
+        self.enqueued = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+
+    async def enqueue(self, notifications: list[dict]):
+        """Persist notifications to the outbox and queue them for sending."""
+
+        if not notifications:
+            return
+
+        try:
+            await storage.outbox.insert_many(notifications)
+        except Exception as e:
+            # the fund operation already happened; report it rather than fail the request
+            logger.error("Could not store %s notifications: %s", len(notifications), e)
+            return
+
+        for notification in notifications:
+            self.queue.put_nowait(notification)
+        self.enqueued += len(notifications)
+
+    def start(self):
+
+        self.started_at = time.monotonic()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._poll()))
+        logger.info("Notification dispatcher started with %s workers", self.workers)
+
+    async def stop(self):
+        """Stop the workers; unsent notifications stay pending in the outbox."""
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _poll(self):
+        """Queue outbox notifications that are due: retries, and leftovers of a restart."""
+
+        while True:
+            try:
+                if self.queue.qsize() < self.batch_size:
+                    await self._queue_due()
+            except Exception as e:
+                logger.error("Notification poll failed: %s", e)
+
+            await asyncio.sleep(self.poll_seconds)
+
+    async def _queue_due(self):
+
+        due = await storage.outbox.due(_now(), self.batch_size * self.workers)
+
+        for notification in due:
+            self.queue.put_nowait(notification)
+
+    async def _take_batch(self):
+
+        batch = [await self.queue.get()]
+
+        while len(batch) < self.batch_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+
+        return batch
+
+    async def _worker(self):
+
+        while True:
+            batch = await self._take_batch()
+
+            by_channel = {}
+            for notification in batch:
+                by_channel.setdefault(notification["channel"], []).append(notification)
+
+            for channel, notifications in by_channel.items():
+                try:
+                    await self._deliver(channel, notifications)
+                except Exception as e:
+                    logger.error("Notification delivery on %s failed: %s", channel, e)
+
+    async def _claim(self, notifications):
+        """Lease the notifications to this worker; returns the ones it won."""
+
+        now = _now()
+
+        return await storage.outbox.claim(
+            [notification["_id"] for notification in notifications],
+            now,
+            now + datetime.timedelta(seconds=LEASE_SECONDS),
+            ObjectId()
+        )
+
+    async def _deliver(self, channel, notifications):
+
+        claimed = await self._claim(notifications)
+        if not claimed:
+            return
+
+        ids = [notification["_id"] for notification in claimed]
+        sender = self.senders.get(channel)
+
+        try:
+            if sender is None:
+                raise ValueError(f"No sender for channel {channel}")
+            await sender.send(channel, claimed)
+        except Exception as e:
+            await self._retry(claimed, str(e))
+            return
+
+        now = _now()
+        await storage.outbox.mark_sent(ids, now)
+
+        for notification in claimed:
+            lag = (now - notification["created_at"]).total_seconds()
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+        self.sent += len(claimed)
+
+    async def _retry(self, notifications, error: str):
+
+        for notification in notifications:
+            attempts = notification["attempts"] + 1
+            next_attempt_at = None
+
+            if attempts >= self.max_attempts:
+                self.failed += 1
+            else:
+                delay = self.backoff_seconds * 2 ** (attempts - 1) * random.uniform(0.5, 1.5)
+                next_attempt_at = _now() + datetime.timedelta(seconds=delay)
+                self.retried += 1
+
+            await storage.outbox.mark_retry(notification["_id"], attempts, error, next_attempt_at)
+
+        logger.warning("Sending %s notifications failed: %s", len(notifications), error)
+
+    def stats(self):
+        """Queue lag and throughput since the dispatcher started."""
+
+        uptime = time.monotonic() - self.started_at if self.started_at else 0.0
+
+        return {
+            "workers": len(self._tasks) - 1 if self._tasks else 0,
+            "queue_size": self.queue.qsize(),
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "avg_lag_ms": (self.total_lag / self.sent * 1000) if self.sent else 0.0,
+            "max_lag_ms": self.max_lag * 1000,
+            "throughput_per_second": self.sent / uptime if uptime else 0.0,
+        }
+
+
+def create_senders(kind: str) -> dict:
+    """One sender instance per channel name in NotificationChannels."""
+
+    sender = SENDERS[kind]()
+    return {"Email": sender, "SMS": sender}
+
+
+dispatcher = NotificationDispatcher(
+    create_senders(NOTIFICATION_SENDER),
+    workers=NOTIFICATION_WORKERS,
+    batch_size=NOTIFICATION_BATCH_SIZE,
+    max_attempts=NOTIFICATION_MAX_ATTEMPTS,
+    backoff_seconds=NOTIFICATION_BACKOFF_SECONDS,
+    poll_seconds=NOTIFICATION_POLL_SECONDS,
+)
@@ -0,0 +1,59 @@
+import base64
+import datetime
+import json
+from bson import ObjectId
+from fastapi import HTTPException, status
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values) -> str:
+    """Opaque, URL-safe cursor for the sort key of the last row of a page."""
+
+    encoded = [{"$date": value.isoformat()} if isinstance(value, datetime.datetime)
+               else {"$oid": str(value)} if isinstance(value, ObjectId)
+               else value for value in values]
+
+    return base64.urlsafe_b64encode(json.dumps(encoded, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, shape: tuple) -> list:
+    """Inverse of encode_cursor for a sort key whose values are instances of `shape`.
+
+    `shape` holds one type (or tuple of types) per value. A tampered cursor,
+    or one issued for another endpoint or sort, is a 400.
+    """
+
+    invalid = HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+
+        values = [datetime.datetime.fromisoformat(value["$date"]) if isinstance(value, dict) and "$date" in value
+                  else ObjectId(value["$oid"]) if isinstance(value, dict) and "$oid" in value
+                  else value for value in values]
+
+    except (ValueError, TypeError, KeyError):
+        raise invalid
+
+    # bool is an int, but never a sort value
+    if len(values) != len(shape) or any(isinstance(value, bool) or not isinstance(value, types)
+                                        for value, types in zip(values, shape)):
+        raise invalid
+
+    return values
+
+
+def after(field: str, value, last_id: ObjectId, descending: bool = False) -> dict:
+    """$match clause for rows that sort after (value, last_id) on (field, _id)."""
+
+    op = "$lt" if descending else "$gt"
+
+    return {
+        field: {op + "e": value},
+        "$or": [
+            {field: {op: value}},
+            {field: value, "_id": {op: last_id}},
+        ]
+    }
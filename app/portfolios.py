@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import json
+from app.config import logging
+from app.logs import setup_logging
+from app.storage import storage
+from app.storage.base import replay_portfolio
+
+logger = logging.getLogger(__name__)
+
+
+def _same(stored, rebuilt):
+    """Portfolios are equal up to float rounding in `invested` and `amount`."""
+
+    if stored is None:
+        return False
+
+    return (
+        abs(stored.get("invested", 0.0) - rebuilt["invested"]) < 1e-6
+        and stored.get("opens", 0) == rebuilt["opens"]
+        and stored.get("closes", 0) == rebuilt["closes"]
+        and stored.get("funds", {}).keys() == rebuilt["funds"].keys()
+        and all(abs(stored["funds"][fund_id]["amount"] - position["amount"]) < 1e-6
+                for fund_id, position in rebuilt["funds"].items())
+    )
+
+
+async def _customers():
+    """(customer_id, ledger entries oldest first) for every customer with transactions."""
+
+    customer_id, entries = None, []
+
+    async for transaction in storage.transactions.stream():
+        if transaction["customer_id"] != customer_id:
+            if entries:
+                yield customer_id, entries
+            customer_id, entries = transaction["customer_id"], []
+        entries.append(transaction)
+
+    if entries:
+        yield customer_id, entries
+
+
+async def rebuild_portfolios(check_only: bool = False) -> dict:
+    """Recompute every portfolio from the Transaction ledger and compare it with the stored one.
+
+    Mismatches are rewritten unless `check_only`. A customer whose ledger
+    moved on while it was read is re-read once; if their portfolio still
+    changes before the write, it is reported as `changed` and left alone.
+    """
+
+    report = {"customers": 0, "consistent": 0, "mismatched": [], "rebuilt": 0, "changed": []}
+
+    async for customer_id, entries in _customers():
+
+        report["customers"] += 1
+        rebuilt = replay_portfolio(customer_id, entries)
+        stored = await storage.portfolios.get(customer_id)
+
+        if not _same(stored, rebuilt):
+            # a subscribe may have landed after the stream passed this customer
+            rebuilt = replay_portfolio(customer_id, [entry async for entry in storage.transactions.stream(customer_id)])
+
+        if _same(stored, rebuilt):
+            report["consistent"] += 1
+            continue
+
+        report["mismatched"].append(customer_id)
+        logger.warning("Portfolio of %s does not match its ledger", customer_id)
+
+        if check_only:
+            continue
+
+        if await storage.portfolios.replace(rebuilt, stored):
+            report["rebuilt"] += 1
+        else:
+            report["changed"].append(customer_id)
+
+    logger.info("Portfolios checked: %s customers, %s mismatched, %s rebuilt",
+                report["customers"], len(report["mismatched"]), report["rebuilt"])
+    return report
+
+
+async def main(check_only: bool):
+
+    await storage.connect()
+
+    try:
+        report = await rebuild_portfolios(check_only)
+    finally:
+        await storage.close()
+
+    print(json.dumps(report, indent=2))
+
+    if check_only and report["mismatched"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Rebuild the per-customer portfolio summaries from the transaction ledger")
+    parser.add_argument("--check", action="store_true", help="only report portfolios that do not match the ledger; exit 1 if any")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.check))
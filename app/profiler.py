@@ -0,0 +1,216 @@
+import asyncio
+import collections
+import contextvars
+import json
+import threading
+from pymongo import monitoring
+from app.config import logging, PROFILER_SLOW_MS, PROFILER_SLOW_LOG_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Commands that accept `explain`; the filter of each is used as its query shape
+EXPLAINABLE = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+# Session and cluster fields pymongo adds to a command that explain must not repeat
+SESSION_FIELDS = {"lsid", "$db", "$clusterTime", "txnNumber", "autocommit", "startTransaction",
+                  "$readPreference", "readConcern", "writeConcern", "cursor"}
+
+
+class RequestProfile:
+    """Database commands issued while serving one HTTP request."""
+
+    __slots__ = ("commands", "db_ms")
+
+    def __init__(self):
+        self.commands = 0
+        self.db_ms = 0.0
+
+
+# Set by ProfilerMiddleware; Motor copies the context into its executor threads,
+# so the listener callbacks see the profile of the request that issued the command.
+current_request = contextvars.ContextVar("current_request", default=None)
+
+
+def _shape(value):
+    """Replace the values of a filter with "?", keeping field names and operators."""
+
+    if isinstance(value, dict):
+        return {key: _shape(item) for key, item in value.items()}
+
+    if isinstance(value, list):
+        shapes = [_shape(item) for item in value]
+        return shapes if any(isinstance(shape, (dict, list)) for shape in shapes) else "?"
+
+    return "?"
+
+
+def query_shape(command_name, command):
+    """Value-free description of what a command filters on, used to group similar queries."""
+
+    if command_name == "aggregate":
+        stages = [next(iter(stage)) for stage in command.get("pipeline", [])]
+        match = next((stage["$match"] for stage in command.get("pipeline", []) if "$match" in stage), {})
+        return json.dumps({"pipeline": stages, "match": _shape(match)})
+
+    if command_name in ("update", "delete"):
+        statements = command.get("updates" if command_name == "update" else "deletes") or [{}]
+        return json.dumps(_shape(statements[0].get("q", {})))
+
+    if command_name in ("find", "count", "distinct", "findAndModify"):
+        return json.dumps(_shape(command.get("filter", command.get("query", {}))))
+
+    return ""
+
+
+class QueryProfiler(monitoring.CommandListener):
+    """pymongo command listener timing every command by collection and query shape.
+
+    Each command is also charged to the HTTP request that issued it (see
+    ProfilerMiddleware). Commands slower than `slow_ms` are logged by shape,
+    never with their values, and explained in the background; the last
+    `slow_log_size` of them are kept with their winning plan.
+    """
+
+    def __init__(self, slow_ms=PROFILER_SLOW_MS, slow_log_size=PROFILER_SLOW_LOG_SIZE):
+
+        self.slow_ms = slow_ms
+        self.client = None
+        self.loop = None
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.commands = {}  # (collection, command, shape) -> [count, total_ms, max_ms]
+        self.routes = {}  # (method, route) -> [requests, commands, db_ms, max_db_ms]
+        self.slow = collections.deque(maxlen=slow_log_size)
+
+    def start(self, client):
+        """Explain slow queries with `client` on the running event loop."""
+
+        self.client = client
+        self.loop = asyncio.get_running_loop()
+
+    def started(self, event):
+
+        command_name = event.command_name
+        if command_name == "explain":
+            return
+
+        collection = event.command.get(command_name)
+        self.pending[(event.connection_id, event.request_id)] = (
+            event.command, collection if isinstance(collection, str) else None, current_request.get()
+        )
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+
+        pending = self.pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+
+        command, collection, profile = pending
+        command_name = event.command_name
+        duration_ms = event.duration_micros / 1000
+        shape = query_shape(command_name, command)
+
+        with self.lock:
+            entry = self.commands.setdefault((collection or event.database_name, command_name, shape), [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += duration_ms
+            entry[2] = max(entry[2], duration_ms)
+
+            if profile is not None:
+                profile.commands += 1
+                profile.db_ms += duration_ms
+
+        if duration_ms >= self.slow_ms:
+            self._slow_query(event.database_name, collection, command_name, command, shape, duration_ms)
+
+    def _slow_query(self, database, collection, command_name, command, shape, duration_ms):
+
+        logger.warning("Slow %s on %s took %.1fms, shape %s", command_name, collection, duration_ms, shape)
+
+        entry = {"collection": collection, "command": command_name, "shape": shape, "duration_ms": round(duration_ms, 3), "plan": None}
+
+        # stats() and reset() iterate and clear the deque from the event loop thread
+        with self.lock:
+            self.slow.append(entry)
+
+        if command_name in EXPLAINABLE and self.client is not None and self.loop is not None:
+            explain = {key: value for key, value in command.items() if key not in SESSION_FIELDS}
+            asyncio.run_coroutine_threadsafe(self._explain(database, explain, entry), self.loop)
+
+    async def _explain(self, database, command, entry):
+
+        try:
+            result = await self.client[database].command({"explain": command, "verbosity": "queryPlanner"})
+            planner = result.get("queryPlanner") or result.get("stages", [{}])[0].get("$cursor", {}).get("queryPlanner", {})
+            entry["plan"] = planner.get("winningPlan", result)
+        except Exception as e:
+            logger.error("Could not explain slow %s on %s: %s", entry["command"], entry["collection"], e)
+
+    def record_request(self, method, route, profile):
+
+        with self.lock:
+            entry = self.routes.setdefault((method, route), [0, 0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += profile.commands
+            entry[2] += profile.db_ms
+            entry[3] = max(entry[3], profile.db_ms)
+
+    def stats(self, limit=50):
+        """Costliest query shapes, database time per route and the recent slow queries."""
+
+        with self.lock:
+            commands = sorted(self.commands.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+            routes = sorted(self.routes.items(), key=lambda item: item[1][2], reverse=True)
+
+            return {
+                "slow_ms": self.slow_ms,
+                "commands": [
+                    {"collection": collection, "command": command, "shape": shape, "count": count,
+                     "total_ms": round(total, 3), "mean_ms": round(total / count, 3), "max_ms": round(longest, 3)}
+                    for (collection, command, shape), (count, total, longest) in commands
+                ],
+                "routes": [
+                    {"method": method, "route": route, "requests": requests, "commands_per_request": round(count / requests, 2),
+                     "db_ms_per_request": round(db_ms / requests, 3), "max_db_ms": round(longest, 3)}
+                    for (method, route), (requests, count, db_ms, longest) in routes
+                ],
+                "slow": list(self.slow),
+            }
+
+    def reset(self):
+
+        with self.lock:
+            self.commands.clear()
+            self.routes.clear()
+            self.slow.clear()
+
+
+class ProfilerMiddleware:
+    """ASGI middleware giving each HTTP request a RequestProfile and recording it by route template."""
+
+    def __init__(self, app, profiler=None):
+        self.app = app
+        self.profiler = profiler or query_profiler
+
+    async def __call__(self, scope, receive, send):
+
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile()
+        token = current_request.set(profile)
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_request.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.profiler.record_request(scope["method"], route, profile)
+
+
+query_profiler = QueryProfiler()
@@ -0,0 +1,60 @@
+import os
+from fastapi import APIRouter, Depends, status
+from app.config import logging
+from app.models import User
+from app.auth import get_current_admin, principal_cache, user_lookups
+from app.catalog import fund_catalog
+from app.hashing import hashing_pool
+from app.notifications import dispatcher
+from app.profiler import query_profiler
+
+router = APIRouter(prefix="/admin")
+logger = logging.getLogger(__name__)
+
+
+def per_worker(stats: dict) -> dict:
+    """Stats of this worker process, labeled with its pid; other workers keep their own."""
+
+    return {"worker": os.getpid(), **stats}
+
+
+@router.get('/hashing', status_code=status.HTTP_200_OK, summary="Password hashing executor queue depth and wait times")
+async def hashing_stats(user: User = Depends(get_current_admin)):
+    """Returns the state of the bcrypt executor (Admin only)"""
+
+    return per_worker(hashing_pool.stats())
+
+
+@router.get('/cache', status_code=status.HTTP_200_OK, summary="Authenticated-principal cache hit/miss counters")
+async def cache_stats(user: User = Depends(get_current_admin)):
+    """Returns the state of the get_current_user cache (Admin only)"""
+
+    return per_worker(principal_cache.stats())
+
+
+@router.get('/singleflight', status_code=status.HTTP_200_OK, summary="Reads coalesced with an identical read already in flight")
+async def singleflight_stats(user: User = Depends(get_current_admin)):
+    """Returns the coalescing ratio of the user and fund catalog lookups (Admin only)"""
+
+    return per_worker({"users": user_lookups.stats(), "catalog": fund_catalog.refreshes.stats()})
+
+
+@router.get('/notifications', status_code=status.HTTP_200_OK, summary="Notification queue lag and throughput")
+async def notification_stats(user: User = Depends(get_current_admin)):
+    """Returns the state of the notification dispatcher (Admin only)"""
+
+    return per_worker(dispatcher.stats())
+
+
+@router.get('/queries', status_code=status.HTTP_200_OK, summary="Database time by query shape and by route, and the recent slow queries")
+async def query_stats(user: User = Depends(get_current_admin)):
+    """Returns the state of the database command profiler (Admin only)"""
+
+    return per_worker(query_profiler.stats())
+
+
+@router.delete('/queries', status_code=status.HTTP_204_NO_CONTENT, summary="Clear the database command profiler")
+async def reset_query_stats(user: User = Depends(get_current_admin)):
+    """Starts a new profiling window (Admin only)"""
+
+    query_profiler.reset()
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from app.config import logging
+from app.logs import SAMPLED
 from app.models import UserCreate
-from app.database import db
-from app.auth import authenticate_user, create_access_token, get_password_hash
+from app.storage import storage, DuplicateError
+from app.auth import authenticate_user, create_access_token, invalidate_user
+from app.hashing import hashing_pool
 
 router = APIRouter(prefix="/auth")
 logger = logging.getLogger(__name__)
@@ -12,15 +14,15 @@ logger = logging.getLogger(__name__)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     """Endpoint for User Login. Should provide email and password"""
 
-    logger.info(f"Login attempt for user: {form_data.username}")
+    logger.info("Login attempt for user: %s", form_data.username, extra=SAMPLED)
     user = await authenticate_user(form_data.username, form_data.password)
     
     if not user:
-        logger.error(f"Login failed for user: {form_data.username}")
+        logger.error("Login failed for user: %s", form_data.username)
         raise HTTPException(status_code=400, detail="Incorrect username or password")
 
     access_token = create_access_token(data={"sub": user.email})
-    logger.info(f"Login successful for user: {form_data.username}")
+    logger.info("Login successful for user: %s", form_data.username, extra=SAMPLED)
     
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -28,23 +30,29 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
 async def register_user(user: UserCreate):
     """Creates a new User (Customer or Admin)"""
     
-    logger.info(f"Registering user: {user.email}")
+    logger.info("Registering user: %s", user.email)
     
-    if await db['User'].find_one({"email": user.email}):
-        logger.error(f"Registration failed: email already exists {user.email}")
+    if await storage.users.find_by_email(user.email):
+        logger.error("Registration failed: email already exists %s", user.email)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already exists")
 
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hashing_pool.hash(user.password)
     
     user_dict = user.model_dump()
     user_dict.pop("password")
     user_dict["hashed_password"] = hashed_password
     
     if(["Admin"] == user.roles):
-        logger.info(f"Registering user with admin role: {user.email}")
+        logger.info("Registering user with admin role: %s", user.email)
         user_dict["balance"] = 0
 
-    await db['User'].insert_one(user_dict)
+    try:
+        await storage.users.insert(user_dict)
+    except DuplicateError:
+        logger.error("Registration failed: email already exists %s", user.email)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already exists")
+
+    invalidate_user(user.email)
     
-    logger.info(f"User registered successfully: {user.email}")
+    logger.info("User registered successfully: %s", user.email)
     return {"message": "User registered successfully"}
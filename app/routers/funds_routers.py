@@ -1,16 +1,31 @@
+import asyncio
+import datetime
 from bson import ObjectId
-from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, Response, UploadFile, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from app.config import logging
-from app.models import FundResponse, TransactionDetails, User, InvestmentFund, InvestmentFundCreate, Transaction, NotificationChannels
-from app.database import db
-from app.auth import *
-from typing import List
+from app.logs import SAMPLED
+from app.models import BatchRequest, BatchResponse, FundResponse, PortfolioPosition, PortfolioSummary, TransactionDetails, User, InvestmentFund, InvestmentFundCreate, Transaction, NotificationChannels
+from app.storage import storage
+from app import subscriptions
+from app.catalog import fund_catalog
+from app.notifications import dispatcher, build_notification
+from app.fund_import import FORMATS, READERS, decode, detect_format, import_funds
+from app.export import EXPORT_BATCH_SIZE, MEDIA_TYPES, WRITERS
+from app.pagination import NEXT_CURSOR_HEADER, encode_cursor, decode_cursor
+from app.serialization import FastJSONResponse
+from app.auth import get_current_admin, get_current_user, is_admin
+from typing import List, Literal, Optional
 
 router = APIRouter(prefix="/funds")
 logger = logging.getLogger(__name__)
 
+TOTAL_COUNT_HEADER = "X-Total-Count"
+FUND_FIELDS = {"id": "_id", "name": "name", "minimumFee": "minimumFee", "category": "category"}
+# Types of the sort value in a /funds/list cursor, per sort field
+FUND_SORT_TYPES = {"name": str, "minimumFee": (int, float)}
+
 @router.post(
         '/subscribe/{fund_id}', 
         status_code=status.HTTP_201_CREATED,
@@ -19,50 +34,11 @@ logger = logging.getLogger(__name__)
     )
 async def subscribe_fund(fund_id: str, user: User = Depends(get_current_user)):
 
-    logger.info(f"User {user.email} is trying to subscribe to fund {fund_id}")
-    fund = await db['InvestmentFund'].find_one({"_id": ObjectId(fund_id)})
-    logger.info(f"Fund found: {fund}")
-
-    if not fund:
-        logger.warning(f"Fund {fund_id} not found")
-        raise HTTPException(status_code=404, detail="Fund not found")
-    
-    if user.balance < fund['minimumFee']:
-        logger.warning(f"User {user.email} has insufficient funds to subscribe to {fund['name']}")
-        raise HTTPException(status_code=400, detail=f"Not enough money to subscribe to the investment fund {fund['name']}")
-
-    existingSubscription = await db['UserInvestmentFund'].find_one({
-        "user_id": user.id,
-        "fund_id": fund_id
-    })
-
-    if existingSubscription:
-        logger.warning(f"User {user.email} is already subscribed to fund {fund['name']}")
-        raise HTTPException(status_code=400, detail="Already subscribed to this fund")
-
-    await db['UserInvestmentFund'].insert_one({
-        "user_id": user.id,
-        "fund_id": fund_id,
-        "subscription_date": datetime.datetime.now()
-    })
-
-    await db['Transaction'].insert_one({
-        "customer_id": user.id,
-        "fund_id": fund_id,
-        "type": "Open",
-        "amount": fund['minimumFee'],
-        "timestamp": datetime.datetime.now()
-    })
-
-    await db['User'].update_one({"_id": ObjectId(user.id)}, {"$inc": {"balance": -fund['minimumFee']}})
-
-    updateduser = await db['User'].find_one({"_id": ObjectId(user.id)})
-    logger.info(updateduser)
-    
-    # Notification logic placeholder
+    logger.info("User %s is trying to subscribe to fund %s", user.email, fund_id, extra=SAMPLED)
+    response = await subscriptions.subscribe(user, fund_id)
+    await dispatcher.enqueue([build_notification(user, "subscribed", response.message)])
 
-    # return {"message": f"Subscribed to {fund['name']}.", "fund_id": fund_id, "current_balance": updateduser.balance}
-    return FundResponse(message=f"Subscribed to {fund['name']}.", fund_id=fund_id, current_balance=updateduser["balance"])
+    return response
 
 @router.post(
         '/cancel/{fund_id}',
@@ -72,116 +48,99 @@ async def subscribe_fund(fund_id: str, user: User = Depends(get_current_user)):
     )
 async def cancel_fund(fund_id: str, user: User = Depends(get_current_user)):
 
-    fund = await db['InvestmentFund'].find_one({"_id": ObjectId(fund_id)})
-
-    if not fund:
-        raise HTTPException(status_code=404, detail="Fund not found")
-
-    existingSubscription = await db['UserInvestmentFund'].find_one({
-        "user_id": user.id,
-        "fund_id": fund_id
-    })
-
-    if not existingSubscription:
-        raise HTTPException(status_code=404, detail="Subscription not found")
-
-    await db['UserInvestmentFund'].delete_one({
-        "user_id": user.id,
-        "fund_id": fund_id
-    })
-
-    await db['Transaction'].insert_one({
-        "customer_id": user.id,
-        "fund_id": fund_id,
-        "type": "Close",
-        "amount": -fund['minimumFee'],
-        "timestamp": datetime.datetime.now()
-    })
-
-    await db['User'].update_one({"_id": ObjectId(user.id)}, {"$inc": {"balance": fund['minimumFee']}})
-
-    updateduser = await db['User'].find_one({"_id": ObjectId(user.id)})
-
-    return FundResponse(message=f"Cancelled subscription to {fund['name']}.", fund_id=fund_id, current_balance=updateduser["balance"])
-
-# Admin-only endpoints
-def is_admin(user: User):
-    return "Admin" in user.roles
-
-@router.get('/transactions')
-async def get_transactions(user: User = Depends(get_current_user)) -> List[TransactionDetails]:
-
-    pipeline = [
-        {
-            "$match": {
-                "customer_id": user.id
-            }
-        },
-        {
-            "$lookup": {
-                "from": "User",
-                "let": {
-                    "customerIdString": "$customer_id"
-                },
-                "pipeline": [
-                    {
-                        "$match": {
-                            "$expr": {
-                                "$eq": ["$_id", {"$toObjectId": "$$customerIdString"}]
-                            }
-                        }
-                    }
-                ],
-                "as": "userDetails"
-            }
-        },
-
-        {
-            "$lookup": {
-                "from": "InvestmentFund",
-                "let": {
-                    "fundIdString": "$fund_id"
-                },
-                "pipeline": [
-                    {
-                        "$match": {
-                            "$expr": {
-                                "$eq": ["$_id", {"$toObjectId": "$$fundIdString"}]
-                            }
-                        }
-                    }
-                ],
-                "as": "fundDetails"
-            }
-        },
-
-        {
-            "$unwind": "$userDetails"
-        },
-        {
-            "$unwind": "$fundDetails"
-        },
-        {
-            "$project": {
-                "_id": 1,
-                "customerId": { "$toString": "$userDetails._id" },
-                "customerName": "$userDetails.name",
-                "amount": 1,
-                "type": 1,
-                "fundName": "$fundDetails.name",
-                "fundCategory": "$fundDetails.category",
-                "timestamp": 1
-            }
-        }
-    ]
+    response = await subscriptions.cancel(user, fund_id)
+    await dispatcher.enqueue([build_notification(user, "cancelled", response.message)])
+
+    return response
+
+@router.post(
+        '/batch',
+        status_code=status.HTTP_200_OK,
+        summary="Subscribe to and cancel several funds in one request. Each operation gets its own result",
+        response_model=BatchResponse
+    )
+async def batch_funds(batch: BatchRequest, user: User = Depends(get_current_user)):
+
+    logger.info("User %s is applying a batch of %s operations", user.email, len(batch.operations))
+    response = await subscriptions.apply_batch(user, batch.operations)
+    await dispatcher.enqueue([
+        build_notification(user, "subscribed" if result.action == "subscribe" else "cancelled", result.detail)
+        for result in response.results if result.status_code in (status.HTTP_200_OK, status.HTTP_201_CREATED)
+    ])
+
+    return response
+
+@router.get('/portfolio', response_model=PortfolioSummary, summary="Funds the current user is subscribed to, the amount invested and open/close counts")
+async def get_portfolio(user: User = Depends(get_current_user)):
+
+    portfolio = await storage.portfolios.get(user.id)
+
+    if portfolio is None:
+        return PortfolioSummary(customer_id=user.id)
+
+    return PortfolioSummary(
+        customer_id=user.id,
+        funds=[PortfolioPosition(fund_id=fund_id, **position) for fund_id, position in portfolio.get("funds", {}).items()],
+        invested=portfolio.get("invested", 0.0),
+        opens=portfolio.get("opens", 0),
+        closes=portfolio.get("closes", 0),
+        updated_at=portfolio.get("updated_at")
+    )
+
+
+@router.get(
+        '/transactions',
+        response_model=List[TransactionDetails],
+        summary="Transactions of the current user, oldest first. Follow the X-Next-Cursor header for the next page"
+    )
+async def get_transactions(
+        user: User = Depends(get_current_user),
+        limit: int = Query(100, ge=1, le=1000),
+        next: Optional[str] = Query(None, description="Cursor returned in X-Next-Cursor by the previous page"),
+        from_date: Optional[datetime.datetime] = Query(None, alias="from"),
+        to_date: Optional[datetime.datetime] = Query(None, alias="to"),
+        transaction_type: Optional[Literal["Open", "Close"]] = Query(None, alias="type")
+    ):
+
+    after = decode_cursor(next, (datetime.datetime, ObjectId)) if next else None
 
     try:
-        transactions = await db['Transaction'].aggregate(pipeline).to_list()
-        return transactions
+        transactions = await storage.transactions.page(user.id, limit + 1, from_date, to_date, transaction_type, after)
     except Exception as e:
-        print(f"Error fetching transactions: {e}")
+        logger.exception("Error fetching transactions: %s", e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
+    headers = {}
+
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        last = transactions[-1]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(last["timestamp"], last["_id"])
+
+    # rows come from the storage projection with the TransactionDetails fields
+    return FastJSONResponse(transactions, headers=headers)
+
+
+@router.get('/transactions/export', summary="Stream the full transaction history as NDJSON or CSV. Admins may export any customer, or all of them")
+async def export_transactions(
+        user: User = Depends(get_current_user),
+        export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+        customer_id: Optional[str] = Query(None, description="Admins only; omit to export every customer")
+    ):
+
+    if not is_admin(user):
+        if customer_id not in (None, user.id):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
+        customer_id = user.id
+
+    logger.info("User %s exporting transactions of %s as %s", user.email, customer_id or 'all customers', export_format)
+
+    return StreamingResponse(
+        WRITERS[export_format](storage.transactions.stream(customer_id, EXPORT_BATCH_SIZE)),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="transactions.{export_format}"'}
+    )
+
 
 @router.post('/create', status_code=status.HTTP_201_CREATED)
 async def create_fund(fund:InvestmentFundCreate, user: User = Depends(get_current_user)):
@@ -190,13 +149,89 @@ async def create_fund(fund:InvestmentFundCreate, user: User = Depends(get_curren
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
 
     fund_dict = fund.model_dump()
-    response = await db.InvestmentFund.insert_one(fund_dict)
-    print(response.inserted_id)
-    return {"message": "Fund created successfully", "id": str(response.inserted_id)}
+    fund_id = await storage.funds.insert(fund_dict)
+    await fund_catalog.invalidate()
+    logger.info("Fund %s created by %s", fund_id, user.email)
+    return {"message": "Fund created successfully", "id": fund_id}
+
+
+@router.post('/import', status_code=status.HTTP_200_OK, summary="Import funds from a JSON array, NDJSON or CSV file. Invalid rows are reported and skipped")
+async def import_funds_file(
+        file: UploadFile = File(...),
+        import_format: Optional[Literal[FORMATS]] = Query(None, alias="format", description="Defaults to the file extension"),
+        chunk_size: int = Query(500, ge=1, le=10000),
+        user: User = Depends(get_current_admin)
+    ):
+
+    import_format = import_format or detect_format(file.filename)
+
+    if import_format not in READERS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unsupported format, use one of {', '.join(FORMATS)}")
+
+    logger.info("User %s importing funds from %s as %s", user.email, file.filename, import_format)
+    return await import_funds(READERS[import_format](decode(file.read)), chunk_size)
+
+
+@router.get(
+        '/list',
+        response_model=List[InvestmentFund],
+        status_code=status.HTTP_200_OK,
+        summary="List investment funds. Without parameters returns the whole catalog; with any filter, sort, "
+                "limit or fields returns one page, X-Total-Count and X-Next-Cursor for the next page"
+    )
+async def list_funds(
+        request: Request,
+        user: User = Depends(get_current_user),
+        category: Optional[str] = Query(None),
+        min_fee: Optional[float] = Query(None, alias="minFee", ge=0),
+        max_fee: Optional[float] = Query(None, alias="maxFee", ge=0),
+        name_prefix: Optional[str] = Query(None, alias="name", min_length=1, description="Name starts with"),
+        sort: Literal["name", "-name", "minimumFee", "-minimumFee"] = Query("name"),
+        limit: Optional[int] = Query(None, ge=1, le=1000, description="Defaults to 100 when filtering"),
+        next: Optional[str] = Query(None, description="Cursor returned in X-Next-Cursor by the previous page"),
+        fields: Optional[str] = Query(None, description="Comma-separated subset of id,name,minimumFee,category")
+    ):
+
+    if "sort" in request.query_params or any(value is not None for value in (category, min_fee, max_fee, name_prefix, limit, next, fields)):
+        return await search_funds(category, min_fee, max_fee, name_prefix, sort, limit or 100, next, fields)
+
+    body, etag = await fund_catalog.serialized()
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if etag in request.headers.get("If-None-Match", "").split(", "):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return FastJSONResponse(body, headers=headers)
+
+
+async def search_funds(category, min_fee, max_fee, name_prefix, sort, limit, next, fields):
+    """One page of the funds matching the filters, served by the InvestmentFund indexes."""
+
+    if fields:
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in names if name not in FUND_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown fields: {', '.join(unknown)}")
+        fields = [FUND_FIELDS[name] for name in names]
+
+    sort_field, descending = sort.lstrip("-"), sort.startswith("-")
+    filters = {"category": category, "min_fee": min_fee, "max_fee": max_fee, "name_prefix": name_prefix}
+
+    funds, total = await asyncio.gather(
+        storage.funds.page(limit + 1, **filters, sort=sort_field, descending=descending,
+                           after=decode_cursor(next, (FUND_SORT_TYPES[sort_field], ObjectId)) if next else None,
+                           fields=fields),
+        storage.funds.count(**filters)
+    )
+
+    headers = {TOTAL_COUNT_HEADER: str(total)}
 
+    if len(funds) > limit:
+        funds = funds[:limit]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(funds[-1][sort_field], funds[-1]["_id"])
 
-@router.get('/list', response_model=List[InvestmentFund], status_code=status.HTTP_200_OK, summary="List all investment funds")
-async def list_funds(user: User = Depends(get_current_user)):
+    if fields and sort_field not in fields:
+        for fund in funds:
+            del fund[sort_field]
 
-    funds = await db.InvestmentFund.find().to_list()
-    return funds
\ No newline at end of file
+    return FastJSONResponse(funds, headers=headers)
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Response, status
+from app.config import logging
+from app.storage import storage
+
+router = APIRouter(prefix="/health")
+logger = logging.getLogger(__name__)
+
+@router.get('/live', status_code=status.HTTP_200_OK, summary="The process is up")
+async def live():
+
+    return {"status": "ok"}
+
+
+@router.get('/ready', status_code=status.HTTP_200_OK, summary="Whether this worker should take traffic. 503 when its database pool is saturated")
+async def ready(response: Response):
+    """Connection counts and checkout waits of the pool, for the load balancer"""
+
+    health = storage.health()
+
+    if not health["ready"]:
+        logger.warning("Not ready: %s", health.get("reason"))
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+
+    return health
@@ -0,0 +1,38 @@
+import orjson
+from bson import ObjectId
+from fastapi.responses import Response
+
+# Timezone-aware UTC datetimes end in "Z", as pydantic writes them
+OPTIONS = orjson.OPT_UTC_Z
+
+
+def _default(value):
+
+    if isinstance(value, ObjectId):
+        return str(value)
+
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(value) -> bytes:
+    """JSON bytes of documents read from storage.
+
+    orjson writes dicts, lists, strings, numbers and datetimes natively; only
+    ObjectIds go through `_default`. Use it for rows whose shape the storage
+    layer already guarantees (a fixed projection), not for client input.
+    """
+
+    return orjson.dumps(value, default=_default, option=OPTIONS)
+
+
+class FastJSONResponse(Response):
+    """JSON response for list endpoints that skips response-model validation.
+
+    Content is either bytes serialized ahead of time (see FundCatalog) or
+    storage documents passed through dumps().
+    """
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return content if isinstance(content, bytes) else dumps(content)
@@ -0,0 +1,82 @@
+import argparse
+import importlib.util
+import os
+import tempfile
+import uvicorn
+from app.config import logging, SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_MAX_REQUESTS, \
+    SERVER_MAX_REQUESTS_JITTER, SERVER_GRACEFUL_TIMEOUT, STORAGE_BACKEND, METRICS_ENABLED, METRICS_MULTIPROCESS_DIR
+from app.logs import setup_logging
+from app.metrics import prepare_directory
+
+logger = logging.getLogger(__name__)
+
+APP = "app.main:app"
+
+
+def server_options(host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS, max_requests=SERVER_MAX_REQUESTS,
+                   max_requests_jitter=SERVER_MAX_REQUESTS_JITTER, graceful_timeout=SERVER_GRACEFUL_TIMEOUT):
+    """Keyword arguments for uvicorn.run.
+
+    uvloop and httptools are used when installed (they come with fastapi[standard]).
+    Workers are separate processes started by uvicorn's supervisor, which replaces
+    any that exit, including those recycled after `max_requests`. Each worker
+    imports the app and runs its lifespan, so the Motor client, hashing executor,
+    catalog and notification dispatcher are created per worker, never shared
+    across a fork. log_config=None keeps uvicorn's own loggers on the JSON
+    handlers of app.logs.
+    """
+
+    return {
+        "host": host,
+        "port": port,
+        "workers": workers,
+        "loop": "uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        "http": "httptools" if importlib.util.find_spec("httptools") else "h11",
+        "limit_max_requests": max_requests or None,
+        "limit_max_requests_jitter": max_requests_jitter if max_requests else 0,
+        "timeout_graceful_shutdown": graceful_timeout,
+        "proxy_headers": True,
+        "log_config": None,
+    }
+
+
+def run(**overrides):
+
+    options = server_options(**overrides)
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+    # every worker sizes its bcrypt executor from HASH_MAX_WORKERS; split the
+    # CPUs between them instead of giving each worker all of them
+    os.environ.setdefault("HASH_MAX_WORKERS", str(max(1, cpus // options["workers"])))
+
+    if STORAGE_BACKEND == "memory" and options["workers"] > 1:
+        logger.warning("STORAGE_BACKEND=memory with %s workers: each worker has its own data", options["workers"])
+
+    if METRICS_ENABLED and options["workers"] > 1:
+        # workers are spawned and read their config from the environment
+        directory = METRICS_MULTIPROCESS_DIR or tempfile.mkdtemp(prefix="app-metrics-")
+        prepare_directory(directory)
+        os.environ["METRICS_MULTIPROCESS_DIR"] = directory
+        logger.info("Workers share /metrics through %s", directory)
+
+    if options["workers"] > 1:
+        logger.warning("The /admin statistics are per worker: each request reports the worker that served it")
+
+    logger.info("Starting %s workers on %s:%s (loop=%s, http=%s, max_requests=%s)", options["workers"], options["host"],
+                options["port"], options["loop"], options["http"], options["limit_max_requests"])
+
+    uvicorn.run(APP, **options)
+
+
+if __name__ == "__main__":
+
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Run the API with uvicorn workers")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    parser.add_argument("--max-requests", type=int, default=SERVER_MAX_REQUESTS,
+                        help="recycle a worker after this many requests, 0 to never")
+    args = parser.parse_args()
+
+    run(host=args.host, port=args.port, workers=args.workers, max_requests=args.max_requests)
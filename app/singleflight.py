@@ -0,0 +1,57 @@
+import asyncio
+from app.config import SINGLE_FLIGHT_ENABLED
+
+
+class SingleFlight:
+    """Coalesces concurrent identical reads into one.
+
+    The first caller for a key starts the call; callers arriving while it is
+    in flight await the same task and get its result or exception. Nothing
+    is cached: once the call finishes the next caller starts a new one. The
+    result is shared, so callers must not mutate it.
+    """
+
+    def __init__(self, enabled: bool = SINGLE_FLIGHT_ENABLED):
+
+        self.enabled = enabled
+        self._flights = {}  # key -> task of the call in flight
+
+        self.calls = 0
+        self.executions = 0
+
+    async def do(self, key, function, *args):
+        """Return `await function(*args)`, sharing the call with concurrent callers of `key`."""
+
+        self.calls += 1
+
+        if not self.enabled:
+            self.executions += 1
+            return await function(*args)
+
+        task = self._flights.get(key)
+
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(function(*args))
+            self._flights[key] = task
+            task.add_done_callback(lambda _: self._flights.pop(key, None))
+
+        # a cancelled caller must not cancel the call the others are waiting for
+        return await asyncio.shield(task)
+
+    def stats(self):
+        """Calls made, calls that ran, and the share that joined a call in flight."""
+
+        coalesced = self.calls - self.executions
+
+        return {
+            "enabled": self.enabled,
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": coalesced,
+            "coalescing_ratio": coalesced / self.calls if self.calls else 0.0,
+            "in_flight": len(self._flights),
+        }
+
+    def reset(self):
+        self.calls = self.executions = 0
@@ -0,0 +1,19 @@
+from app.config import STORAGE_BACKEND
+from app.storage.base import DuplicateError, Storage
+
+
+def create_storage(backend: str) -> Storage:
+    """Storage engine for a STORAGE_BACKEND value ("mongo" or "memory")."""
+
+    if backend == "mongo":
+        from app.storage.mongo import MongoStorage
+        return MongoStorage()
+
+    if backend == "memory":
+        from app.storage.memory import MemoryStorage
+        return MemoryStorage()
+
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+storage = create_storage(STORAGE_BACKEND)
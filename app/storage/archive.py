@@ -0,0 +1,111 @@
+import asyncio
+import gzip
+import itertools
+import os
+import re
+import bson
+from app.storage.base import naive_utc, report_row
+
+FILE_PATTERN = re.compile(r"^Transaction_(\d{4}_\d{2})\.bson\.gz$")
+
+# Documents read from or written to a file per executor call
+CHUNK = 1000
+
+
+class TransactionArchive:
+    """Months of the Transaction ledger compacted into gzip-compressed BSON files.
+
+    One file per month in `directory`, holding the month's transactions
+    sorted on (customer_id, timestamp) like its bucket was. BSON keeps
+    ObjectIds and datetimes as they were stored. Files are read and written
+    on the default executor, so the event loop keeps serving; reads scan the
+    whole file, which is fine for audits but not for hot paths.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path(self, month: str) -> str:
+        return os.path.join(self.directory, f"Transaction_{month}.bson.gz")
+
+    def months(self) -> list[str]:
+        """Archived months, oldest first."""
+
+        if not os.path.isdir(self.directory):
+            return []
+
+        return sorted(match.group(1) for match in map(FILE_PATTERN.match, os.listdir(self.directory)) if match)
+
+    async def write(self, month: str, transactions) -> int:
+        """Write an async iterator of a month's transactions to its file; returns how many were written.
+
+        The file only appears, complete, once every transaction is written.
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(month)
+        partial = path + ".partial"
+        written = 0
+
+        archive = await asyncio.to_thread(gzip.open, partial, "wb")
+
+        try:
+            chunk = []
+            async for transaction in transactions:
+                chunk.append(bson.encode(transaction))
+                if len(chunk) >= CHUNK:
+                    await asyncio.to_thread(archive.write, b"".join(chunk))
+                    written += len(chunk)
+                    chunk = []
+
+            await asyncio.to_thread(archive.write, b"".join(chunk))
+            written += len(chunk)
+        finally:
+            await asyncio.to_thread(archive.close)
+
+        os.replace(partial, path)
+        return written
+
+    async def stream_month(self, month: str, customer_id: str = None, batch_size: int = CHUNK):
+
+        archive = await asyncio.to_thread(gzip.open, self.path(month), "rb")
+
+        try:
+            documents = bson.decode_file_iter(archive)
+
+            while chunk := await asyncio.to_thread(list, itertools.islice(documents, batch_size)):
+                for transaction in chunk:
+                    if customer_id is None or transaction["customer_id"] == customer_id:
+                        yield transaction
+                    elif transaction["customer_id"] > customer_id:
+                        return
+        finally:
+            await asyncio.to_thread(archive.close)
+
+    async def page_month(self, month, customer_id, limit, from_date=None, to_date=None, transaction_type=None, after=None):
+
+        from_date, to_date = naive_utc(from_date), naive_utc(to_date)
+        after = (naive_utc(after[0]), after[1]) if after else None
+        rows = []
+
+        async for transaction in self.stream_month(month, customer_id):
+            key = (transaction["timestamp"], transaction["_id"])
+
+            if (from_date and key[0] < from_date) or (after and key <= after) or \
+                    (transaction_type and transaction["type"] != transaction_type):
+                continue
+            if to_date and key[0] >= to_date:
+                break
+
+            rows.append(report_row(transaction))
+
+        # the file is sorted on timestamp only; page keys also order on _id
+        rows.sort(key=lambda row: (row["timestamp"], row["_id"]))
+        return rows[:limit]
+
+    async def count_month(self, month: str, customer_id: str = None) -> int:
+
+        count = 0
+        async for _ in self.stream_month(month, customer_id):
+            count += 1
+        return count
@@ -0,0 +1,450 @@
+import asyncio
+import datetime
+import heapq
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+
+class DuplicateError(Exception):
+    """A write violated a unique constraint (User.email, UserInvestmentFund(user_id, fund_id))."""
+
+
+class UserRepository:
+
+    async def find_by_email(self, email: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def find_by_id(self, user_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def insert(self, user: dict) -> str:
+        """Insert a user and return its id; DuplicateError if the email exists."""
+        raise NotImplementedError
+
+    async def insert_many(self, users: list[dict]):
+        raise NotImplementedError
+
+    async def update_balance(self, user_id: str, delta: float, minimum: float = None, session=None) -> Optional[float]:
+        """Add `delta` to the balance, only if it is at least `minimum`; returns the new balance or None."""
+        raise NotImplementedError
+
+
+class FundRepository:
+
+    async def find_all(self) -> list[dict]:
+        raise NotImplementedError
+
+    async def insert(self, fund: dict) -> str:
+        raise NotImplementedError
+
+    async def insert_many(self, funds: list[dict]) -> tuple[int, list[tuple[int, str]]]:
+        """Unordered insert; returns the number inserted and (index, error) of the rejected ones."""
+        raise NotImplementedError
+
+    async def page(self, limit: int, category: str = None, min_fee: float = None, max_fee: float = None,
+                   name_prefix: str = None, sort: str = "name", descending: bool = False, after=None,
+                   fields: list[str] = None) -> list[dict]:
+        """Funds matching the filters ordered by (sort, _id), starting after the
+        (value, _id) of the previous page. With `fields` only those are returned,
+        plus _id and the sort field."""
+        raise NotImplementedError
+
+    async def count(self, category: str = None, min_fee: float = None, max_fee: float = None, name_prefix: str = None) -> int:
+        raise NotImplementedError
+
+    async def get_version(self) -> int:
+        """Catalog version counter, bumped by every write to the funds."""
+        raise NotImplementedError
+
+    async def bump_version(self):
+        raise NotImplementedError
+
+    async def watch(self) -> AsyncIterator[dict]:
+        """Change events on the funds, where the engine supports them."""
+        raise NotImplementedError
+        yield
+
+
+class SubscriptionRepository:
+
+    async def insert(self, user_id: str, fund_id: str, subscription_date: datetime.datetime, session=None):
+        """DuplicateError if the user is already subscribed to the fund."""
+        raise NotImplementedError
+
+    async def delete(self, user_id: str, fund_id: str, now: datetime.datetime, session=None) -> bool:
+        """Delete a subscription unless an in-flight batch holds a claim on it at `now`."""
+        raise NotImplementedError
+
+    async def find_fund_ids(self, user_id: str, fund_ids: list[str]) -> set[str]:
+        raise NotImplementedError
+
+    async def count(self, user_id: str = None) -> int:
+        raise NotImplementedError
+
+    async def write_batch(self, user_id: str, inserts: list[str], cancels: list[str], batch_id,
+                          subscription_date: datetime.datetime, locked_until: datetime.datetime,
+                          session=None) -> tuple[set[str], set[str]]:
+        """Insert subscriptions to `inserts` and claim those to `cancels` for `batch_id` in one write.
+
+        Claims last until `locked_until`; one left by a batch whose claim passed
+        `subscription_date` (its worker died) is taken over. Returns the fund ids
+        whose insert failed and the fund ids actually claimed.
+        """
+        raise NotImplementedError
+
+    async def release_batch(self, user_id: str, inserted: list[str], claimed: list[str], batch_id):
+        """Undo write_batch: delete the inserted subscriptions and unclaim the claimed ones."""
+        raise NotImplementedError
+
+    async def delete_claimed(self, batch_id, session=None):
+        raise NotImplementedError
+
+
+# Months page() queries at once while filling a page
+PAGE_FANOUT = 4
+
+# Fields of a report row, besides _id and customerId
+REPORT_FIELDS = ("customerName", "amount", "type", "fundName", "fundCategory", "timestamp")
+
+
+def naive_utc(value):
+    """Compare datetimes the way MongoDB stores them: naive UTC."""
+
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def month_of(timestamp: datetime.datetime) -> str:
+    """The bucket of a transaction timestamp, "YYYY_MM"."""
+
+    timestamp = naive_utc(timestamp)
+    return f"{timestamp.year:04d}_{timestamp.month:02d}"
+
+
+def month_start(month: str) -> datetime.datetime:
+
+    year, number = month.split("_")
+    return datetime.datetime(int(year), int(number), 1)
+
+
+def next_month(month: str) -> str:
+
+    start = month_start(month)
+    return f"{start.year + start.month // 12:04d}_{start.month % 12 + 1:02d}"
+
+
+def months_in_range(months: list[str], start: datetime.datetime = None, end: datetime.datetime = None) -> list[str]:
+    """The months, of those given, whose bucket can hold timestamps in [start, end)."""
+
+    first = month_of(start) if start else None
+    end = naive_utc(end)
+
+    return [month for month in months if (first is None or month >= first) and (end is None or month_start(month) < end)]
+
+
+def report_row(transaction: dict) -> dict:
+    return {"_id": transaction["_id"], "customerId": transaction["customer_id"],
+            **{field: transaction.get(field) for field in REPORT_FIELDS}}
+
+
+async def merge_sorted(sources: list[AsyncIterator[dict]], key) -> AsyncIterator[dict]:
+    """Merge async iterators that are each sorted on `key` into one sorted stream."""
+
+    heap = []
+
+    for index, source in enumerate(sources):
+        async for item in source:
+            heapq.heappush(heap, (key(item), index, item))
+            break
+
+    while heap:
+        _, index, item = heapq.heappop(heap)
+        yield item
+
+        async for following in sources[index]:
+            heapq.heappush(heap, (key(following), index, following))
+            break
+
+
+class TransactionRepository:
+    """The Transaction ledger, kept in one bucket per calendar month of `timestamp`.
+
+    Engines implement the per-month methods; page(), stream() and count()
+    route to the months a query can touch, oldest first. A month compacted
+    by archive_month() is read back from `archive` instead. Engines also keep
+    each customer's span (first and last month with a transaction), so a
+    report skips the months before and after a customer's history.
+    """
+
+    archive = None  # TransactionArchive of the months moved out of the database
+
+    async def insert(self, transaction: dict, session=None):
+        raise NotImplementedError
+
+    async def insert_many(self, transactions: list[dict], session=None):
+        raise NotImplementedError
+
+    async def backfill_details(self) -> int:
+        """Copy customer and fund names into transactions written without them."""
+        raise NotImplementedError
+
+    async def migrate_flat(self) -> int:
+        """Move transactions from a single-collection ledger into month buckets."""
+        return 0
+
+    async def months(self) -> list[str]:
+        """Months with a bucket in the database, oldest first."""
+        raise NotImplementedError
+
+    async def span(self, customer_id: str) -> Optional[tuple[str, str]]:
+        """First and last month with a transaction of the customer, or None if not recorded."""
+        raise NotImplementedError
+
+    async def page_month(self, month: str, customer_id: str, limit: int, from_date: datetime.datetime = None,
+                         to_date: datetime.datetime = None, transaction_type: str = None, after: tuple = None) -> list[dict]:
+        """page() within one month's bucket."""
+        raise NotImplementedError
+
+    def stream_month(self, month: str, customer_id: str = None, batch_size: int = 1000) -> AsyncIterator[dict]:
+        """Transactions of one month's bucket sorted on (customer_id, timestamp)."""
+        raise NotImplementedError
+
+    async def count_month(self, month: str, customer_id: str = None) -> int:
+        raise NotImplementedError
+
+    async def drop_month(self, month: str):
+        raise NotImplementedError
+
+    async def _sources(self, start=None, end=None, archived: bool = True) -> list:
+        """(month, repository or archive holding it) for the months in [start, end), oldest first."""
+
+        sources = {month: self for month in await self.months()}
+
+        if archived and self.archive:
+            # an archived month may still have its bucket if the drop did not happen; the file is complete
+            sources.update((month, self.archive) for month in await asyncio.to_thread(self.archive.months))
+
+        return [(month, sources[month]) for month in months_in_range(sorted(sources), start, end)]
+
+    async def page(self, customer_id: str, limit: int, from_date: datetime.datetime = None,
+                   to_date: datetime.datetime = None, transaction_type: str = None, after: tuple = None) -> list[dict]:
+        """Report rows of a customer sorted on (timestamp, _id), starting after the `after` key.
+
+        Archived months are only read when `from_date` or `after` reaches
+        back to them; a report from the start covers the database buckets.
+        Months are queried PAGE_FANOUT at a time, within the customer's span.
+        """
+
+        start = max(filter(None, (naive_utc(from_date), naive_utc(after[0]) if after else None)), default=None)
+        sources = await self._sources(start, to_date, archived=start is not None)
+
+        span = await self.span(customer_id)
+        if span is not None:
+            sources = [(month, source) for month, source in sources if span[0] <= month <= span[1]]
+
+        rows = []
+
+        for wave in range(0, len(sources), PAGE_FANOUT):
+            pages = await asyncio.gather(*(
+                source.page_month(month, customer_id, limit - len(rows), from_date, to_date, transaction_type, after)
+                for month, source in sources[wave:wave + PAGE_FANOUT]
+            ))
+            rows += [row for page in pages for row in page]
+
+            if len(rows) >= limit:
+                break
+
+        return rows[:limit]
+
+    async def stream(self, customer_id: str = None, batch_size: int = 1000) -> AsyncIterator[dict]:
+        """Every transaction (of one customer, or all) sorted on (customer_id, timestamp)."""
+
+        sources = await self._sources()
+
+        if customer_id:
+            for month, source in sources:
+                async for transaction in source.stream_month(month, customer_id, batch_size):
+                    yield transaction
+            return
+
+        streams = [source.stream_month(month, None, batch_size) for month, source in sources]
+        async for transaction in merge_sorted(streams, key=lambda transaction: (transaction["customer_id"], transaction["timestamp"])):
+            yield transaction
+
+    async def count(self, customer_id: str = None) -> int:
+        return sum([await source.count_month(month, customer_id) for month, source in await self._sources()])
+
+    async def archive_month(self, month: str) -> int:
+        """Compact a month's bucket into its archive file, then drop the bucket.
+
+        The bucket is kept if the file does not hold every transaction of it.
+        """
+
+        expected = await self.count_month(month)
+        written = await self.archive.write(month, self.stream_month(month))
+
+        if written != expected:
+            raise RuntimeError(f"Archive of {month} has {written} transactions, its bucket {expected}")
+
+        await self.drop_month(month)
+        return written
+
+
+def portfolio_changes(transactions: list[dict]) -> dict:
+    """What a list of ledger entries (Transaction documents) does to a portfolio.
+
+    Returns {"opened": {fund_id: position}, "closed": [fund_id], "invested": delta,
+    "opens": n, "closes": n, "updated_at": latest timestamp}. Both the incremental
+    update and the rebuild from the ledger go through here.
+    """
+
+    changes = {"opened": {}, "closed": [], "invested": 0.0, "opens": 0, "closes": 0, "updated_at": None}
+
+    for transaction in transactions:
+
+        fund_id = transaction["fund_id"]
+
+        if transaction["type"] == "Open":
+            if fund_id in changes["closed"]:
+                changes["closed"].remove(fund_id)
+            changes["opened"][fund_id] = {
+                "name": transaction.get("fundName"),
+                "category": transaction.get("fundCategory"),
+                "amount": transaction["amount"],
+                "since": transaction["timestamp"],
+            }
+            changes["opens"] += 1
+        else:
+            changes["opened"].pop(fund_id, None)
+            changes["closed"].append(fund_id)
+            changes["closes"] += 1
+
+        changes["invested"] += transaction["amount"]
+        changes["updated_at"] = max(filter(None, (changes["updated_at"], transaction["timestamp"])))
+
+    return changes
+
+
+def replay_portfolio(customer_id: str, transactions: list[dict]) -> dict:
+    """Portfolio document of a customer computed from their whole ledger, oldest first."""
+
+    changes = portfolio_changes(transactions)
+
+    return {
+        "_id": customer_id,
+        "funds": changes["opened"],
+        "invested": changes["invested"],
+        "opens": changes["opens"],
+        "closes": changes["closes"],
+        "updated_at": changes["updated_at"],
+    }
+
+
+class PortfolioRepository:
+    """Per-customer summary kept in step with the Transaction ledger."""
+
+    async def apply(self, customer_id: str, transactions: list[dict], session=None):
+        """Fold new ledger entries of a customer into their portfolio, in one write."""
+        raise NotImplementedError
+
+    async def get(self, customer_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def replace(self, portfolio: dict, previous: Optional[dict]) -> bool:
+        """Overwrite the stored portfolio if it is still `previous` (None: absent).
+
+        Returns False when a concurrent apply() changed it in the meantime.
+        """
+        raise NotImplementedError
+
+
+class OutboxRepository:
+
+    async def insert_many(self, notifications: list[dict]):
+        raise NotImplementedError
+
+    async def due(self, now: datetime.datetime, limit: int) -> list[dict]:
+        """Pending notifications whose next attempt is due, and expired leases."""
+        raise NotImplementedError
+
+    async def claim(self, ids: list, now: datetime.datetime, locked_until: datetime.datetime, claim) -> list[dict]:
+        """Lease the due notifications among `ids` to `claim`; returns the leased ones."""
+        raise NotImplementedError
+
+    async def mark_sent(self, ids: list, now: datetime.datetime):
+        raise NotImplementedError
+
+    async def mark_retry(self, notification_id, attempts: int, error: str, next_attempt_at: datetime.datetime = None):
+        """Reschedule a notification, or mark it failed when `next_attempt_at` is None."""
+        raise NotImplementedError
+
+    async def find(self, status: str = None) -> list[dict]:
+        raise NotImplementedError
+
+
+class IdempotencyRepository:
+    """Responses stored under an Idempotency-Key until `expires_at`.
+
+    A record is "pending" while the first request runs and "completed" with
+    its response afterwards.
+    """
+
+    async def get(self, key: str, now: datetime.datetime) -> Optional[dict]:
+        """The unexpired record of a key, or None."""
+        raise NotImplementedError
+
+    async def claim(self, key: str, fingerprint: str, now: datetime.datetime, locked_until: datetime.datetime,
+                    expires_at: datetime.datetime) -> bool:
+        """Create a pending record, or take over one whose lock or TTL has passed.
+
+        Returns False while another request holds the key or after it completed.
+        """
+        raise NotImplementedError
+
+    async def complete(self, key: str, response: dict):
+        """Store the response of the request holding the key."""
+        raise NotImplementedError
+
+    async def release(self, key: str):
+        """Drop a pending record so the key can be used again (the request failed)."""
+        raise NotImplementedError
+
+
+class Storage:
+    """The repositories of one storage engine."""
+
+    users: UserRepository
+    funds: FundRepository
+    subscriptions: SubscriptionRepository
+    transactions: TransactionRepository
+    outbox: OutboxRepository
+    portfolios: PortfolioRepository
+    idempotency: IdempotencyRepository
+    client = None  # database driver client, when the engine has one
+
+    async def connect(self):
+        """Open connections; called from the application lifespan, safe to repeat."""
+
+    async def close(self):
+        """Close connections opened by connect()."""
+
+    def health(self) -> dict:
+        """Readiness of the engine; `ready` is False when it should not take traffic."""
+        return {"ready": True}
+
+    async def ensure_indexes(self):
+        raise NotImplementedError
+
+    async def check_query_plans(self) -> list:
+        """Hot-path queries that do not use an index."""
+        return []
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Yield a session whose writes commit together, or None when not supported."""
+        yield None
+
+    async def reset(self):
+        """Remove all data (tests and benchmarks)."""
+        raise NotImplementedError
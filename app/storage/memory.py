@@ -0,0 +1,443 @@
+import bisect
+from bson import ObjectId
+from app.config import TRANSACTION_ARCHIVE_DIR
+from app.storage.archive import TransactionArchive
+from app.storage.base import DuplicateError, Storage, UserRepository, FundRepository, SubscriptionRepository, \
+    TransactionRepository, OutboxRepository, PortfolioRepository, IdempotencyRepository, portfolio_changes, \
+    month_of, naive_utc as _naive, report_row
+
+
+def _with_id(document):
+
+    document = dict(document)
+    document.setdefault("_id", ObjectId())
+    return document
+
+
+# Every method below runs without awaiting, so on one event loop each call is
+# atomic, just like the single-document operations of the Motor backend.
+
+class MemoryUserRepository(UserRepository):
+
+    def __init__(self):
+        self._users = {}
+        self._by_email = {}  # unique index on email
+
+    async def find_by_email(self, email):
+        user_id = self._by_email.get(email)
+        return dict(self._users[user_id]) if user_id else None
+
+    async def find_by_id(self, user_id):
+        user = self._users.get(user_id)
+        return dict(user) if user else None
+
+    async def insert(self, user):
+
+        if user["email"] in self._by_email:
+            raise DuplicateError(f"Duplicate email {user['email']}")
+
+        user = _with_id(user)
+        user_id = str(user["_id"])
+        self._users[user_id] = user
+        self._by_email[user["email"]] = user_id
+        return user_id
+
+    async def insert_many(self, users):
+        for user in users:
+            await self.insert(user)
+
+    async def update_balance(self, user_id, delta, minimum=None, session=None):
+
+        user = self._users.get(user_id)
+
+        if user is None or (minimum is not None and user["balance"] < minimum):
+            return None
+
+        user["balance"] += delta
+        return user["balance"]
+
+
+class MemoryFundRepository(FundRepository):
+
+    def __init__(self):
+        self._funds = {}
+        self._version = 0
+
+    async def find_all(self):
+        return [dict(fund) for fund in self._funds.values()]
+
+    async def insert(self, fund):
+        fund = _with_id(fund)
+        self._funds[str(fund["_id"])] = fund
+        return str(fund["_id"])
+
+    async def insert_many(self, funds):
+        for fund in funds:
+            await self.insert(fund)
+        return len(funds), []
+
+    def _matching(self, category, min_fee, max_fee, name_prefix):
+
+        return [
+            fund for fund in self._funds.values()
+            if (category is None or fund["category"] == category)
+            and (min_fee is None or fund["minimumFee"] >= min_fee)
+            and (max_fee is None or fund["minimumFee"] <= max_fee)
+            and (name_prefix is None or fund["name"].startswith(name_prefix))
+        ]
+
+    async def page(self, limit, category=None, min_fee=None, max_fee=None, name_prefix=None,
+                   sort="name", descending=False, after=None, fields=None):
+
+        funds = sorted(self._matching(category, min_fee, max_fee, name_prefix),
+                       key=lambda fund: (fund[sort], fund["_id"]), reverse=descending)
+
+        if after:
+            after = tuple(after)
+            funds = [fund for fund in funds if ((fund[sort], fund["_id"]) < after if descending else (fund[sort], fund["_id"]) > after)]
+
+        keys = ["_id", sort, *fields] if fields else None
+        return [{key: fund[key] for key in keys if key in fund} if keys else dict(fund) for fund in funds[:limit]]
+
+    async def count(self, category=None, min_fee=None, max_fee=None, name_prefix=None):
+        return len(self._matching(category, min_fee, max_fee, name_prefix))
+
+    async def get_version(self):
+        return self._version
+
+    async def bump_version(self):
+        self._version += 1
+
+
+class MemorySubscriptionRepository(SubscriptionRepository):
+
+    def __init__(self):
+        self._subscriptions = {}  # unique index on (user_id, fund_id)
+        self._by_user = {}
+
+    async def insert(self, user_id, fund_id, subscription_date, session=None):
+
+        if (user_id, fund_id) in self._subscriptions:
+            raise DuplicateError(f"Duplicate subscription {user_id}/{fund_id}")
+
+        self._subscriptions[(user_id, fund_id)] = {
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "fund_id": fund_id,
+            "subscription_date": subscription_date
+        }
+        self._by_user.setdefault(user_id, set()).add(fund_id)
+
+    def _remove(self, user_id, fund_id):
+
+        del self._subscriptions[(user_id, fund_id)]
+        self._by_user[user_id].discard(fund_id)
+
+    @staticmethod
+    def _claimed(subscription, now):
+        return "batch" in subscription and subscription["batch_locked_until"] > now
+
+    async def delete(self, user_id, fund_id, now, session=None):
+
+        subscription = self._subscriptions.get((user_id, fund_id))
+
+        if subscription is None or self._claimed(subscription, now):
+            return False
+
+        self._remove(user_id, fund_id)
+        return True
+
+    async def find_fund_ids(self, user_id, fund_ids):
+        return self._by_user.get(user_id, set()) & set(fund_ids)
+
+    async def count(self, user_id=None):
+        return len(self._by_user.get(user_id, ())) if user_id else len(self._subscriptions)
+
+    async def write_batch(self, user_id, inserts, cancels, batch_id, subscription_date, locked_until, session=None):
+
+        failed, claimed = set(), set()
+
+        for fund_id in inserts:
+            try:
+                await self.insert(user_id, fund_id, subscription_date)
+            except DuplicateError:
+                failed.add(fund_id)
+
+        for fund_id in cancels:
+            subscription = self._subscriptions.get((user_id, fund_id))
+            if subscription is not None and not self._claimed(subscription, subscription_date):
+                subscription.update(batch=batch_id, batch_locked_until=locked_until)
+                claimed.add(fund_id)
+
+        return failed, claimed
+
+    async def release_batch(self, user_id, inserted, claimed, batch_id):
+
+        for fund_id in inserted:
+            if (user_id, fund_id) in self._subscriptions:
+                self._remove(user_id, fund_id)
+
+        for fund_id in claimed:
+            subscription = self._subscriptions.get((user_id, fund_id))
+            if subscription is not None and subscription.get("batch") == batch_id:
+                del subscription["batch"], subscription["batch_locked_until"]
+
+    async def delete_claimed(self, batch_id, session=None):
+
+        for (user_id, fund_id), subscription in list(self._subscriptions.items()):
+            if subscription.get("batch") == batch_id:
+                self._remove(user_id, fund_id)
+
+
+class MemoryTransactionRepository(TransactionRepository):
+
+    def __init__(self, storage, archive):
+        self._storage = storage
+        self.archive = archive
+        self._buckets = {}      # month -> {_id: transaction}
+        self._by_customer = {}  # month -> index on (customer_id, timestamp, _id)
+        self._spans = {}        # customer_id -> [first month, last month]
+
+    async def insert(self, transaction, session=None):
+
+        transaction = _with_id(transaction)
+        transaction["timestamp"] = _naive(transaction["timestamp"])
+        month = month_of(transaction["timestamp"])
+
+        span = self._spans.setdefault(transaction["customer_id"], [month, month])
+        span[:] = [min(span[0], month), max(span[1], month)]
+
+        self._buckets.setdefault(month, {})[transaction["_id"]] = transaction
+        bisect.insort(self._by_customer.setdefault(month, {}).setdefault(transaction["customer_id"], []),
+                      (transaction["timestamp"], transaction["_id"]))
+
+    async def insert_many(self, transactions, session=None):
+        for transaction in transactions:
+            await self.insert(transaction)
+
+    async def months(self):
+        return sorted(self._buckets)
+
+    async def span(self, customer_id):
+        span = self._spans.get(customer_id)
+        return tuple(span) if span else None
+
+    async def page_month(self, month, customer_id, limit, from_date=None, to_date=None, transaction_type=None, after=None):
+
+        keys = self._by_customer.get(month, {}).get(customer_id, [])
+        start = 0
+        from_date, to_date = _naive(from_date), _naive(to_date)
+
+        if from_date:
+            start = bisect.bisect_left(keys, (from_date,))
+        if after:
+            start = max(start, bisect.bisect_right(keys, (_naive(after[0]), after[1])))
+
+        rows = []
+        for timestamp, _id in keys[start:]:
+            if len(rows) >= limit or (to_date and timestamp >= to_date):
+                break
+            transaction = self._buckets[month][_id]
+            if transaction_type and transaction["type"] != transaction_type:
+                continue
+            rows.append(report_row(transaction))
+
+        return rows
+
+    async def stream_month(self, month, customer_id=None, batch_size=1000):
+
+        index = self._by_customer.get(month, {})
+        customers = [customer_id] if customer_id else sorted(index)
+
+        for customer in customers:
+            for _, _id in list(index.get(customer, [])):
+                yield dict(self._buckets[month][_id])
+
+    async def count_month(self, month, customer_id=None):
+
+        if customer_id:
+            return len(self._by_customer.get(month, {}).get(customer_id, ()))
+        return len(self._buckets.get(month, ()))
+
+    async def drop_month(self, month):
+
+        self._buckets.pop(month, None)
+        self._by_customer.pop(month, None)
+
+    async def backfill_details(self):
+
+        updated = 0
+
+        for bucket in self._buckets.values():
+            for transaction in bucket.values():
+                if all(field in transaction for field in ("customerName", "fundName", "fundCategory")):
+                    continue
+
+                user = self._storage.users._users.get(transaction["customer_id"])
+                fund = self._storage.funds._funds.get(transaction["fund_id"])
+                if user and fund:
+                    transaction.update(customerName=user["name"], fundName=fund["name"], fundCategory=fund["category"])
+                    updated += 1
+
+        return updated
+
+
+class MemoryOutboxRepository(OutboxRepository):
+
+    def __init__(self):
+        self._notifications = {}
+        self._open = set()  # index on status: ids still pending or sending
+
+    def _is_due(self, notification, now):
+
+        if notification["status"] == "pending":
+            return notification["next_attempt_at"] <= now
+        return notification["status"] == "sending" and notification["locked_until"] < now
+
+    async def insert_many(self, notifications):
+
+        for notification in notifications:
+            notification = _with_id(notification)
+            self._notifications[notification["_id"]] = notification
+            self._open.add(notification["_id"])
+
+    async def due(self, now, limit):
+        due = [dict(self._notifications[_id]) for _id in self._open if self._is_due(self._notifications[_id], now)]
+        return due[:limit]
+
+    async def claim(self, ids, now, locked_until, claim):
+
+        claimed = []
+
+        for _id in ids:
+            notification = self._notifications.get(_id)
+            if notification is not None and self._is_due(notification, now):
+                notification.update(status="sending", claim=claim, locked_until=locked_until)
+                claimed.append(dict(notification))
+
+        return claimed
+
+    async def mark_sent(self, ids, now):
+
+        for _id in ids:
+            notification = self._notifications[_id]
+            notification.update(status="sent", sent_at=now)
+            notification.pop("claim", None)
+            notification.pop("locked_until", None)
+            self._open.discard(_id)
+
+    async def mark_retry(self, notification_id, attempts, error, next_attempt_at=None):
+
+        notification = self._notifications[notification_id]
+        notification.update(attempts=attempts, last_error=error)
+        notification.pop("claim", None)
+        notification.pop("locked_until", None)
+
+        if next_attempt_at is None:
+            notification["status"] = "failed"
+            self._open.discard(notification_id)
+        else:
+            notification.update(status="pending", next_attempt_at=next_attempt_at)
+
+    async def find(self, status=None):
+        return [dict(notification) for notification in self._notifications.values()
+                if status is None or notification["status"] == status]
+
+
+class MemoryPortfolioRepository(PortfolioRepository):
+
+    def __init__(self):
+        self._portfolios = {}
+
+    async def apply(self, customer_id, transactions, session=None):
+
+        changes = portfolio_changes(transactions)
+        portfolio = self._portfolios.setdefault(customer_id, {
+            "_id": customer_id, "funds": {}, "invested": 0.0, "opens": 0, "closes": 0, "updated_at": None
+        })
+
+        for fund_id in changes["closed"]:
+            portfolio["funds"].pop(fund_id, None)
+
+        portfolio["funds"].update(changes["opened"])
+        portfolio["invested"] += changes["invested"]
+        portfolio["opens"] += changes["opens"]
+        portfolio["closes"] += changes["closes"]
+        portfolio["updated_at"] = max(filter(None, (portfolio["updated_at"], changes["updated_at"])), default=None)
+
+    async def get(self, customer_id):
+        portfolio = self._portfolios.get(customer_id)
+        return {**portfolio, "funds": dict(portfolio["funds"])} if portfolio else None
+
+    async def replace(self, portfolio, previous):
+
+        stored = self._portfolios.get(portfolio["_id"])
+
+        if (stored is None) != (previous is None) or \
+                (stored and (stored["opens"], stored["closes"]) != (previous["opens"], previous["closes"])):
+            return False
+
+        self._portfolios[portfolio["_id"]] = {**portfolio, "funds": dict(portfolio["funds"])}
+        return True
+
+
+class MemoryIdempotencyRepository(IdempotencyRepository):
+
+    def __init__(self):
+        self._records = {}
+
+    async def get(self, key, now):
+
+        record = self._records.get(key)
+        if record is None or record["expires_at"] <= now:
+            return None
+        return dict(record)
+
+    async def claim(self, key, fingerprint, now, locked_until, expires_at):
+
+        record = self._records.get(key)
+
+        if record is not None and record["expires_at"] > now and \
+                (record["status"] != "pending" or record["locked_until"] >= now):
+            return False
+
+        self._records[key] = {"_id": key, "fingerprint": fingerprint, "status": "pending",
+                              "locked_until": locked_until, "expires_at": expires_at}
+        return True
+
+    async def complete(self, key, response):
+
+        if key in self._records:
+            self._records[key].update(status="completed", response=response)
+
+    async def release(self, key):
+
+        if self._records.get(key, {}).get("status") == "pending":
+            del self._records[key]
+
+
+class MemoryStorage(Storage):
+    """Process-local repositories with the same indexes and constraints as MongoDB.
+
+    Data lives only as long as the process and is not shared between
+    workers; meant for tests, benchmarks and local development.
+    """
+
+    def __init__(self):
+        self._create()
+
+    def _create(self):
+
+        self.users = MemoryUserRepository()
+        self.funds = MemoryFundRepository()
+        self.subscriptions = MemorySubscriptionRepository()
+        self.transactions = MemoryTransactionRepository(self, TransactionArchive(TRANSACTION_ARCHIVE_DIR))
+        self.outbox = MemoryOutboxRepository()
+        self.portfolios = MemoryPortfolioRepository()
+        self.idempotency = MemoryIdempotencyRepository()
+
+    async def ensure_indexes(self):
+        pass
+
+    async def reset(self):
+        self._create()
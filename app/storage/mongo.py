@@ -0,0 +1,634 @@
+import datetime
+import re
+import time
+from contextlib import asynccontextmanager
+from bson import ObjectId
+from pymongo import InsertOne, ReturnDocument, UpdateOne, DeleteOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from app.config import logging, MONGO_DB_NAME, MONGO_TRANSACTIONS, READY_MAX_CHECKOUT_WAIT_MS, TRANSACTION_ARCHIVE_DIR
+from app.database import create_client, pool_monitor
+from app.indexes import ensure_indexes, check_query_plans, bucket_name, bucket_collections, ensure_bucket_indexes
+from app.pagination import after as after_key
+from app.storage.archive import TransactionArchive
+from app.storage.base import DuplicateError, Storage, UserRepository, FundRepository, SubscriptionRepository, \
+    TransactionRepository, OutboxRepository, PortfolioRepository, IdempotencyRepository, portfolio_changes, \
+    month_of, month_start, next_month
+
+logger = logging.getLogger(__name__)
+
+COLLECTIONS = ("User", "InvestmentFund", "CatalogVersion", "UserInvestmentFund", "Transaction", "NotificationOutbox", "Portfolio", "IdempotencyKey", "TransactionSpan")
+
+# Seconds a worker trusts its list of Transaction month buckets
+BUCKET_LIST_SECONDS = 5
+
+# Transactions written before customerName/fundName/fundCategory were denormalized
+MISSING_DETAILS = {"$or": [
+    {"customerName": {"$exists": False}},
+    {"fundName": {"$exists": False}},
+    {"fundCategory": {"$exists": False}},
+]}
+
+
+class MongoUserRepository(UserRepository):
+
+    def __init__(self, db):
+        self.collection = db['User']
+
+    async def find_by_email(self, email):
+        return await self.collection.find_one({"email": email})
+
+    async def find_by_id(self, user_id):
+        return await self.collection.find_one({"_id": ObjectId(user_id)})
+
+    async def insert(self, user):
+        try:
+            result = await self.collection.insert_one(user)
+        except DuplicateKeyError as e:
+            raise DuplicateError(str(e))
+        return str(result.inserted_id)
+
+    async def insert_many(self, users):
+        await self.collection.insert_many(users)
+
+    async def update_balance(self, user_id, delta, minimum=None, session=None):
+
+        query = {"_id": ObjectId(user_id)}
+        if minimum is not None:
+            query["balance"] = {"$gte": minimum}
+
+        updated = await self.collection.find_one_and_update(
+            query,
+            {"$inc": {"balance": delta}},
+            projection={"balance": 1},
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+
+        return updated["balance"] if updated else None
+
+
+def _fund_filter(category, min_fee, max_fee, name_prefix):
+
+    query = {}
+
+    if category:
+        query["category"] = category
+
+    if min_fee is not None or max_fee is not None:
+        query["minimumFee"] = {}
+        if min_fee is not None:
+            query["minimumFee"]["$gte"] = min_fee
+        if max_fee is not None:
+            query["minimumFee"]["$lte"] = max_fee
+
+    if name_prefix:
+        # an anchored, case-sensitive regex is an index range scan on name
+        query["name"] = {"$regex": "^" + re.escape(name_prefix)}
+
+    return query
+
+
+class MongoFundRepository(FundRepository):
+
+    def __init__(self, db):
+        self.collection = db['InvestmentFund']
+        self.versions = db['CatalogVersion']
+
+    async def find_all(self):
+        return await self.collection.find().to_list()
+
+    async def insert(self, fund):
+        result = await self.collection.insert_one(fund)
+        return str(result.inserted_id)
+
+    async def insert_many(self, funds):
+        try:
+            result = await self.collection.insert_many(funds, ordered=False)
+            return len(result.inserted_ids), []
+        except BulkWriteError as e:
+            return e.details["nInserted"], [(error["index"], error["errmsg"]) for error in e.details["writeErrors"]]
+
+    async def page(self, limit, category=None, min_fee=None, max_fee=None, name_prefix=None,
+                   sort="name", descending=False, after=None, fields=None):
+
+        query = _fund_filter(category, min_fee, max_fee, name_prefix)
+
+        if after:
+            query = {"$and": [query, after_key(sort, *after, descending=descending)]}
+
+        direction = -1 if descending else 1
+        projection = {field: 1 for field in (sort, *fields)} if fields else None
+
+        return await self.collection.find(query, projection) \
+            .sort([(sort, direction), ("_id", direction)]) \
+            .limit(limit) \
+            .to_list()
+
+    async def count(self, category=None, min_fee=None, max_fee=None, name_prefix=None):
+        return await self.collection.count_documents(_fund_filter(category, min_fee, max_fee, name_prefix))
+
+    async def get_version(self):
+        document = await self.versions.find_one({"_id": "InvestmentFund"})
+        return document["version"] if document else 0
+
+    async def bump_version(self):
+        await self.versions.update_one({"_id": "InvestmentFund"}, {"$inc": {"version": 1}}, upsert=True)
+
+    async def watch(self):
+        async with self.collection.watch() as stream:
+            async for change in stream:
+                yield change
+
+
+class MongoSubscriptionRepository(SubscriptionRepository):
+
+    def __init__(self, db):
+        self.collection = db['UserInvestmentFund']
+
+    async def insert(self, user_id, fund_id, subscription_date, session=None):
+        try:
+            await self.collection.insert_one({
+                "user_id": user_id,
+                "fund_id": fund_id,
+                "subscription_date": subscription_date
+            }, session=session)
+        except DuplicateKeyError as e:
+            raise DuplicateError(str(e))
+
+    @staticmethod
+    def _unclaimed(now):
+        """Filter of subscriptions no in-flight batch holds at `now`."""
+
+        return {"$or": [{"batch": {"$exists": False}}, {"batch_locked_until": {"$lte": now}}]}
+
+    async def delete(self, user_id, fund_id, now, session=None):
+
+        # subscriptions claimed by an in-flight batch are not cancellable here
+        deleted = await self.collection.delete_one({
+            "user_id": user_id,
+            "fund_id": fund_id,
+            **self._unclaimed(now)
+        }, session=session)
+
+        return deleted.deleted_count == 1
+
+    async def find_fund_ids(self, user_id, fund_ids):
+        subscriptions = await self.collection.find({"user_id": user_id, "fund_id": {"$in": fund_ids}}, {"fund_id": 1}).to_list()
+        return {subscription["fund_id"] for subscription in subscriptions}
+
+    async def count(self, user_id=None):
+        return await self.collection.count_documents({"user_id": user_id} if user_id else {})
+
+    async def write_batch(self, user_id, inserts, cancels, batch_id, subscription_date, locked_until, session=None):
+
+        requests = [
+            InsertOne({"user_id": user_id, "fund_id": fund_id, "subscription_date": subscription_date})
+            for fund_id in inserts
+        ] + [
+            UpdateOne({"user_id": user_id, "fund_id": fund_id, **self._unclaimed(subscription_date)},
+                      {"$set": {"batch": batch_id, "batch_locked_until": locked_until}})
+            for fund_id in cancels
+        ]
+
+        failed = set()
+        try:
+            await self.collection.bulk_write(requests, ordered=False, session=session)
+        except BulkWriteError as e:
+            failed = {inserts[error["index"]] for error in e.details["writeErrors"] if error["index"] < len(inserts)}
+
+        claimed = set()
+        if cancels:
+            claimed = await self.collection.find({"batch": batch_id}, {"fund_id": 1}, session=session).to_list()
+            claimed = {subscription["fund_id"] for subscription in claimed}
+
+        return failed, claimed
+
+    async def release_batch(self, user_id, inserted, claimed, batch_id):
+
+        requests = [DeleteOne({"user_id": user_id, "fund_id": fund_id}) for fund_id in inserted] + [
+            UpdateOne({"user_id": user_id, "fund_id": fund_id, "batch": batch_id}, {"$unset": {"batch": "", "batch_locked_until": ""}})
+            for fund_id in claimed
+        ]
+
+        if requests:
+            await self.collection.bulk_write(requests, ordered=False)
+
+    async def delete_claimed(self, batch_id, session=None):
+        await self.collection.delete_many({"batch": batch_id}, session=session)
+
+
+class MongoTransactionRepository(TransactionRepository):
+    """One collection per month, "Transaction_YYYY_MM", each indexed on (customer_id, timestamp).
+
+    The month list is cached for BUCKET_LIST_SECONDS; buckets this worker
+    writes to are added right away, so only another worker's first write
+    of a new month takes that long to show up in reads here. Customer spans
+    live in "TransactionSpan", widened before the transactions are written
+    so a span never misses a month that holds some of them.
+    """
+
+    def __init__(self, db, archive):
+        self.db = db
+        self.spans = db['TransactionSpan']
+        self.archive = archive
+        self._months = None
+        self._listed_at = 0.0
+        self._indexed = set()  # months whose indexes this worker has ensured
+
+    def _bucket(self, month):
+        return self.db[bucket_name("Transaction", month)]
+
+    async def _prepare(self, month):
+        """Index a month's bucket before its first write from this worker."""
+
+        if month not in self._indexed:
+            await ensure_bucket_indexes(self.db, "Transaction", month)
+            self._indexed.add(month)
+
+            if self._months is not None and month not in self._months:
+                self._months = sorted({*self._months, month})
+
+    async def _widen_spans(self, spans, session=None):
+        """Extend the span of each customer_id in {customer_id: (first, last)}."""
+
+        await self.spans.bulk_write([
+            UpdateOne({"_id": customer_id}, {"$min": {"first": first}, "$max": {"last": last}}, upsert=True)
+            for customer_id, (first, last) in spans.items()
+        ], ordered=False, session=session)
+
+    async def insert(self, transaction, session=None):
+
+        month = month_of(transaction["timestamp"])
+        await self._prepare(month)
+        await self._widen_spans({transaction["customer_id"]: (month, month)}, session=session)
+        await self._bucket(month).insert_one(transaction, session=session)
+
+    async def insert_many(self, transactions, session=None):
+
+        by_month, spans = {}, {}
+        for transaction in transactions:
+            month = month_of(transaction["timestamp"])
+            by_month.setdefault(month, []).append(transaction)
+            first, last = spans.get(transaction["customer_id"], (month, month))
+            spans[transaction["customer_id"]] = (min(first, month), max(last, month))
+
+        if spans:
+            await self._widen_spans(spans, session=session)
+
+        for month, documents in by_month.items():
+            await self._prepare(month)
+            await self._bucket(month).insert_many(documents, session=session)
+
+    async def months(self):
+
+        if self._months is None or time.monotonic() - self._listed_at > BUCKET_LIST_SECONDS:
+            prefix = len("Transaction_")
+            self._months = [name[prefix:] for name in await bucket_collections(self.db, "Transaction")]
+            self._listed_at = time.monotonic()
+
+        return self._months
+
+    async def span(self, customer_id):
+
+        span = await self.spans.find_one({"_id": customer_id})
+        return (span["first"], span["last"]) if span else None
+
+    async def page_month(self, month, customer_id, limit, from_date=None, to_date=None, transaction_type=None, after=None):
+
+        match = {"customer_id": customer_id}
+
+        if from_date or to_date:
+            match["timestamp"] = {}
+            if from_date:
+                match["timestamp"]["$gte"] = from_date
+            if to_date:
+                match["timestamp"]["$lt"] = to_date
+
+        if transaction_type:
+            match["type"] = transaction_type
+
+        if after:
+            match = {"$and": [match, after_key("timestamp", *after)]}
+
+        # Names are denormalized into each Transaction when it is written (see app.migrations
+        # for older documents), so the report is an index range scan on (customer_id, timestamp).
+        pipeline = [
+            {
+                "$match": match
+            },
+            {
+                "$sort": {"timestamp": 1, "_id": 1}
+            },
+            {
+                "$limit": limit
+            },
+            {
+                "$project": {
+                    "_id": 1,
+                    "customerId": "$customer_id",
+                    "customerName": 1,
+                    "amount": 1,
+                    "type": 1,
+                    "fundName": 1,
+                    "fundCategory": 1,
+                    "timestamp": 1
+                }
+            }
+        ]
+
+        return await self._bucket(month).aggregate(pipeline).to_list()
+
+    async def stream_month(self, month, customer_id=None, batch_size=1000):
+
+        # (customer_id, timestamp) matches the index, so the export never sorts in memory
+        cursor = self._bucket(month).find({"customer_id": customer_id} if customer_id else {}) \
+            .sort([("customer_id", 1), ("timestamp", 1)]) \
+            .batch_size(batch_size)
+
+        async for transaction in cursor:
+            yield transaction
+
+    async def count_month(self, month, customer_id=None):
+        return await self._bucket(month).count_documents({"customer_id": customer_id} if customer_id else {})
+
+    async def drop_month(self, month):
+
+        await self._bucket(month).drop()
+        self._indexed.discard(month)
+        self._months = None
+
+    async def backfill_details(self):
+
+        updated = 0
+
+        for month in await self.months():
+            collection = self._bucket(month)
+            missing = await collection.count_documents(MISSING_DETAILS)
+
+            if not missing:
+                continue
+
+            # string ids are converted once per document so both $lookup stages
+            # join on the _id index, and $merge writes the names back in place
+            pipeline = [
+                {"$match": MISSING_DETAILS},
+                {"$project": {
+                    "customerObjectId": {"$toObjectId": "$customer_id"},
+                    "fundObjectId": {"$toObjectId": "$fund_id"},
+                }},
+                {"$lookup": {"from": "User", "localField": "customerObjectId", "foreignField": "_id", "as": "userDetails"}},
+                {"$lookup": {"from": "InvestmentFund", "localField": "fundObjectId", "foreignField": "_id", "as": "fundDetails"}},
+                {"$project": {
+                    "customerName": {"$first": "$userDetails.name"},
+                    "fundName": {"$first": "$fundDetails.name"},
+                    "fundCategory": {"$first": "$fundDetails.category"},
+                }},
+                {"$merge": {"into": collection.name, "on": "_id", "whenMatched": "merge", "whenNotMatched": "discard"}},
+            ]
+
+            await collection.aggregate(pipeline).to_list()
+            updated += missing - await collection.count_documents(MISSING_DETAILS)
+
+        return updated
+
+    async def migrate_flat(self):
+        """Copy the single "Transaction" collection into month buckets, then rename it.
+
+        Each month is $merged into its bucket keeping documents already there,
+        so the copy can be re-run, and checked before the flat collection is
+        renamed to "TransactionFlat_<time>" as a backup to drop by hand.
+        Writes made to "Transaction" by workers still on the old version are
+        picked up by the next run.
+        """
+
+        flat = self.db["Transaction"]
+
+        if "Transaction" not in await self.db.list_collection_names(filter={"name": "Transaction"}):
+            return 0
+
+        grouped = flat.aggregate([
+            {"$group": {"_id": {"year": {"$year": "$timestamp"}, "month": {"$month": "$timestamp"}}, "count": {"$sum": 1}}}
+        ])
+        months = {f"{group['_id']['year']:04d}_{group['_id']['month']:02d}": group["count"] async for group in grouped}
+
+        spans = flat.aggregate([
+            {"$group": {"_id": "$customer_id", "first": {"$min": "$timestamp"}, "last": {"$max": "$timestamp"}}}
+        ])
+        spans = {span["_id"]: (month_of(span["first"]), month_of(span["last"])) async for span in spans}
+        if spans:
+            await self._widen_spans(spans)
+
+        for month, count in sorted(months.items()):
+            await self._prepare(month)
+            await flat.aggregate([
+                {"$match": {"timestamp": {"$gte": month_start(month), "$lt": month_start(next_month(month))}}},
+                {"$merge": {"into": bucket_name("Transaction", month), "on": "_id", "whenMatched": "keepExisting"}},
+            ]).to_list()
+
+            if await self.count_month(month) < count:
+                raise RuntimeError(f"Bucket {month} is missing transactions after the copy; Transaction was kept")
+
+            logger.info("Copied %s transactions of %s into their bucket", count, month)
+
+        backup = f"TransactionFlat_{datetime.datetime.now(datetime.UTC):%Y%m%d%H%M%S}"
+        await flat.rename(backup)
+        self._months = None
+        logger.info("Renamed the flat Transaction collection to %s", backup)
+
+        return sum(months.values())
+
+
+class MongoOutboxRepository(OutboxRepository):
+
+    def __init__(self, db):
+        self.collection = db['NotificationOutbox']
+
+    @staticmethod
+    def _due(now):
+        return {"$or": [
+            {"status": "pending", "next_attempt_at": {"$lte": now}},
+            {"status": "sending", "locked_until": {"$lt": now}},
+        ]}
+
+    async def insert_many(self, notifications):
+        await self.collection.insert_many(notifications)
+
+    async def due(self, now, limit):
+        return await self.collection.find(self._due(now)).limit(limit).to_list()
+
+    async def claim(self, ids, now, locked_until, claim):
+
+        await self.collection.update_many(
+            {"_id": {"$in": ids}, **self._due(now)},
+            {"$set": {"status": "sending", "claim": claim, "locked_until": locked_until}}
+        )
+
+        return await self.collection.find({"claim": claim}).to_list()
+
+    async def mark_sent(self, ids, now):
+        await self.collection.update_many(
+            {"_id": {"$in": ids}},
+            {"$set": {"status": "sent", "sent_at": now}, "$unset": {"claim": "", "locked_until": ""}}
+        )
+
+    async def mark_retry(self, notification_id, attempts, error, next_attempt_at=None):
+
+        update = {"status": "failed"} if next_attempt_at is None else {"status": "pending", "next_attempt_at": next_attempt_at}
+
+        await self.collection.update_one(
+            {"_id": notification_id},
+            {"$set": {**update, "attempts": attempts, "last_error": error}, "$unset": {"claim": "", "locked_until": ""}}
+        )
+
+    async def find(self, status=None):
+        return await self.collection.find({"status": status} if status else {}).to_list()
+
+
+class MongoPortfolioRepository(PortfolioRepository):
+
+    def __init__(self, db):
+        self.collection = db['Portfolio']
+
+    async def apply(self, customer_id, transactions, session=None):
+
+        changes = portfolio_changes(transactions)
+        update = {"$inc": {"invested": changes["invested"], "opens": changes["opens"], "closes": changes["closes"]}}
+
+        if changes["opened"]:
+            update["$set"] = {f"funds.{fund_id}": position for fund_id, position in changes["opened"].items()}
+        if changes["closed"]:
+            update["$unset"] = {f"funds.{fund_id}": "" for fund_id in changes["closed"]}
+        if changes["updated_at"]:
+            update["$max"] = {"updated_at": changes["updated_at"]}
+
+        await self.collection.update_one({"_id": customer_id}, update, upsert=True, session=session)
+
+    async def get(self, customer_id):
+        return await self.collection.find_one({"_id": customer_id})
+
+    async def replace(self, portfolio, previous):
+
+        if previous is None:
+            try:
+                await self.collection.insert_one(portfolio)
+                return True
+            except DuplicateKeyError:
+                return False
+
+        # every apply() bumps opens or closes, so unchanged counts mean no write in between
+        result = await self.collection.replace_one(
+            {"_id": portfolio["_id"], "opens": previous["opens"], "closes": previous["closes"]}, portfolio
+        )
+        return result.matched_count == 1
+
+
+class MongoIdempotencyRepository(IdempotencyRepository):
+    """Records expire through the TTL index on expires_at; reads skip those the TTL monitor has not removed yet."""
+
+    def __init__(self, db):
+        self.collection = db['IdempotencyKey']
+
+    async def get(self, key, now):
+        return await self.collection.find_one({"_id": key, "expires_at": {"$gt": now}})
+
+    async def claim(self, key, fingerprint, now, locked_until, expires_at):
+
+        record = {"fingerprint": fingerprint, "status": "pending", "locked_until": locked_until, "expires_at": expires_at}
+
+        try:
+            await self.collection.insert_one({"_id": key, **record})
+            return True
+        except DuplicateKeyError:
+            pass
+
+        # the holder died mid-request, or the record expired before the TTL monitor removed it
+        result = await self.collection.update_one(
+            {"_id": key, "$or": [{"status": "pending", "locked_until": {"$lt": now}}, {"expires_at": {"$lte": now}}]},
+            {"$set": record, "$unset": {"response": ""}}
+        )
+        return result.modified_count == 1
+
+    async def complete(self, key, response):
+        await self.collection.update_one({"_id": key}, {"$set": {"status": "completed", "response": response}})
+
+    async def release(self, key):
+        await self.collection.delete_one({"_id": key, "status": "pending"})
+
+
+class MongoStorage(Storage):
+    """Repositories backed by MongoDB through Motor.
+
+    The client is created by connect(), from the application lifespan, and
+    closed by close(); the repositories exist once connected.
+    """
+
+    def __init__(self, db_name=MONGO_DB_NAME):
+
+        self.db_name = db_name
+        self.db = None
+
+    async def connect(self):
+
+        if self.client is not None:
+            return
+
+        self.client = create_client()
+        self.db = db = self.client[self.db_name]
+        self.users = MongoUserRepository(db)
+        self.funds = MongoFundRepository(db)
+        self.subscriptions = MongoSubscriptionRepository(db)
+        self.transactions = MongoTransactionRepository(db, TransactionArchive(TRANSACTION_ARCHIVE_DIR))
+        self.outbox = MongoOutboxRepository(db)
+        self.portfolios = MongoPortfolioRepository(db)
+        self.idempotency = MongoIdempotencyRepository(db)
+
+    async def close(self):
+
+        if self.client is not None:
+            self.client.close()
+            self.client = self.db = None
+
+    def health(self):
+        """Not ready when disconnected, when every pooled connection is busy with
+        checkouts queued behind them, or when recent checkouts wait too long."""
+
+        if self.client is None:
+            return {"ready": False, "reason": "not connected"}
+
+        pool = pool_monitor.stats()
+
+        if pool["waiting"] and pool["checked_out"] >= pool["max_pool_size"]:
+            return {"ready": False, "reason": "connection pool saturated", "pool": pool}
+
+        if pool["checkout_wait_p99_ms"] > READY_MAX_CHECKOUT_WAIT_MS:
+            return {"ready": False, "reason": "slow connection checkout", "pool": pool}
+
+        return {"ready": True, "pool": pool}
+
+    async def ensure_indexes(self):
+        await ensure_indexes(self.db)
+
+    async def check_query_plans(self):
+        return await check_query_plans(self.db)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Multi-document transaction when MONGO_TRANSACTIONS is set (requires a replica set)."""
+
+        if not MONGO_TRANSACTIONS:
+            yield None
+            return
+
+        async with await self.client.start_session() as session:
+            async with session.start_transaction():
+                yield session
+
+    async def reset(self):
+
+        await self.connect()
+
+        for name in COLLECTIONS + tuple(await bucket_collections(self.db, "Transaction")):
+            await self.db[name].drop()
+
+        self.transactions = MongoTransactionRepository(self.db, self.transactions.archive)
+        await self.ensure_indexes()
@@ -0,0 +1,310 @@
+import asyncio
+import datetime
+from bson import ObjectId
+from fastapi import HTTPException, status
+from app.config import logging
+from app.storage import storage, DuplicateError
+from app.models import User, FundResponse, BatchOperation, BatchOperationResult, BatchResponse
+from app.auth import invalidate_user
+from app.catalog import fund_catalog
+
+logger = logging.getLogger(__name__)
+
+# How long a batch holds the subscriptions it cancels; the claims of a worker
+# that died mid-batch can be taken over after this
+CLAIM_SECONDS = 60
+
+
+async def _run(operation):
+    """Run `operation(session)` inside a storage transaction when available.
+
+    Without one `session` is None and the operation undoes its own earlier
+    writes when a later step fails.
+    """
+
+    async with storage.transaction() as session:
+        return await operation(session)
+
+
+async def _get_fund(fund_id: str):
+
+    fund = await fund_catalog.get(fund_id)
+
+    if not fund:
+        logger.warning("Fund %s not found", fund_id)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Fund not found")
+
+    return fund
+
+
+def _denormalized(user: User, fund: dict):
+    """Names copied into each Transaction so the report needs no joins."""
+
+    return {
+        "customerName": user.name,
+        "fundName": fund['name'],
+        "fundCategory": fund['category']
+    }
+
+
+async def subscribe(user: User, fund_id: str) -> FundResponse:
+    """Subscribe `user` to a fund, charging its minimum fee.
+
+    The unique (user_id, fund_id) index rejects duplicate subscriptions
+    before anything is charged, then the balance is checked and debited in
+    one conditional update, so concurrent subscribes cannot overdraw it. The
+    ledger entry is then folded into the customer's portfolio summary.
+    """
+
+    fund = await _get_fund(fund_id)
+    fee = fund['minimumFee']
+
+    async def operation(session):
+
+        now = datetime.datetime.now()
+
+        try:
+            await storage.subscriptions.insert(user.id, fund_id, now, session=session)
+        except DuplicateError:
+            logger.warning("User %s is already subscribed to fund %s", user.email, fund['name'])
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Already subscribed to this fund")
+
+        charged = False
+
+        try:
+            balance = await storage.users.update_balance(user.id, -fee, minimum=fee, session=session)
+
+            if balance is None:
+                logger.warning("User %s has insufficient funds to subscribe to %s", user.email, fund['name'])
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Not enough money to subscribe to the investment fund {fund['name']}")
+            charged = True
+
+            transaction = {
+                "customer_id": user.id,
+                "fund_id": fund_id,
+                "type": "Open",
+                "amount": fee,
+                "timestamp": now,
+                **_denormalized(user, fund)
+            }
+
+            await storage.transactions.insert(transaction, session=session)
+        except Exception:
+            if session is None:
+                if charged:
+                    await storage.users.update_balance(user.id, fee)
+                await storage.subscriptions.delete(user.id, fund_id, now)
+            raise
+
+        # the ledger is written; a missed portfolio update is repaired by app.portfolios
+        await storage.portfolios.apply(user.id, [transaction], session=session)
+
+        return balance
+
+    try:
+        balance = await _run(operation)
+    finally:
+        invalidate_user(user.email)
+
+    logger.info("User %s subscribed to fund %s, balance %s", user.email, fund_id, balance)
+    return FundResponse(message=f"Subscribed to {fund['name']}.", fund_id=fund_id, current_balance=balance)
+
+
+async def cancel(user: User, fund_id: str) -> FundResponse:
+    """Cancel a subscription and refund its minimum fee.
+
+    Deleting the subscription is what claims the refund, so two concurrent
+    cancels cannot both credit the balance.
+    """
+
+    fund = await _get_fund(fund_id)
+    fee = fund['minimumFee']
+
+    async def operation(session):
+
+        now = datetime.datetime.now()
+
+        if not await storage.subscriptions.delete(user.id, fund_id, now, session=session):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Subscription not found")
+
+        balance = None
+
+        try:
+            balance = await storage.users.update_balance(user.id, fee, session=session)
+
+            transaction = {
+                "customer_id": user.id,
+                "fund_id": fund_id,
+                "type": "Close",
+                "amount": -fee,
+                "timestamp": now,
+                **_denormalized(user, fund)
+            }
+
+            await storage.transactions.insert(transaction, session=session)
+        except Exception:
+            if session is None:
+                if balance is not None:
+                    await storage.users.update_balance(user.id, -fee)
+                # restored with the time of the failed cancel; the original date is not kept
+                try:
+                    await storage.subscriptions.insert(user.id, fund_id, now)
+                except DuplicateError:
+                    pass  # subscribed again meanwhile
+            raise
+
+        # the ledger is written; a missed portfolio update is repaired by app.portfolios
+        await storage.portfolios.apply(user.id, [transaction], session=session)
+
+        return balance
+
+    try:
+        balance = await _run(operation)
+    finally:
+        invalidate_user(user.email)
+
+    logger.info("User %s cancelled fund %s, balance %s", user.email, fund_id, balance)
+    return FundResponse(message=f"Cancelled subscription to {fund['name']}.", fund_id=fund_id, current_balance=balance)
+
+
+def _required_balance(accepted):
+    """Smallest starting balance that keeps every subscribe in `accepted` affordable."""
+
+    required, delta = 0.0, 0.0
+
+    for op, fund in accepted:
+        if op.action == "subscribe":
+            required = max(required, fund['minimumFee'] - delta)
+            delta -= fund['minimumFee']
+        else:
+            delta += fund['minimumFee']
+
+    return required, delta
+
+
+async def apply_batch(user: User, operations: list[BatchOperation]) -> BatchResponse:
+    """Apply several subscribes/cancels for one user with one write per collection.
+
+    Operations are validated in order against a single snapshot of the
+    balance and subscriptions; rejected ones are reported and skipped. The
+    accepted ones are written with one write_batch on the subscriptions
+    (a single bulk_write on MongoDB), one conditional balance update, one
+    insert_many on the transactions and one portfolio update. Cancels first
+    mark their subscription with the batch id, so writes lost to concurrent
+    requests are identified exactly (409) and, without transactions, the
+    batch's earlier writes are undone if a step before the ledger write fails.
+    Claims expire after CLAIM_SECONDS in case the worker dies mid-batch.
+    """
+
+    fund_ids = [op.fund_id for op in operations]
+
+    snapshot, subscribed = await asyncio.gather(
+        storage.users.find_by_id(user.id),
+        storage.subscriptions.find_fund_ids(user.id, fund_ids)
+    )
+
+    balance = snapshot["balance"]
+    results, accepted, seen = [], {}, set()
+
+    for index, op in enumerate(operations):
+
+        fund = await fund_catalog.get(op.fund_id)
+        subscribing = op.action == "subscribe"
+
+        if op.fund_id in seen:
+            status_code, detail = status.HTTP_400_BAD_REQUEST, "Fund appears more than once in the batch"
+        elif not fund:
+            status_code, detail = status.HTTP_404_NOT_FOUND, "Fund not found"
+        elif subscribing and op.fund_id in subscribed:
+            status_code, detail = status.HTTP_400_BAD_REQUEST, "Already subscribed to this fund"
+        elif subscribing and balance < fund['minimumFee']:
+            status_code, detail = status.HTTP_400_BAD_REQUEST, f"Not enough money to subscribe to the investment fund {fund['name']}"
+        elif not subscribing and op.fund_id not in subscribed:
+            status_code, detail = status.HTTP_404_NOT_FOUND, "Subscription not found"
+        elif subscribing:
+            status_code, detail = status.HTTP_201_CREATED, f"Subscribed to {fund['name']}."
+            balance -= fund['minimumFee']
+            accepted[index] = (op, fund)
+        else:
+            status_code, detail = status.HTTP_200_OK, f"Cancelled subscription to {fund['name']}."
+            balance += fund['minimumFee']
+            accepted[index] = (op, fund)
+
+        seen.add(op.fund_id)
+        results.append(BatchOperationResult(action=op.action, fund_id=op.fund_id, status_code=status_code, detail=detail))
+
+    if not accepted:
+        return BatchResponse(results=results, current_balance=snapshot["balance"])
+
+    conflict = HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Subscriptions or balance changed concurrently, retry the batch")
+    batch_id = ObjectId()
+    indexes = list(accepted)
+
+    async def operation(session):
+
+        now = datetime.datetime.now()
+        inserts = [accepted[index][0].fund_id for index in indexes if accepted[index][0].action == "subscribe"]
+        cancels = [accepted[index][0].fund_id for index in indexes if accepted[index][0].action == "cancel"]
+        locked_until = now + datetime.timedelta(seconds=CLAIM_SECONDS)
+
+        failed_inserts, claimed = await storage.subscriptions.write_batch(user.id, inserts, cancels, batch_id, now,
+                                                                          locked_until, session=session)
+        failed = {index for index, (op, _) in accepted.items()
+                  if op.fund_id in failed_inserts or (op.action == "cancel" and op.fund_id not in claimed)}
+
+        if failed and session is not None:
+            raise conflict
+
+        applied = [(index, accepted[index]) for index in indexes if index not in failed]
+        required, delta = _required_balance([pair for _, pair in applied])
+
+        balance = None
+        charged = written = False
+
+        try:
+            if applied:
+                balance = await storage.users.update_balance(user.id, delta, minimum=required, session=session)
+                if balance is None:
+                    raise conflict
+                charged = True
+
+                transactions = [{
+                    "customer_id": user.id,
+                    "fund_id": op.fund_id,
+                    "type": "Open" if op.action == "subscribe" else "Close",
+                    "amount": fund['minimumFee'] if op.action == "subscribe" else -fund['minimumFee'],
+                    "timestamp": now,
+                    **_denormalized(user, fund)
+                } for _, (op, fund) in applied]
+
+                await storage.transactions.insert_many(transactions, session=session)
+                written = True
+
+            # right after the ledger write: a claim left to expire would let the cancels be refunded again
+            if cancels:
+                await storage.subscriptions.delete_claimed(batch_id, session=session)
+
+            if applied:
+                await storage.portfolios.apply(user.id, transactions, session=session)
+        except Exception:
+            if session is None and not written:
+                if charged:
+                    await storage.users.update_balance(user.id, -delta)
+                await storage.subscriptions.release_batch(user.id, [fund_id for fund_id in inserts if fund_id not in failed_inserts],
+                                                          list(claimed), batch_id)
+            raise
+
+        for index in failed:
+            results[index] = BatchOperationResult(action=results[index].action, fund_id=results[index].fund_id,
+                                                  status_code=status.HTTP_409_CONFLICT, detail="Changed concurrently, retry this operation")
+
+        return balance if balance is not None else snapshot["balance"]
+
+    try:
+        current_balance = await _run(operation)
+    finally:
+        invalidate_user(user.email)
+
+    logger.info("User %s applied batch of %s operations, balance %s", user.email, len(operations), current_balance)
+    return BatchResponse(results=results, current_balance=current_balance)
+
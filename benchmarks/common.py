@@ -0,0 +1,33 @@
+import os
+
+# Benchmarks seed and drop data; keep them away from the application database.
+os.environ.setdefault("MONGO_DB_NAME", "BTG_BENCH")
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples."""
+
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    """p50/p95/p99/max of latency samples in milliseconds."""
+
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+        "max_ms": round(max(samples), 3),
+    }
+
+
+async def mongo_db():
+    """Connect the storage layer and return its Motor database, for the MongoDB-only benchmarks."""
+
+    from app.storage import storage
+
+    await storage.connect()
+    return storage.db
@@ -0,0 +1,130 @@
+"""Serialization cost of the list endpoints for 1k and 100k rows.
+
+Compares, for TransactionDetails and InvestmentFund rows as the storage layer
+returns them:
+
+    jsonable_encoder   FastAPI's generic encoder followed by json.dumps
+    response_model     pydantic validation of every row, then dump_json
+    fast path          app.serialization.dumps (orjson, no validation)
+
+then times GET /funds/list (served from the catalog's pre-serialized body) and
+GET /funds/transactions?limit=1000 end to end. Uses the in-memory storage engine
+unless STORAGE_BACKEND is set:
+
+    python -m benchmarks.list_serialization --sizes 1000 100000
+"""
+import os
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import time
+from typing import List
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from benchmarks.common import summarize
+from httpx import ASGITransport, AsyncClient
+from app.main import app
+from app.models import InvestmentFund, TransactionDetails
+from app.serialization import dumps
+from app.storage import storage
+from app.catalog import fund_catalog
+from app.auth import create_access_token
+
+EMAIL = "bench-lists@example.com"
+
+
+def transaction_rows(size):
+
+    start = datetime.datetime(2020, 1, 1)
+    return [
+        {"_id": ObjectId(), "customerId": "customer", "customerName": "Bench Customer", "amount": 50.0,
+         "type": "Open", "fundName": "Bench Fund", "fundCategory": "FIC", "timestamp": start + datetime.timedelta(seconds=i)}
+        for i in range(size)
+    ]
+
+
+def fund_rows(size):
+
+    return [{"_id": ObjectId(), "name": f"Fund {i}", "minimumFee": 50.0, "category": "FIC"} for i in range(size)]
+
+
+def timed(function, repeat):
+    """Latencies in ms of `repeat` calls."""
+
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def compare(name, model, rows, repeat):
+
+    adapter = TypeAdapter(List[model])
+    encoders = {
+        "jsonable_encoder": lambda: json.dumps(jsonable_encoder(rows, custom_encoder={ObjectId: str})).encode(),
+        "response_model": lambda: adapter.dump_json(adapter.validate_python(rows), by_alias=True),
+        "fast path": lambda: dumps(rows),
+    }
+
+    for encoder, function in encoders.items():
+        print(f"{name} rows={len(rows)} {encoder:>16}: {summarize(timed(function, repeat))}")
+
+
+async def endpoints(sizes, repeat):
+
+    await storage.reset()
+    await storage.users.insert({"name": "Bench User", "email": EMAIL, "hashed_password": "x", "balance": 500.0,
+                                "notification_channel": "Email", "roles": ["Customer"]})
+    user = await storage.users.find_by_email(EMAIL)
+    await storage.transactions.insert_many([
+        {"customer_id": str(user["_id"]), "fund_id": "fund", "type": "Open", "amount": 50.0, "timestamp": row["timestamp"],
+         "customerName": row["customerName"], "fundName": row["fundName"], "fundCategory": row["fundCategory"]}
+        for row in transaction_rows(1000)
+    ])
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': EMAIL})}"}
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as ac:
+
+        for size in sizes:
+            await storage.funds.insert_many(fund_rows(size - len(await storage.funds.find_all())))
+            started = time.perf_counter()
+            await fund_catalog.invalidate()
+            print(f"catalog load with {size} funds: {(time.perf_counter() - started) * 1000:.1f}ms")
+
+            latencies = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                await ac.get("/funds/list", headers=headers)
+                latencies.append((time.perf_counter() - started) * 1000)
+            print(f"GET /funds/list funds={size}: {summarize(latencies)}")
+
+        latencies = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            await ac.get("/funds/transactions", params={"limit": 1000}, headers=headers)
+            latencies.append((time.perf_counter() - started) * 1000)
+        print(f"GET /funds/transactions limit=1000: {summarize(latencies)}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    for size in args.sizes:
+        compare("TransactionDetails", TransactionDetails, transaction_rows(size), args.repeat)
+        compare("InvestmentFund", InvestmentFund, fund_rows(size), args.repeat)
+
+    asyncio.run(endpoints(args.sizes, args.repeat))
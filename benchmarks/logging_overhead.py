@@ -0,0 +1,109 @@
+"""Per-request cost of logging on /funds/list.
+
+Runs the same authenticated requests through the in-process ASGI app under each
+logging setup and reports the latency added over running with logging off:
+
+    off          root level CRITICAL, nothing is written
+    sync-text    the old setup: text lines written by a StreamHandler on the event loop
+    queue-json   JSON lines formatted and written by the QueueListener thread
+    sampled      queue-json keeping LOG_SAMPLE_RATE (--sample-rate) of per-request INFO lines
+
+Log lines go to --log-file (a temporary file by default) so terminal speed does not
+skew the numbers; the client's own httpx lines are silenced. Uses the in-memory storage
+engine unless STORAGE_BACKEND is set:
+
+    python -m benchmarks.logging_overhead --requests 5000
+"""
+import os
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+from benchmarks.common import summarize
+from httpx import ASGITransport, AsyncClient
+from app.main import app
+from app.storage import storage
+from app.auth import create_access_token
+from app.config import LOG_LEVEL, LOG_FORMAT, LOG_LEVELS, LOG_SAMPLE_RATE
+from app.logs import configure_logging, stop_logging
+
+EMAIL = "bench-logging@example.com"
+SETUPS = ("off", "sync-text", "queue-json", "sampled")
+
+
+def use(setup, stream, sample_rate):
+    """Switch the root logger to one of SETUPS, writing to `stream`."""
+
+    stop_logging()
+    root = logging.getLogger()
+
+    if setup == "off":
+        root.handlers = []
+        root.setLevel(logging.CRITICAL)
+    elif setup == "sync-text":
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+        root.handlers = [handler]
+        root.setLevel(logging.INFO)
+    else:
+        configure_logging("INFO", "json", sample_rate=sample_rate if setup == "sampled" else 1.0, stream=stream)
+
+
+async def run(ac, token, requests):
+    """Latencies in ms of `requests` sequential /funds/list calls."""
+
+    latencies = []
+    headers = {"Authorization": f"Bearer {token}"}
+
+    for _ in range(requests):
+        started = time.perf_counter()
+        await ac.get("/funds/list", headers=headers)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    return latencies
+
+
+async def main(requests, sample_rate, log_file):
+
+    await storage.reset()
+    await storage.users.insert({"name": "Bench User", "email": EMAIL, "hashed_password": "x", "balance": 500.0,
+                                "notification_channel": "Email", "roles": ["Customer"]})
+    token = create_access_token(data={"sub": EMAIL})
+    results = {}
+
+    with open(log_file, "a") as stream:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as ac:
+
+            use("off", stream, sample_rate)
+            await run(ac, token, min(requests, 200))
+
+            for setup in SETUPS:
+                use(setup, stream, sample_rate)
+                logging.getLogger("httpx").setLevel(logging.WARNING)
+                results[setup] = await run(ac, token, requests)
+
+        stop_logging()
+
+    configure_logging(LOG_LEVEL, LOG_FORMAT, LOG_LEVELS, LOG_SAMPLE_RATE)
+
+    baseline = sum(results["off"]) / requests
+    print(f"requests={requests} sample_rate={sample_rate} log_file={log_file}")
+
+    for setup, latencies in results.items():
+        overhead = (sum(latencies) / requests - baseline) * 1000
+        print(f"{setup:>10}: {summarize(latencies)} overhead={overhead:.1f}us/request")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--sample-rate", type=float, default=0.01)
+    parser.add_argument("--log-file", default=os.path.join(tempfile.gettempdir(), "btg-logging-bench.log"))
+    args = parser.parse_args()
+
+    asyncio.run(main(args.requests, args.sample_rate, args.log_file))
@@ -0,0 +1,84 @@
+"""p99 latency of /funds/list while /auth/login is under load.
+
+Needs a live MongoDB (MONGO_URI; data goes to MONGO_DB_NAME, default BTG_BENCH). Run it once with the old
+behaviour (bcrypt on the event loop) and once with the executor:
+
+    HASH_EXECUTOR=inline python -m benchmarks.login_contention
+    HASH_EXECUTOR=thread python -m benchmarks.login_contention
+"""
+import argparse
+import asyncio
+import time
+from benchmarks.common import summarize, mongo_db
+from httpx import ASGITransport, AsyncClient
+from app.main import app
+from app.hashing import hashing_pool
+
+EMAIL = "bench-login@example.com"
+PASSWORD = "benchpassword"
+
+
+async def login_storm(ac, logins, concurrency):
+    """Keep `concurrency` logins in flight until `logins` have completed."""
+
+    remaining = logins
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            await ac.post("/auth/login", data={"username": EMAIL, "password": PASSWORD})
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def list_reads(ac, token, stop):
+    """Call /funds/list back to back until `stop` is set, returning latencies in ms."""
+
+    latencies = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await ac.get("/funds/list", headers={"Authorization": f"Bearer {token}"})
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+async def main(logins, concurrency):
+
+    db = await mongo_db()
+
+    await db['User'].delete_many({"email": EMAIL})
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as ac:
+
+        await ac.post("/auth/register", json={"email": EMAIL, "password": PASSWORD, "name": "Bench User"})
+        response = await ac.post("/auth/login", data={"username": EMAIL, "password": PASSWORD})
+        token = response.json()["access_token"]
+
+        stop = asyncio.Event()
+        reader = asyncio.create_task(list_reads(ac, token, stop))
+
+        started = time.perf_counter()
+        await login_storm(ac, logins, concurrency)
+        elapsed = time.perf_counter() - started
+
+        stop.set()
+        latencies = await reader
+
+    await db['User'].delete_many({"email": EMAIL})
+
+    print(f"executor={hashing_pool.kind} logins={logins} concurrency={concurrency} elapsed={elapsed:.2f}s")
+    print(f"/funds/list latency: {summarize(latencies)}")
+    print(f"hashing stats: {hashing_pool.stats()}")
+
+    hashing_pool.shutdown()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.logins, args.concurrency))
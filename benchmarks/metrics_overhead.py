@@ -0,0 +1,82 @@
+"""Per-request cost of the metrics middleware on /funds/list.
+
+Sends the same authenticated requests through the in-process ASGI app with and
+without MetricsMiddleware and reports the latency it adds. Uses the in-memory
+storage engine unless STORAGE_BACKEND is set:
+
+    python -m benchmarks.metrics_overhead --requests 5000
+"""
+import os
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ["METRICS_ENABLED"] = "false"
+
+import argparse
+import asyncio
+import logging
+import time
+from benchmarks.common import summarize
+from httpx import ASGITransport, AsyncClient
+from app.main import app
+from app.metrics import MetricsMiddleware, registry
+from app.storage import storage
+from app.auth import create_access_token
+
+EMAIL = "bench-metrics@example.com"
+
+
+async def run(asgi_app, token, requests):
+    """Latencies in ms of `requests` sequential /funds/list calls."""
+
+    latencies = []
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async with AsyncClient(transport=ASGITransport(app=asgi_app), base_url="http://bench") as ac:
+        for _ in range(requests):
+            started = time.perf_counter()
+            await ac.get("/funds/list", headers=headers)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    return latencies
+
+
+async def main(requests, rounds):
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    await storage.reset()
+    await storage.users.insert({"name": "Bench User", "email": EMAIL, "hashed_password": "x", "balance": 500.0,
+                                "notification_channel": "Email", "roles": ["Customer"]})
+    token = create_access_token(data={"sub": EMAIL})
+    instrumented = MetricsMiddleware(app)
+    results = {"plain": [], "metrics": []}
+
+    await run(app, token, min(requests, 200))
+
+    # Alternate the two setups so drift (GC, CPU frequency) hits both equally
+    for _ in range(rounds):
+        results["plain"] += await run(app, token, requests // rounds)
+        results["metrics"] += await run(instrumented, token, requests // rounds)
+
+    render_started = time.perf_counter()
+    registry.render()
+    render_ms = (time.perf_counter() - render_started) * 1000
+
+    baseline = sum(results["plain"]) / len(results["plain"])
+    print(f"requests={requests} rounds={rounds}")
+
+    for setup, latencies in results.items():
+        overhead = (sum(latencies) / len(latencies) - baseline) * 1000
+        print(f"{setup:>8}: {summarize(latencies)} overhead={overhead:.1f}us/request")
+
+    print(f"/metrics render: {render_ms:.2f}ms")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.requests, args.rounds))
@@ -0,0 +1,88 @@
+"""Import time of app.main and time to the first successful request.
+
+Imports app.main in fresh interpreters with `python -X importtime`, reporting the
+median cumulative time and the modules with the largest self time. Then starts
+uvicorn in a subprocess and measures the time from launch until GET /health/ready
+returns 200 (imports, lifespan and the first request). Exits non-zero when either
+median exceeds its budget, so it can gate changes that add import-time work.
+Uses the in-memory storage engine unless STORAGE_BACKEND is set:
+
+    python -m benchmarks.startup_time --budget-ms 1500 --ready-budget-ms 3000
+    STORAGE_BACKEND=mongo python -m benchmarks.startup_time
+"""
+import os
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+import httpx
+
+PORT = 8767
+MODULE = "app.main"
+
+
+def import_times():
+    """{module: (self us, cumulative us)} from one `-X importtime` run."""
+
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {MODULE}"],
+                            capture_output=True, text=True, check=True)
+    times = {}
+
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(own), int(cumulative))
+
+    return times
+
+
+def ready_time():
+    """Seconds from launching uvicorn until /health/ready answers 200."""
+
+    env = dict(os.environ, LOG_LEVEL="WARNING")
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", f"{MODULE}:app", "--port", str(PORT)], env=env)
+
+    try:
+        while time.perf_counter() - started < 30:
+            try:
+                if httpx.get(f"http://127.0.0.1:{PORT}/health/ready").status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError("server did not become ready")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="modules with the largest self time to list")
+    parser.add_argument("--budget-ms", type=float, default=1500, help="median import time of app.main")
+    parser.add_argument("--ready-budget-ms", type=float, default=3000, help="median time to the first ready response")
+    args = parser.parse_args()
+
+    runs = [import_times() for _ in range(args.repeat)]
+    imported = statistics.median(run[MODULE][1] for run in runs) / 1000
+
+    print(f"import {MODULE}: {imported:.1f}ms (median of {args.repeat}, budget {args.budget_ms:.0f}ms)")
+    for name, (own, _) in sorted(runs[-1].items(), key=lambda item: item[1][0], reverse=True)[:args.top]:
+        print(f"  {own / 1000:8.1f}ms  {name}")
+
+    ready = statistics.median(ready_time() for _ in range(args.repeat)) * 1000
+    print(f"launch to first ready response: {ready:.1f}ms (median of {args.repeat}, budget {args.ready_budget_ms:.0f}ms)")
+
+    over = [label for label, value, budget in [("import", imported, args.budget_ms), ("ready", ready, args.ready_budget_ms)]
+            if value > budget]
+    if over:
+        print(f"over budget: {', '.join(over)}")
+        raise SystemExit(1)
@@ -0,0 +1,217 @@
+"""Mixed-workload load test of the API with per-route throughput and tail latency.
+
+Seeds users, funds and transactions, then drives concurrent workloads through the
+in-process ASGI app (login storms, subscribe/cancel churn, report reads) for a fixed
+duration. Results are printed and saved as JSON; pass --baseline to compare against a
+previous run and fail on regressions. Runs against MongoDB (MONGO_URI; data goes to
+MONGO_DB_NAME, default BTG_BENCH) or, with STORAGE_BACKEND=memory, the in-memory engine:
+
+    python -m benchmarks.suite --output baseline.json
+    python -m benchmarks.suite --baseline baseline.json --output current.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import platform
+import random
+import sys
+import time
+from benchmarks.common import summarize
+from bson import ObjectId
+from httpx import ASGITransport, AsyncClient
+from app.main import app
+from app.storage import storage
+from app.auth import create_access_token
+from app.hashing import get_password_hash
+
+PASSWORD = "benchpassword"
+BATCH = 10000
+
+
+class Recorder:
+    """Latency samples and error counts per route template."""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    async def call(self, route, request):
+
+        started = time.perf_counter()
+        response = await request
+        self.samples.setdefault(route, []).append((time.perf_counter() - started) * 1000)
+
+        if response.status_code >= 500:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+        return response
+
+    def report(self, elapsed):
+
+        return {
+            route: {**summarize(samples), "errors": self.errors.get(route, 0), "rps": round(len(samples) / elapsed, 1)}
+            for route, samples in sorted(self.samples.items())
+        }
+
+
+async def seed(users, funds, transactions):
+    """Insert the data set directly and return (emails, tokens, fund ids)."""
+
+    await storage.reset()
+
+    hashed = get_password_hash(PASSWORD)
+    user_ids = [ObjectId() for _ in range(users)]
+    emails = [f"bench{i}@example.com" for i in range(users)]
+    fund_ids = [ObjectId() for _ in range(funds)]
+
+    await storage.users.insert_many([
+        {"_id": _id, "name": f"Bench {i}", "email": emails[i], "hashed_password": hashed,
+         "balance": 1e9, "notification_channel": "Email", "roles": ["Customer"]}
+        for i, _id in enumerate(user_ids)
+    ])
+    await storage.funds.insert_many([
+        {"_id": _id, "name": f"Fund {i}", "minimumFee": 50, "category": "FIC"} for i, _id in enumerate(fund_ids)
+    ])
+
+    start = datetime.datetime(2020, 1, 1)
+    for offset in range(0, transactions, BATCH):
+        await storage.transactions.insert_many([
+            {
+                "customer_id": str(random.choice(user_ids)),
+                "fund_id": str(random.choice(fund_ids)),
+                "type": "Open",
+                "amount": 50,
+                "timestamp": start + datetime.timedelta(seconds=offset + i),
+                "customerName": "Bench",
+                "fundName": "Fund",
+                "fundCategory": "FIC",
+            }
+            for i in range(min(BATCH, transactions - offset))
+        ])
+
+    tokens = [create_access_token(data={"sub": email}) for email in emails]
+    return emails, tokens, [str(_id) for _id in fund_ids]
+
+
+def workloads(emails, tokens, fund_ids):
+    """Workload name -> coroutine function(client, recorder) doing one iteration."""
+
+    def auth(index):
+        return {"Authorization": f"Bearer {tokens[index]}"}
+
+    async def login(ac, recorder):
+        await recorder.call("POST /auth/login",
+                            ac.post("/auth/login", data={"username": random.choice(emails), "password": PASSWORD}))
+
+    async def churn(ac, recorder):
+        index = random.randrange(len(tokens))
+        fund_id = random.choice(fund_ids)
+        await recorder.call("POST /funds/subscribe/{fund_id}", ac.post(f"/funds/subscribe/{fund_id}", headers=auth(index)))
+        await recorder.call("POST /funds/cancel/{fund_id}", ac.post(f"/funds/cancel/{fund_id}", headers=auth(index)))
+
+    async def reports(ac, recorder):
+        index = random.randrange(len(tokens))
+        await recorder.call("GET /funds/transactions", ac.get("/funds/transactions", headers=auth(index)))
+        await recorder.call("GET /funds/list", ac.get("/funds/list", headers=auth(index)))
+
+    return {"login": login, "churn": churn, "reports": reports}
+
+
+async def drive(iteration, ac, recorder, deadline):
+
+    while time.perf_counter() < deadline:
+        await iteration(ac, recorder)
+
+
+async def run(args):
+
+    print(f"Seeding {args.users} users, {args.funds} funds, {args.transactions} transactions...")
+    emails, tokens, fund_ids = await seed(args.users, args.funds, args.transactions)
+    available = workloads(emails, tokens, fund_ids)
+    recorder = Recorder()
+
+    async with app.router.lifespan_context(app):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as ac:
+
+            started = time.perf_counter()
+            deadline = started + args.duration
+            await asyncio.gather(*(
+                drive(available[name], ac, recorder, deadline)
+                for name, concurrency in args.workload.items() for _ in range(concurrency)
+            ))
+            elapsed = time.perf_counter() - started
+
+    return {
+        "config": {
+            "users": args.users, "funds": args.funds, "transactions": args.transactions,
+            "duration": args.duration, "workload": args.workload,
+            "python": platform.python_version(), "machine": platform.machine(),
+        },
+        "started_at": datetime.datetime.now().isoformat(),
+        "routes": recorder.report(elapsed),
+    }
+
+
+def compare(current, baseline, tolerance):
+    """Print per-route changes and return the routes that regressed beyond `tolerance`."""
+
+    regressions = []
+
+    for route, now in current["routes"].items():
+        before = baseline["routes"].get(route)
+        if before is None:
+            continue
+
+        p99_change = now["p99_ms"] / before["p99_ms"] - 1 if before["p99_ms"] else 0.0
+        rps_change = now["rps"] / before["rps"] - 1 if before["rps"] else 0.0
+        print(f"{route:40} p99 {before['p99_ms']:9.1f} -> {now['p99_ms']:9.1f}ms ({p99_change:+.0%})  "
+              f"rps {before['rps']:8.1f} -> {now['rps']:8.1f} ({rps_change:+.0%})")
+
+        if p99_change > tolerance or rps_change < -tolerance:
+            regressions.append(route)
+
+    return regressions
+
+
+def parse_workload(values):
+
+    workload = {}
+    for value in values:
+        name, _, concurrency = value.partition("=")
+        workload[name] = int(concurrency or 1)
+    return workload
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--funds", type=int, default=20)
+    parser.add_argument("--transactions", type=int, default=100000)
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run the workloads")
+    parser.add_argument("--workload", nargs="+", default=["login=2", "churn=8", "reports=8"],
+                        help="name=concurrency for each of: login, churn, reports")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed p99/rps regression, e.g. 0.10 for 10%%")
+    args = parser.parse_args()
+    args.workload = parse_workload(args.workload)
+
+    unknown = set(args.workload) - {"login", "churn", "reports"}
+    if unknown:
+        parser.error(f"unknown workload: {', '.join(sorted(unknown))}")
+
+    results = asyncio.run(run(args))
+    print(json.dumps(results["routes"], indent=2))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            print(f"Regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,106 @@
+"""Database reads saved by single-flight coalescing under a thundering herd.
+
+Each round sends --concurrency simultaneous GET /funds/list requests with a token
+the server has not seen, right after the fund catalog's refresh interval ran out:
+every request misses the principal cache (User read) and wants a catalog version
+check. Runs the rounds with app.singleflight disabled and enabled and counts the
+reads that reach storage. Uses the in-memory storage engine, with --latency-ms
+added to each read so requests overlap the way they do on MongoDB, unless
+STORAGE_BACKEND is set. The simulated latency does not grow with load, so on
+the memory engine only the read counts are meaningful; run it against MongoDB to
+see the effect on latency:
+
+    python -m benchmarks.thundering_herd --rounds 20 --concurrency 200
+"""
+import os
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+import argparse
+import asyncio
+import datetime
+import logging
+import time
+from benchmarks.common import summarize
+from httpx import ASGITransport, AsyncClient
+from app.main import app
+from app.storage import storage
+from app.catalog import fund_catalog
+from app.auth import create_access_token, principal_cache, user_lookups
+
+EMAIL = "bench-herd@example.com"
+
+
+def counted(reads, name, function, latency):
+    """`function` counting its calls in reads[name], after `latency` seconds."""
+
+    async def read(*args):
+        reads[name] += 1
+        if latency:
+            await asyncio.sleep(latency)
+        return await function(*args)
+
+    return read
+
+
+async def herd(ac, rounds, concurrency):
+    """Latencies in ms of every request of every round."""
+
+    latencies = []
+
+    async def get(headers):
+        started = time.perf_counter()
+        await ac.get("/funds/list", headers=headers)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    for round_ in range(rounds):
+        # a token never seen before, and a catalog due for its version check
+        token = create_access_token(data={"sub": EMAIL}, expires_delta=datetime.timedelta(minutes=30, seconds=round_))
+        headers = {"Authorization": f"Bearer {token}"}
+        principal_cache.clear()
+        fund_catalog._checked_at = 0.0
+
+        await asyncio.gather(*(get(headers) for _ in range(concurrency)))
+
+    return latencies
+
+
+async def main(rounds, concurrency, latency):
+
+    await storage.reset()
+    await storage.users.insert({"name": "Bench User", "email": EMAIL, "hashed_password": "x", "balance": 500.0,
+                                "notification_channel": "Email", "roles": ["Customer"]})
+    await storage.funds.insert_many([{"name": f"Fund {i}", "minimumFee": 50.0, "category": "FIC"} for i in range(10)])
+    await fund_catalog.invalidate()
+
+    reads = {"User": 0, "CatalogVersion": 0}
+    storage.users.find_by_email = counted(reads, "User", storage.users.find_by_email, latency)
+    storage.funds.get_version = counted(reads, "CatalogVersion", storage.funds.get_version, latency)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as ac:
+
+        for enabled in (False, True):
+            user_lookups.enabled = fund_catalog.refreshes.enabled = enabled
+            reads.update(User=0, CatalogVersion=0)
+            user_lookups.reset()
+            fund_catalog.refreshes.reset()
+
+            latencies = await herd(ac, rounds, concurrency)
+
+            print(f"single-flight {'on' if enabled else 'off'}: requests={len(latencies)} reads={reads} "
+                  f"latency={summarize(latencies)}")
+
+        print(f"coalescing: users={user_lookups.stats()} catalog={fund_catalog.refreshes.stats()}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=2 if os.environ["STORAGE_BACKEND"] == "memory" else 0)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    asyncio.run(main(args.rounds, args.concurrency, args.latency_ms / 1000))
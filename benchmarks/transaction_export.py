@@ -0,0 +1,124 @@
+"""Peak RSS and time-to-first-byte of /funds/transactions/export for a large history.
+
+Starts the API with uvicorn in a subprocess (so the response really streams and the
+server's memory can be read from /proc), seeds the transactions and downloads the export.
+Needs a live MongoDB (MONGO_URI; data goes to MONGO_DB_NAME, default BTG_BENCH) and Linux:
+
+    python -m benchmarks.transaction_export --rows 1000000 --format ndjson
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import subprocess
+import sys
+import time
+import httpx
+from benchmarks.common import percentile, mongo_db
+from app.indexes import bucket_collections
+from app.storage import storage
+
+BATCH = 10000
+PORT = 8765
+
+db = None  # bound to the Motor database in main()
+
+
+def peak_rss_mb(pid):
+    """High-water mark of the resident set of a process, from /proc."""
+
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+
+
+async def seed(rows):
+
+    for name in ["User"] + await bucket_collections(db, "Transaction"):
+        await db[name].drop()
+
+    start = datetime.datetime(2020, 1, 1)
+    for offset in range(0, rows, BATCH):
+        await storage.transactions.insert_many([
+            {
+                "customer_id": f"customer{(offset + i) % 1000}",
+                "fund_id": "000000000000000000000000",
+                "type": "Open",
+                "amount": 50,
+                "timestamp": start + datetime.timedelta(seconds=offset + i),
+                "customerName": "Bench Customer",
+                "fundName": "Bench Fund",
+                "fundCategory": "FIC",
+            }
+            for i in range(min(BATCH, rows - offset))
+        ])
+
+
+async def wait_until_up(client):
+
+    for _ in range(100):
+        try:
+            await client.get("/")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def main(rows, export_format):
+
+    global db
+    db = await mongo_db()
+
+    print(f"Seeding {rows} transactions...")
+    await seed(rows)
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT), "--log-level", "warning"],
+        env=os.environ.copy()
+    )
+
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", timeout=None) as client:
+
+            await wait_until_up(client)
+            await client.post("/auth/register", json={"email": "export-admin@example.com", "password": "benchpassword", "name": "Admin", "roles": ["Admin"]})
+            response = await client.post("/auth/login", data={"username": "export-admin@example.com", "password": "benchpassword"})
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            rss_before = peak_rss_mb(server.pid)
+            started = time.perf_counter()
+            first_byte = None
+            received = 0
+            chunk_gaps = []
+            last = started
+
+            async with client.stream("GET", "/funds/transactions/export", params={"format": export_format}, headers=headers) as response:
+                async for chunk in response.aiter_bytes():
+                    now = time.perf_counter()
+                    if first_byte is None:
+                        first_byte = now - started
+                    chunk_gaps.append((now - last) * 1000)
+                    last = now
+                    received += len(chunk)
+
+            elapsed = time.perf_counter() - started
+
+            print(f"format={export_format} rows={rows} bytes={received}")
+            print(f"time to first byte={first_byte * 1000:.1f}ms total={elapsed:.1f}s "
+                  f"throughput={rows / elapsed:.0f} rows/s p99 chunk gap={percentile(chunk_gaps, 99):.1f}ms")
+            print(f"server peak RSS before export={rss_before:.0f}MB after export={peak_rss_mb(server.pid):.0f}MB")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.rows, args.format))
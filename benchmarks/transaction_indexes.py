@@ -0,0 +1,124 @@
+"""Router queries against 1M seeded transactions, without and with the startup indexes.
+
+Transactions are written straight into their month buckets, so no index exists
+until ensure_indexes() runs; the Transaction query reads a customer's history
+through storage.transactions, across every bucket.
+
+Needs a live MongoDB (MONGO_URI; data goes to MONGO_DB_NAME, default BTG_BENCH):
+
+    python -m benchmarks.transaction_indexes --transactions 1000000
+"""
+import argparse
+import asyncio
+import datetime
+import random
+import time
+from benchmarks.common import summarize, mongo_db
+from bson import ObjectId
+from app.indexes import bucket_collections, bucket_name, ensure_indexes, check_query_plans
+from app.storage import storage
+from app.storage.base import month_of
+
+BATCH = 10000
+
+db = None  # bound to the Motor database in main()
+
+
+async def seed(customers, funds, transactions):
+    """Fill User, InvestmentFund, UserInvestmentFund and Transaction with random data."""
+
+    for name in ["User", "InvestmentFund", "UserInvestmentFund"] + await bucket_collections(db, "Transaction"):
+        await db[name].drop()
+
+    user_ids = [ObjectId() for _ in range(customers)]
+    fund_ids = [ObjectId() for _ in range(funds)]
+
+    await db['User'].insert_many([
+        {"_id": _id, "name": f"Customer {i}", "email": f"customer{i}@example.com", "hashed_password": "x", "balance": 500.0}
+        for i, _id in enumerate(user_ids)
+    ])
+    await db['InvestmentFund'].insert_many([
+        {"_id": _id, "name": f"Fund {i}", "minimumFee": 50, "category": "FIC"}
+        for i, _id in enumerate(fund_ids)
+    ])
+    await db['UserInvestmentFund'].insert_many([
+        {"user_id": str(user_id), "fund_id": str(fund_id), "subscription_date": datetime.datetime.now()}
+        for user_id in user_ids for fund_id in random.sample(fund_ids, min(3, funds))
+    ])
+
+    start = datetime.datetime(2020, 1, 1)
+    for offset in range(0, transactions, BATCH):
+        buckets = {}
+        for i in range(min(BATCH, transactions - offset)):
+            timestamp = start + datetime.timedelta(minutes=offset + i)
+            buckets.setdefault(month_of(timestamp), []).append({
+                "customer_id": str(random.choice(user_ids)),
+                "fund_id": str(random.choice(fund_ids)),
+                "type": random.choice(("Open", "Close")),
+                "amount": 50,
+                "timestamp": timestamp,
+            })
+
+        for month, documents in buckets.items():
+            await db[bucket_name("Transaction", month)].insert_many(documents, ordered=False)
+
+    return [str(_id) for _id in user_ids]
+
+
+async def measure(user_ids, repeat):
+    """Latency of each router query shape, in ms."""
+
+    results = {}
+    samples = {"User": [], "UserInvestmentFund": [], "Transaction": []}
+    users = await db['UserInvestmentFund'].find().to_list(repeat)
+
+    for subscription in users:
+        user_id = subscription["user_id"]
+
+        started = time.perf_counter()
+        await db['User'].find_one({"email": f"customer{user_ids.index(user_id)}@example.com"})
+        samples["User"].append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await db['UserInvestmentFund'].find_one({"user_id": user_id, "fund_id": subscription["fund_id"]})
+        samples["UserInvestmentFund"].append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        [transaction async for transaction in storage.transactions.stream(user_id)]
+        samples["Transaction"].append((time.perf_counter() - started) * 1000)
+
+    for name, values in samples.items():
+        results[name] = summarize(values)
+
+    return results
+
+
+async def main(customers, funds, transactions, repeat):
+
+    global db
+    db = await mongo_db()
+
+    print(f"Seeding {customers} customers, {funds} funds, {transactions} transactions...")
+    user_ids = await seed(customers, funds, transactions)
+
+    print(f"without indexes: {await measure(user_ids, repeat)}")
+    print(f"unindexed router queries: {len(await check_query_plans(db))}")
+
+    started = time.perf_counter()
+    await ensure_indexes(db)
+    print(f"index build took {time.perf_counter() - started:.1f}s")
+
+    print(f"with indexes: {await measure(user_ids, repeat)}")
+    print(f"unindexed router queries: {len(await check_query_plans(db))}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=10000)
+    parser.add_argument("--funds", type=int, default=50)
+    parser.add_argument("--transactions", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.customers, args.funds, args.transactions, args.repeat))
@@ -0,0 +1,89 @@
+"""First-page and deep-page latency of /funds/transactions for small and large histories.
+
+Needs a live MongoDB (MONGO_URI; data goes to MONGO_DB_NAME, default BTG_BENCH):
+
+    python -m benchmarks.transaction_pages --sizes 10 1000 100000
+"""
+import argparse
+import asyncio
+import datetime
+import time
+from benchmarks.common import summarize, mongo_db
+from httpx import ASGITransport, AsyncClient
+from app.main import app
+from app.indexes import bucket_collections, ensure_indexes
+from app.storage import storage
+
+BATCH = 10000
+
+db = None  # bound to the Motor database in main()
+
+
+async def seed_customer(ac, size):
+    """Register a customer with `size` transactions and return (token, user_id)."""
+
+    email = f"history{size}@example.com"
+    await ac.post("/auth/register", json={"email": email, "password": "benchpassword", "name": f"History {size}"})
+    response = await ac.post("/auth/login", data={"username": email, "password": "benchpassword"})
+    user_id = str((await db['User'].find_one({"email": email}))["_id"])
+
+    start = datetime.datetime(2020, 1, 1)
+    for offset in range(0, size, BATCH):
+        await storage.transactions.insert_many([
+            {
+                "customer_id": user_id,
+                "fund_id": "000000000000000000000000",
+                "type": "Open" if (offset + i) % 2 == 0 else "Close",
+                "amount": 50,
+                "timestamp": start + datetime.timedelta(seconds=offset + i),
+                "customerName": f"History {size}",
+                "fundName": "Bench Fund",
+                "fundCategory": "FIC",
+            }
+            for i in range(min(BATCH, size - offset))
+        ])
+
+    return response.json()["access_token"]
+
+
+async def main(sizes, limit, pages, repeat):
+
+    global db
+    db = await mongo_db()
+
+    for name in ["User"] + await bucket_collections(db, "Transaction"):
+        await db[name].drop()
+    await ensure_indexes(db)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as ac:
+
+        for size in sizes:
+            headers = {"Authorization": f"Bearer {await seed_customer(ac, size)}"}
+            first, deep = [], []
+
+            for _ in range(repeat):
+                params = {"limit": limit}
+                for page in range(pages):
+                    started = time.perf_counter()
+                    response = await ac.get("/funds/transactions", params=params, headers=headers)
+                    (first if page == 0 else deep).append((time.perf_counter() - started) * 1000)
+
+                    if "X-Next-Cursor" not in response.headers:
+                        break
+                    params["next"] = response.headers["X-Next-Cursor"]
+
+            print(f"history={size} first page: {summarize(first)}")
+            if deep:
+                print(f"history={size} later pages: {summarize(deep)}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100000])
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.sizes, args.limit, args.pages, args.repeat))
@@ -0,0 +1,132 @@
+"""Throughput of app.server with 1 to N worker processes.
+
+For each worker count the server is started in a subprocess (python -m app.server)
+and driven for --duration seconds by --clients load-generating processes, each
+keeping --concurrency requests in flight. Workloads:
+
+    login   POST /auth/login, bcrypt-bound
+    list    GET /funds/list with a bearer token
+    root    GET /, framework and server overhead only
+
+login and list need a live MongoDB shared by the workers (MONGO_URI; data goes to
+MONGO_DB_NAME, default BTG_BENCH); root also runs with STORAGE_BACKEND=memory:
+
+    python -m benchmarks.worker_scaling --workers 1 2 4 --workload login
+    STORAGE_BACKEND=memory python -m benchmarks.worker_scaling --workload root
+
+Keep --clients high enough that the load generators are not the bottleneck; they
+share the machine with the server, so leave them some cores.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import httpx
+from benchmarks.common import summarize
+
+PORT = 8766
+BASE_URL = f"http://127.0.0.1:{PORT}"
+EMAIL = "bench-workers@example.com"
+PASSWORD = "benchpassword"
+
+
+def request_for(workload, token):
+
+    if workload == "login":
+        return lambda client: client.post("/auth/login", data={"username": EMAIL, "password": PASSWORD})
+    if workload == "list":
+        return lambda client: client.get("/funds/list", headers={"Authorization": f"Bearer {token}"})
+    return lambda client: client.get("/")
+
+
+async def drive(workload, token, duration, concurrency):
+    """Latencies in ms of the requests completed in `duration` seconds, and the error count."""
+
+    send = request_for(workload, token)
+    deadline = time.perf_counter() + duration
+    latencies = []
+    errors = 0
+
+    async def worker(client):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await send(client)
+                errors += response.status_code >= 400
+            except httpx.TransportError:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=BASE_URL, limits=limits, timeout=30) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+
+    return latencies, errors
+
+
+def client_process(args):
+    return asyncio.run(drive(*args))
+
+
+def wait_until_up():
+
+    for _ in range(200):
+        try:
+            httpx.get(f"{BASE_URL}/health/live")
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def login_token():
+
+    httpx.post(f"{BASE_URL}/auth/register", json={"email": EMAIL, "password": PASSWORD, "name": "Bench User"})
+    response = httpx.post(f"{BASE_URL}/auth/login", data={"username": EMAIL, "password": PASSWORD})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def measure(workers, workload, duration, clients, concurrency):
+
+    env = dict(os.environ, LOG_LEVEL="WARNING")
+    server = subprocess.Popen([sys.executable, "-m", "app.server", "--port", str(PORT), "--workers", str(workers)], env=env)
+
+    try:
+        wait_until_up()
+        token = login_token() if workload != "root" else None
+
+        with multiprocessing.Pool(clients) as pool:
+            results = pool.map(client_process, [(workload, token, duration, concurrency)] * clients)
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = [latency for client_latencies, _ in results for latency in client_latencies]
+    errors = sum(client_errors for _, client_errors in results)
+    return len(latencies) / duration, errors, summarize(latencies)
+
+
+if __name__ == "__main__":
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, max(1, cpus // 2), cpus}))
+    parser.add_argument("--workload", choices=["login", "list", "root"], default="login")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    baseline = None
+    for workers in args.workers:
+        throughput, errors, latency = measure(workers, args.workload, args.duration, args.clients, args.concurrency)
+        baseline = baseline or throughput
+        print(f"workers={workers} workload={args.workload} {throughput:.1f} req/s "
+              f"({throughput / baseline:.2f}x) errors={errors} latency={latency}")
@@ -7,4 +7,5 @@ git clone https://github.com/andresm9/btg.git /home/ec2-user/app
 cd /home/ec2-user/app
 pip3 install "fastapi[standard]"
 pip3 install --no-cache-dir --upgrade -r requirements.txt
-fastapi run app/main.py --proxy-headers --port 80
\ No newline at end of file
+python3 -m app.migrations
+SERVER_PORT=80 SERVER_MAX_REQUESTS=10000 SERVER_MAX_REQUESTS_JITTER=1000 python3 -m app.server
\ No newline at end of file
@@ -0,0 +1,5 @@
+import os
+
+# The suite runs on the in-memory storage engine unless STORAGE_BACKEND=mongo is set,
+# in which case the same tests run against the MongoDB configured in MONGO_URI.
+os.environ.setdefault("STORAGE_BACKEND", "memory")
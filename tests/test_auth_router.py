@@ -2,14 +2,12 @@ import pytest
 from httpx import ASGITransport, AsyncClient
 from fastapi import status
 from app.main import app
-from app.database import db
+from app.storage import storage
+from app.auth import create_access_token, get_current_user, invalidate_user, principal_cache
 
 async def drop_collections():
 
-    await db['User'].drop()
-    await db['InvestmentFund'].drop()
-    await db['Transaction'].drop()
-    await db['UserInvestmentFund'].drop()
+    await storage.reset()
     
     print("Collections dropped for testing.")
 
@@ -128,3 +126,27 @@ async def test_login_admin_success():
         response = await ac.post("/auth/login", data={"username": payload["email"], "password": payload["password"]})
         assert response.status_code == status.HTTP_200_OK
         assert response.json()["token_type"] == "bearer"
+
+
+@pytest.mark.asyncio(scope="session")
+async def test_user_written_during_a_token_check_is_not_cached(monkeypatch):
+
+    await drop_collections()
+    await storage.users.insert({"name": "Simple User", "email": "simpleuser@example.com", "hashed_password": "x",
+                                "balance": 500.0, "roles": ["Customer"]})
+    principal_cache.clear()
+    token = create_access_token(data={"sub": "simpleuser@example.com"})
+    find_by_email = storage.users.find_by_email
+
+    async def find_then_write(email):
+        user = await find_by_email(email)
+        # a subscribe lands between the read and the cache fill
+        await storage.users.update_balance(str(user["_id"]), -100.0)
+        invalidate_user(email)
+        return user
+
+    monkeypatch.setattr(storage.users, "find_by_email", find_then_write)
+    assert (await get_current_user(token)).balance == 500.0
+
+    monkeypatch.setattr(storage.users, "find_by_email", find_by_email)
+    assert (await get_current_user(token)).balance == 400.0
@@ -0,0 +1,90 @@
+from app.cache import TTLCache
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_hit_and_miss():
+
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("token", "user")
+
+    assert cache.get("token") == "user"
+    assert cache.get("other") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_entries_expire():
+
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=60, clock=clock)
+    cache.set("long", 1)
+    cache.set("short", 2, ttl=5)
+
+    clock.now = 10
+    assert cache.get("short") is None
+    assert cache.get("long") == 1
+
+    clock.now = 61
+    assert cache.get("long") is None
+    assert len(cache) == 0
+
+
+def test_cache_evicts_least_recently_used():
+
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_invalidate_tag():
+
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("token-1", "user", tag="user@example.com")
+    cache.set("token-2", "user", tag="user@example.com")
+    cache.set("token-3", "other", tag="other@example.com")
+
+    cache.invalidate_tag("user@example.com")
+
+    assert cache.get("token-1") is None
+    assert cache.get("token-2") is None
+    assert cache.get("token-3") == "other"
+
+
+def test_cache_skips_values_read_before_an_invalidation():
+
+    cache = TTLCache(maxsize=1, ttl=60)
+    generation = cache.generation("user@example.com")
+
+    cache.invalidate_tag("user@example.com")
+    cache.set("token-1", "old user", tag="user@example.com", generation=generation)
+    assert cache.get("token-1") is None
+
+    cache.set("token-1", "user", tag="user@example.com", generation=cache.generation("user@example.com"))
+    assert cache.get("token-1") == "user"
+
+    # a tag forgotten to bound memory still rejects reads from before its invalidation
+    generation = cache.generation("other@example.com")
+    cache.invalidate_tag("other@example.com")
+    cache.invalidate_tag("third@example.com")
+    cache.set("token-2", "old other", tag="other@example.com", generation=generation)
+    assert cache.get("token-2") is None
+
+    generation = cache.generation("user@example.com")
+    cache.clear()
+    cache.set("token-1", "old user", tag="user@example.com", generation=generation)
+    assert cache.get("token-1") is None
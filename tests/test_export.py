@@ -0,0 +1,65 @@
+import csv
+import datetime
+import io
+import json
+import pytest
+from bson import ObjectId
+from app.export import csv_lines, ndjson_lines
+
+
+class FakeCursor:
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self.documents:
+            yield dict(document)
+
+
+def transactions(count):
+
+    return [{
+        "_id": ObjectId(),
+        "customer_id": "customer",
+        "customerName": "Simple User",
+        "amount": 50.0,
+        "type": "Open",
+        "fundName": "Tech Fund",
+        "fundCategory": "Technology",
+        "timestamp": datetime.datetime(2024, 1, 1, 0, 0, i),
+    } for i in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_ndjson_chunks_per_batch():
+
+    chunks = [chunk async for chunk in ndjson_lines(FakeCursor(transactions(5)), batch_size=2)]
+    rows = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+
+    assert len(chunks) == 3
+    assert len(rows) == 5
+    assert rows[0]["customerId"] == "customer"
+    assert rows[0]["timestamp"] == "2024-01-01T00:00:00"
+
+
+@pytest.mark.asyncio
+async def test_csv_has_header_and_rows():
+
+    chunks = [chunk async for chunk in csv_lines(FakeCursor(transactions(3)), batch_size=2)]
+    rows = list(csv.DictReader(io.StringIO("".join(chunks))))
+
+    assert len(rows) == 3
+    assert rows[2]["fundName"] == "Tech Fund"
+    assert rows[2]["timestamp"] == "2024-01-01T00:00:02"
+
+
+@pytest.mark.asyncio
+async def test_csv_empty_export_has_header():
+
+    chunks = [chunk async for chunk in csv_lines(FakeCursor([]))]
+
+    assert "".join(chunks).strip().split(",")[0] == "_id"
@@ -0,0 +1,87 @@
+import pytest
+from app.storage import storage
+from app.fund_import import detect_format, import_funds, read_csv, read_json_array, read_ndjson
+
+
+async def chunks(text, size=7):
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+async def collect(rows):
+    return [row async for row in rows]
+
+
+@pytest.mark.asyncio
+async def test_json_array_elements_stream_across_chunks():
+
+    text = '[ {"name": "A", "minimumFee": 10, "category": "FIC"},\n {"name": "B, \\"quoted\\"", "minimumFee": 20, "category": "FPV"} ]'
+    rows = await collect(read_json_array(chunks(text)))
+
+    assert [(number, row["name"]) for number, row, _ in rows] == [(1, "A"), (2, 'B, "quoted"')]
+
+
+@pytest.mark.asyncio
+async def test_json_array_truncated():
+
+    rows = await collect(read_json_array(chunks('[{"name": "A"}, {"name": ')))
+
+    assert rows[0][1] == {"name": "A"}
+    assert rows[-1][2] == "Malformed or truncated JSON array"
+
+
+@pytest.mark.asyncio
+async def test_json_array_skips_malformed_element():
+
+    await storage.reset()
+    text = ('[{"name": "A", "minimumFee": 10, "category": "FIC"}, {"name": "B, [x]", oops}, '
+            '{"name": "C", "minimumFee": 30, "category": "FIC"}, {"name": "D", "minimumFee": 40, "category": "FPV"}]')
+
+    report = await import_funds(read_json_array(chunks(text)))
+
+    assert report["inserted"] == 3
+    assert report["failed"] == 1
+    assert report["errors"][0]["row"] == 2
+    assert [fund["name"] for fund in await storage.funds.find_all()] == ["A", "C", "D"]
+
+
+@pytest.mark.asyncio
+async def test_ndjson_reports_bad_lines():
+
+    rows = await collect(read_ndjson(chunks('{"name": "A"}\nnot json\n\n{"name": "B"}\n')))
+
+    assert [number for number, _, _ in rows] == [1, 2, 4]
+    assert rows[1][2].startswith("Invalid JSON")
+
+
+@pytest.mark.asyncio
+async def test_csv_rows_use_header():
+
+    rows = await collect(read_csv(chunks('name,minimumFee,category\r\n"Fund, A",100,FIC\r\nB,200\r\n')))
+
+    assert rows[0] == (1, {"name": "Fund, A", "minimumFee": "100", "category": "FIC"}, None)
+    assert rows[1][2] == "Expected 3 columns, got 2"
+
+
+@pytest.mark.asyncio
+async def test_import_validates_and_chunks():
+
+    await storage.reset()
+    text = 'name,minimumFee,category\nA,100,FIC\nB,abc,FIC\nC,300,FPV\nD,400,FPV\n'
+
+    report = await import_funds(read_csv(chunks(text)), chunk_size=2)
+
+    assert report["inserted"] == 3
+    assert report["failed"] == 1
+    assert report["errors"][0]["row"] == 2
+
+    funds = await storage.funds.find_all()
+    assert [fund["name"] for fund in funds] == ["A", "C", "D"]
+    assert funds[0]["minimumFee"] == 100.0
+
+
+def test_detect_format():
+
+    assert detect_format("funds.CSV") == "csv"
+    assert detect_format("funds.jsonl") == "ndjson"
+    assert detect_format("funds.json") == "json"
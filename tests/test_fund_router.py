@@ -4,7 +4,8 @@ import pytest
 from httpx import ASGITransport, AsyncClient
 from fastapi import status
 from app.main import app
-from app.database import db
+from app.storage import storage
+from app.portfolios import rebuild_portfolios
 
 @pytest.fixture(scope="session", autouse=True)
 def event_loop():
@@ -17,10 +18,7 @@ def event_loop():
 
 async def drop_collections():
 
-    await db['User'].drop()
-    await db['InvestmentFund'].drop()
-    await db['Transaction'].drop()
-    await db['UserInvestmentFund'].drop()
+    await storage.reset()
 
     print("Collections dropped for testing.")
 
@@ -111,6 +109,91 @@ async def test_cancel_fund_success():
         assert response.status_code == status.HTTP_200_OK
 
 
+@pytest.mark.asyncio
+async def test_subscribe_fund_insufficient_balance():
+
+    await drop_collections()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+
+        admin_token = await register_and_login(ac, "admin@example.com", "adminpassword", "Admin User", roles=["Admin"])
+        response = await create_fund(ac, admin_token, name="Big Fund", minimumFee=1000, category="FPV")
+
+        fund_id = response.json().get("id")
+
+        user_token = await register_and_login(ac, "simpleuser@example.com", "simpleuser", "Simple User")
+        response = await ac.post(f"/funds/subscribe/{fund_id}", headers={"Authorization": f"Bearer {user_token}"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_concurrent_subscribes_do_not_duplicate():
+
+    await drop_collections()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+
+        admin_token = await register_and_login(ac, "admin@example.com", "adminpassword", "Admin User", roles=["Admin"])
+        response = await create_fund(ac, admin_token, name="Tech Fund", minimumFee=50, category="Technology")
+
+        fund_id = response.json().get("id")
+
+        user_token = await register_and_login(ac, "simpleuser@example.com", "simpleuser", "Simple User")
+        headers = {"Authorization": f"Bearer {user_token}"}
+        responses = await asyncio.gather(*(ac.post(f"/funds/subscribe/{fund_id}", headers=headers) for _ in range(5)))
+
+        codes = sorted(response.status_code for response in responses)
+        assert codes == [status.HTTP_201_CREATED] + [status.HTTP_400_BAD_REQUEST] * 4
+        assert await storage.subscriptions.count() == 1
+        assert (await storage.users.find_by_email("simpleuser@example.com"))["balance"] == 450.0
+
+
+@pytest.mark.asyncio
+async def test_concurrent_subscribes_do_not_overdraw():
+
+    await drop_collections()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+
+        admin_token = await register_and_login(ac, "admin@example.com", "adminpassword", "Admin User", roles=["Admin"])
+        fund_ids = []
+        for name in ("Fund A", "Fund B", "Fund C"):
+            response = await create_fund(ac, admin_token, name=name, minimumFee=200, category="FIC")
+            fund_ids.append(response.json().get("id"))
+
+        user_token = await register_and_login(ac, "simpleuser@example.com", "simpleuser", "Simple User")
+        headers = {"Authorization": f"Bearer {user_token}"}
+        responses = await asyncio.gather(*(ac.post(f"/funds/subscribe/{fund_id}", headers=headers) for fund_id in fund_ids))
+
+        assert [response.status_code for response in responses].count(status.HTTP_201_CREATED) == 2
+        assert (await storage.users.find_by_email("simpleuser@example.com"))["balance"] == 100.0
+
+
+@pytest.mark.asyncio
+async def test_list_funds_not_modified():
+
+    await drop_collections()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+
+        admin_token = await register_and_login(ac, "admin@example.com", "adminpassword", "Admin User", roles=["Admin"])
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        await create_fund(ac, admin_token, name="Tech Fund", minimumFee=50, category="Technology")
+
+        response = await ac.get("/funds/list", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()) == 1
+        etag = response.headers["ETag"]
+
+        response = await ac.get("/funds/list", headers={**headers, "If-None-Match": etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+        await create_fund(ac, admin_token, name="Energy Fund", minimumFee=80, category="FIC")
+        response = await ac.get("/funds/list", headers={**headers, "If-None-Match": etag})
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()) == 2
+
+
 @pytest.mark.asyncio
 async def test_transaction_report_isarray():
     """Test transaction report returns an array"""
@@ -121,4 +204,262 @@ async def test_transaction_report_isarray():
         response = await ac.get("/funds/transactions", headers={"Authorization": f"Bearer {user_token}"})
 
         assert response.status_code == status.HTTP_200_OK
-        assert isinstance(response.json(), list)
\ No newline at end of file
+        assert isinstance(response.json(), list)
+
+
+@pytest.mark.asyncio
+async def test_transaction_report_details():
+    """Test transaction report rows carry customer and fund names"""
+
+    await drop_collections()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+
+        admin_token = await register_and_login(ac, "admin@example.com", "adminpassword", "Admin User", roles=["Admin"])
+        response = await create_fund(ac, admin_token, name="Tech Fund", minimumFee=50, category="Technology")
+        fund_id = response.json().get("id")
+
+        user_token = await register_and_login(ac, "simpleuser@example.com", "simpleuser", "Simple User")
+        headers = {"Authorization": f"Bearer {user_token}"}
+        await ac.post(f"/funds/subscribe/{fund_id}", headers=headers)
+        await ac.post(f"/funds/cancel/{fund_id}", headers=headers)
+
+        response = await ac.get("/funds/transactions", headers=headers)
+        rows = response.json()
+
+        assert [row["type"] for row in rows] == ["Open", "Close"]
+        assert all(row["customerName"] == "Simple User" for row in rows)
+        assert all(row["fundName"] == "Tech Fund" and row["fundCategory"] == "Technology" for row in rows)
+
+
+@pytest.mark.asyncio
+async def test_transaction_report_pages():
+    """Test transaction report pagination with the X-Next-Cursor header"""
+
+    await drop_collections()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+
+        admin_token = await register_and_login(ac, "admin@example.com", "adminpassword", "Admin User", roles=["Admin"])
+        response = await create_fund(ac, admin_token, name="Tech Fund", minimumFee=50, category="Technology")
+        fund_id = response.json().get("id")
+
+        user_token = await register_and_login(ac, "simpleuser@example.com", "simpleuser", "Simple User")
+        headers = {"Authorization": f"Bearer {user_token}"}
+        for _ in range(3):
+            await ac.post(f"/funds/subscribe/{fund_id}", headers=headers)
+            await ac.post(f"/funds/cancel/{fund_id}", headers=headers)
+
+        rows = []
+        params = {"limit": 4}
+        while True:
+            response = await ac.get("/funds/transactions", params=params, headers=headers)
+            rows.extend(response.json())
+            if "X-Next-Cursor" not in response.headers:
+                break
+            params["next"] = response.headers["X-Next-Cursor"]
+
+        assert len(rows) == 6
+        assert len({row["_id"] for row in rows}) == 6
+
+        response = await ac.get("/funds/transactions", params={"type": "Close"}, headers=headers)
+        assert [row["type"] for row in response.json()] == ["Close"] * 3
+
+
+@pytest.mark.asyncio
+async def test_export_transactions():
+    """Test NDJSON export of the current user's history and the admin-only customer filter"""
+
+    await drop_collections()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+
+        admin_token = await register_and_login(ac, "admin@example.com", "adminpassword", "Admin User", roles=["Admin"])
+        response = await create_fund(ac, admin_token, name="Tech Fund", minimumFee=50, category="Technology")
+        fund_id = response.json().get("id")
+
+        user_token = await register_and_login(ac, "simpleuser@example.com", "simpleuser", "Simple User")
+        headers = {"Authorization": f"Bearer {user_token}"}
+        await ac.post(f"/funds/subscribe/{fund_id}", headers=headers)
+
+        response = await ac.get("/funds/transactions/export", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert len(response.text.splitlines()) == 1
+
+        response = await ac.get("/funds/transactions/export", params={"customer_id": "someone-else"}, headers=headers)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+        response = await ac.get("/funds/transactions/export", params={"format": "csv"}, headers={"Authorization": f"Bearer {admin_token}"})
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.text.splitlines()) == 2
+
+
+@pytest.mark.asyncio
+async def test_batch_subscribe_and_cancel():
+    """Test a rebalance in one request with per-operation results"""
+
+    await drop_collections()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+
+        admin_token = await register_and_login(ac, "admin@example.com", "adminpassword", "Admin User", roles=["Admin"])
+        fund_ids = []
+        for name, fee in (("Fund A", 100), ("Fund B", 150), ("Fund C", 400)):
+            response = await create_fund(ac, admin_token, name=name, minimumFee=fee, category="FIC")
+            fund_ids.append(response.json().get("id"))
+
+        user_token = await register_and_login(ac, "simpleuser@example.com", "simpleuser", "Simple User")
+        headers = {"Authorization": f"Bearer {user_token}"}
+        await ac.post(f"/funds/subscribe/{fund_ids[0]}", headers=headers)
+
+        operations = [
+            {"action": "cancel", "fund_id": fund_ids[0]},
+            {"action": "subscribe", "fund_id": fund_ids[1]},
+            {"action": "subscribe", "fund_id": fund_ids[2]},
+            {"action": "subscribe", "fund_id": fund_ids[1]},
+        ]
+        response = await ac.post("/funds/batch", json={"operations": operations}, headers=headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [result["status_code"] for result in response.json()["results"]] == [200, 201, 400, 400]
+        assert response.json()["current_balance"] == 350.0
+        assert await storage.subscriptions.count() == 1
+        assert await storage.transactions.count() == 3
+
+
+@pytest.mark.asyncio
+async def test_failed_ledger_write_undoes_subscribe_and_cancel(monkeypatch):
+    """Test a subscribe or cancel whose ledger write fails, without transactions, leaves balance and subscription as they were"""
+
+    await drop_collections()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+
+        admin_token = await register_and_login(ac, "admin@example.com", "adminpassword", "Admin User", roles=["Admin"])
+        fund_id = (await create_fund(ac, admin_token, name="Fund A", minimumFee=100, category="FIC")).json().get("id")
+
+        user_token = await register_and_login(ac, "simpleuser@example.com", "simpleuser", "Simple User")
+        headers = {"Authorization": f"Bearer {user_token}"}
+        user_id = str((await storage.users.find_by_email("simpleuser@example.com"))["_id"])
+
+        async def failing_insert(transaction, session=None):
+            raise RuntimeError("ledger unavailable")
+
+        with monkeypatch.context() as patch:
+            patch.setattr(storage.transactions, "insert", failing_insert)
+            with pytest.raises(RuntimeError):
+                await ac.post(f"/funds/subscribe/{fund_id}", headers=headers)
+
+        assert (await storage.users.find_by_id(user_id))["balance"] == 500.0
+        assert await storage.subscriptions.count(user_id) == 0
+
+        await ac.post(f"/funds/subscribe/{fund_id}", headers=headers)
+
+        with monkeypatch.context() as patch:
+            patch.setattr(storage.transactions, "insert", failing_insert)
+            with pytest.raises(RuntimeError):
+                await ac.post(f"/funds/cancel/{fund_id}", headers=headers)
+
+        assert (await storage.users.find_by_id(user_id))["balance"] == 400.0
+        assert await storage.subscriptions.count(user_id) == 1
+        assert await storage.transactions.count(user_id) == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_releases_its_claims(monkeypatch):
+    """Test a batch failing before the ledger write, without transactions, leaves the subscriptions cancellable"""
+
+    await drop_collections()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+
+        admin_token = await register_and_login(ac, "admin@example.com", "adminpassword", "Admin User", roles=["Admin"])
+        fund_id = (await create_fund(ac, admin_token, name="Fund A", minimumFee=100, category="FIC")).json().get("id")
+
+        user_token = await register_and_login(ac, "simpleuser@example.com", "simpleuser", "Simple User")
+        headers = {"Authorization": f"Bearer {user_token}"}
+        await ac.post(f"/funds/subscribe/{fund_id}", headers=headers)
+
+        async def failing_insert_many(transactions, session=None):
+            raise RuntimeError("ledger unavailable")
+
+        with monkeypatch.context() as patch:
+            patch.setattr(storage.transactions, "insert_many", failing_insert_many)
+            with pytest.raises(RuntimeError):
+                await ac.post("/funds/batch", json={"operations": [{"action": "cancel", "fund_id": fund_id}]}, headers=headers)
+
+        response = await ac.post(f"/funds/cancel/{fund_id}", headers=headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["current_balance"] == 500.0
+
+
+
+@pytest.mark.asyncio
+async def test_list_funds_filters_and_pages():
+    """Test /funds/list filters, keyset pages, total count and field projection"""
+
+    await drop_collections()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+
+        admin_token = await register_and_login(ac, "admin@example.com", "adminpassword", "Admin User", roles=["Admin"])
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        for name, fee, category in [("Tech A", 50, "FIC"), ("Tech B", 250, "FIC"), ("Tech C", 500, "FPV"),
+                                    ("Energy", 100, "FIC"), ("Tech D", 75, "FIC")]:
+            await create_fund(ac, admin_token, name=name, minimumFee=fee, category=category)
+
+        names, params = [], {"category": "FIC", "name": "Tech", "sort": "-minimumFee", "limit": 2}
+        while True:
+            response = await ac.get("/funds/list", params=params, headers=headers)
+            assert response.headers["X-Total-Count"] == "3"
+            names.extend(fund["name"] for fund in response.json())
+            if "X-Next-Cursor" not in response.headers:
+                break
+            params["next"] = response.headers["X-Next-Cursor"]
+
+        assert names == ["Tech B", "Tech D", "Tech A"]
+
+        response = await ac.get("/funds/list", params={"minFee": 60, "maxFee": 300, "fields": "id,name"}, headers=headers)
+        assert [sorted(fund) for fund in response.json()] == [["_id", "name"]] * 3
+        assert [fund["name"] for fund in response.json()] == ["Energy", "Tech B", "Tech D"]
+
+        response = await ac.get("/funds/list", params={"fields": "name,balance"}, headers=headers)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+        response = await ac.get("/funds/list", headers=headers)
+        assert len(response.json()) == 5
+        assert "X-Total-Count" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_portfolio_summary():
+    """Test the portfolio follows subscribes, cancels and batches, and matches a rebuild from the ledger"""
+
+    await drop_collections()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+
+        admin_token = await register_and_login(ac, "admin@example.com", "adminpassword", "Admin User", roles=["Admin"])
+        tech = (await create_fund(ac, admin_token, name="Tech Fund", minimumFee=50, category="Technology")).json()["id"]
+        energy = (await create_fund(ac, admin_token, name="Energy Fund", minimumFee=100, category="FIC")).json()["id"]
+
+        user_token = await register_and_login(ac, "simpleuser@example.com", "simpleuser", "Simple User")
+        headers = {"Authorization": f"Bearer {user_token}"}
+
+        response = await ac.get("/funds/portfolio", headers=headers)
+        assert response.json()["funds"] == [] and response.json()["invested"] == 0
+
+        await ac.post(f"/funds/subscribe/{tech}", headers=headers)
+        await ac.post(f"/funds/cancel/{tech}", headers=headers)
+        await ac.post("/funds/batch", json={"operations": [{"action": "subscribe", "fund_id": tech},
+                                                           {"action": "subscribe", "fund_id": energy}]}, headers=headers)
+        await ac.post(f"/funds/cancel/{energy}", headers=headers)
+
+        portfolio = (await ac.get("/funds/portfolio", headers=headers)).json()
+        assert [(fund["name"], fund["amount"]) for fund in portfolio["funds"]] == [("Tech Fund", 50.0)]
+        assert (portfolio["invested"], portfolio["opens"], portfolio["closes"]) == (50.0, 3, 2)
+
+    report = await rebuild_portfolios(check_only=True)
+    assert (report["customers"], report["consistent"], report["mismatched"]) == (1, 1, [])
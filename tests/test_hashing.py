@@ -0,0 +1,43 @@
+import asyncio
+import pytest
+from app.hashing import HashingPool, get_password_hash, verify_password
+
+
+@pytest.mark.asyncio
+async def test_pool_hash_and_verify():
+
+    pool = HashingPool("thread", max_workers=2)
+    hashed = await pool.hash("secret")
+
+    assert verify_password("secret", hashed)
+    assert await pool.verify("secret", hashed)
+    assert not await pool.verify("wrong", hashed)
+    assert pool.stats()["completed"] == 3
+
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_pool_caps_concurrency():
+
+    pool = HashingPool("thread", max_workers=4, max_concurrency=1)
+    hashed = get_password_hash("secret")
+    depths = []
+
+    async def observe():
+        await asyncio.sleep(0.01)
+        depths.append(pool.stats()["queue_depth"])
+
+    results = await asyncio.gather(*(pool.verify("secret", hashed) for _ in range(3)), observe())
+
+    assert all(results[:3])
+    assert max(depths) == 2
+    assert pool.stats()["in_flight"] == 0
+
+    pool.shutdown()
+
+
+def test_pool_rejects_unknown_executor():
+
+    with pytest.raises(ValueError):
+        HashingPool("gpu")
@@ -0,0 +1,87 @@
+import asyncio
+import pytest
+from httpx import ASGITransport, AsyncClient
+from fastapi import status
+from app.main import app
+from app.storage import storage
+from app.idempotency import REPLAYED_HEADER, response_cache
+from tests.test_fund_router import drop_collections, register_and_login, create_fund
+
+
+async def subscriber(ac):
+    """Token of a customer with 500 balance, and a fund with a 50 fee."""
+
+    admin_token = await register_and_login(ac, "admin@example.com", "adminpassword", "Admin User", roles=["Admin"])
+    response = await create_fund(ac, admin_token, name="Tech Fund", minimumFee=50, category="Technology")
+    user_token = await register_and_login(ac, "simpleuser@example.com", "simpleuser", "Simple User")
+
+    return user_token, response.json().get("id")
+
+
+@pytest.mark.asyncio
+async def test_retried_subscribe_replays_the_first_response():
+
+    await drop_collections()
+    response_cache.clear()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+
+        token, fund_id = await subscriber(ac)
+        headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "subscribe-1"}
+
+        first = await ac.post(f"/funds/subscribe/{fund_id}", headers=headers)
+        assert first.status_code == status.HTTP_201_CREATED
+        assert REPLAYED_HEADER not in first.headers
+
+        response_cache.clear()  # replay from storage, as another worker would
+        for _ in range(2):
+            retry = await ac.post(f"/funds/subscribe/{fund_id}", headers=headers)
+            assert (retry.status_code, retry.content) == (first.status_code, first.content)
+            assert retry.headers[REPLAYED_HEADER] == "true"
+
+        user = await storage.users.find_by_email("simpleuser@example.com")
+        assert user["balance"] == 450.0
+        assert await storage.transactions.count(str(user["_id"])) == 1
+
+        # a key names one request: another fund is rejected, not replayed
+        other = await ac.post("/funds/subscribe/000000000000000000000000", headers=headers)
+        assert other.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicates_wait_for_the_first_request():
+
+    await drop_collections()
+    response_cache.clear()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+
+        token, fund_id = await subscriber(ac)
+        headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "subscribe-2"}
+
+        responses = await asyncio.gather(*(ac.post(f"/funds/subscribe/{fund_id}", headers=headers) for _ in range(5)))
+
+        assert {response.status_code for response in responses} == {status.HTTP_201_CREATED}
+        assert sum(REPLAYED_HEADER in response.headers for response in responses) == 4
+
+        user = await storage.users.find_by_email("simpleuser@example.com")
+        assert user["balance"] == 450.0
+
+
+@pytest.mark.asyncio
+async def test_retried_register_does_not_fail_as_duplicate():
+
+    await drop_collections()
+    response_cache.clear()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+
+        payload = {"email": "newuser@example.com", "password": "secret", "name": "New User"}
+        headers = {"Idempotency-Key": "register-1"}
+
+        first = await ac.post("/auth/register", json=payload, headers=headers)
+        retry = await ac.post("/auth/register", json=payload, headers=headers)
+        without_key = await ac.post("/auth/register", json=payload)
+
+        assert first.status_code == retry.status_code == status.HTTP_201_CREATED
+        assert without_key.status_code == status.HTTP_400_BAD_REQUEST
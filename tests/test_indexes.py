@@ -0,0 +1,21 @@
+from app.indexes import INDEXES, uses_collection_scan
+
+
+def test_collection_scan_detected_in_nested_plan():
+
+    plan = {"stage": "SORT", "inputStage": {"stage": "COLLSCAN", "direction": "forward"}}
+    assert uses_collection_scan(plan)
+
+
+def test_index_scan_is_not_flagged():
+
+    plan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "email_unique"}}
+    assert not uses_collection_scan(plan)
+
+
+def test_unique_indexes_declared():
+
+    unique = {name: [index.document for index in indexes if index.document.get("unique")] for name, indexes in INDEXES.items()}
+
+    assert unique["User"][0]["key"] == {"email": 1}
+    assert unique["UserInvestmentFund"][0]["key"] == {"user_id": 1, "fund_id": 1}
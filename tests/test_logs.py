@@ -0,0 +1,67 @@
+import io
+import json
+import logging
+from app.config import LOG_LEVEL, LOG_FORMAT, LOG_LEVELS, LOG_SAMPLE_RATE
+from app.logs import SAMPLED, SamplingFilter, configure_logging, parse_levels, stop_logging
+
+
+def capture(**kwargs):
+
+    stream = io.StringIO()
+    configure_logging(stream=stream, **kwargs)
+    return stream
+
+
+def restore():
+
+    configure_logging(LOG_LEVEL, LOG_FORMAT, LOG_LEVELS, LOG_SAMPLE_RATE)
+
+
+def test_json_lines_are_formatted_by_the_listener():
+
+    stream = capture()
+    try:
+        logging.getLogger("app.test").info("User %s subscribed", "simpleuser@example.com", extra={"fund_id": "abc"})
+        stop_logging()
+    finally:
+        restore()
+
+    entry = json.loads(stream.getvalue())
+
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "app.test"
+    assert entry["message"] == "User simpleuser@example.com subscribed"
+    assert entry["fund_id"] == "abc"
+
+
+def test_per_logger_levels():
+
+    stream = capture(levels=parse_levels("app.quiet=WARNING"))
+    try:
+        logging.getLogger("app.quiet").info("dropped")
+        logging.getLogger("app.quiet").warning("kept")
+        stop_logging()
+    finally:
+        logging.getLogger("app.quiet").setLevel(logging.NOTSET)
+        restore()
+
+    assert [json.loads(line)["message"] for line in stream.getvalue().splitlines()] == ["kept"]
+
+
+def test_sampling_only_drops_marked_info_records():
+
+    never = SamplingFilter(0)
+    info = logging.LogRecord("app", logging.INFO, "", 0, "per request", (), None)
+    marked = logging.makeLogRecord({"levelno": logging.INFO, **SAMPLED})
+    warning = logging.makeLogRecord({"levelno": logging.WARNING, **SAMPLED})
+
+    assert never.filter(info)
+    assert not never.filter(marked)
+    assert never.filter(warning)
+    assert SamplingFilter(1).filter(marked)
+
+
+def test_parse_levels():
+
+    assert parse_levels(" app.auth=warning, uvicorn.access=ERROR ,") == {"app.auth": "WARNING", "uvicorn.access": "ERROR"}
+    assert parse_levels("") == {}
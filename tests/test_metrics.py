@@ -0,0 +1,64 @@
+import os
+import pytest
+from httpx import ASGITransport, AsyncClient
+from app.main import app
+from app.metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_histogram_buckets_are_cumulative():
+
+    histogram = Histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "/funds/list")
+
+    lines = list(histogram.render())
+
+    assert 'latency_seconds_bucket{route="/funds/list",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/funds/list",le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{route="/funds/list",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{route="/funds/list"} 4' in lines
+
+
+@pytest.mark.asyncio
+async def test_metrics_are_labeled_by_route_template():
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        await ac.post("/funds/subscribe/abc")
+        await ac.get("/no/such/path")
+        response = await ac.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{method="POST",route="/funds/subscribe/{fund_id}",status="401"}' in response.text
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"}' in response.text
+    assert 'http_request_duration_seconds_count{method="POST",route="/funds/subscribe/{fund_id}",status="401"}' in response.text
+
+
+def test_worker_metrics_are_summed_from_a_shared_directory(tmp_path):
+
+    workers = Registry()
+    requests = workers.register(Counter("requests_total", "Requests", ("route",)))
+    in_progress = workers.register(Gauge("in_progress", "In progress", ("method",)))
+    latency = workers.register(Histogram("latency_seconds", "Latency", ("route",), buckets=(0.1,)))
+
+    # a worker that has since exited
+    requests.inc("/funds/list", amount=3)
+    in_progress.inc("GET")
+    latency.observe(0.05, "/funds/list")
+    workers.write(str(tmp_path))
+    os.rename(tmp_path / f"{os.getpid()}.json", tmp_path / "999999999.json")
+
+    # this worker
+    requests.values.clear()
+    in_progress.values.clear()
+    latency.values.clear()
+    requests.inc("/funds/list")
+    latency.observe(0.5, "/funds/list")
+    workers.write(str(tmp_path))
+
+    lines = workers.render_directory(str(tmp_path)).splitlines()
+
+    assert 'requests_total{route="/funds/list"} 4' in lines
+    assert 'latency_seconds_bucket{route="/funds/list",le="0.1"} 1' in lines
+    assert 'latency_seconds_count{route="/funds/list"} 2' in lines
+    assert not any(line.startswith("in_progress{") for line in lines)
@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+from app.storage import storage
+from app.models import User
+from app.notifications import FakeSender, NotificationDispatcher, Sender, build_notification
+
+
+class FailingSender(Sender):
+
+    async def send(self, channel, notifications):
+        raise ConnectionError("provider unavailable")
+
+
+def make_user(channel="Email"):
+
+    return User(_id="000000000000000000000001", name="Simple User", email="simpleuser@example.com",
+                hashed_password="x", notification_channel=channel)
+
+
+def make_dispatcher(senders, max_attempts=3):
+
+    return NotificationDispatcher(senders, workers=2, batch_size=10, max_attempts=max_attempts,
+                                  backoff_seconds=0.01, poll_seconds=0.01)
+
+
+async def wait_for(condition, timeout=5):
+
+    for _ in range(int(timeout / 0.01)):
+        if await condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not met")
+
+
+@pytest.mark.asyncio
+async def test_notifications_sent_per_channel():
+
+    await storage.reset()
+    sender = FakeSender()
+    dispatcher = make_dispatcher({"Email": sender, "SMS": sender})
+
+    dispatcher.start()
+    await dispatcher.enqueue([
+        build_notification(make_user("Email"), "subscribed", "Subscribed to Tech Fund."),
+        build_notification(make_user("SMS"), "cancelled", "Cancelled subscription to Tech Fund."),
+    ])
+
+    async def all_sent():
+        return len(await storage.outbox.find("sent")) == 2
+
+    await wait_for(all_sent)
+    await dispatcher.stop()
+
+    assert sorted(notification["channel"] for notification in sender.sent) == ["Email", "SMS"]
+    assert dispatcher.stats()["sent"] == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_notifications_are_retried_then_marked_failed():
+
+    await storage.reset()
+    dispatcher = make_dispatcher({"Email": FailingSender()}, max_attempts=2)
+
+    dispatcher.start()
+    await dispatcher.enqueue([build_notification(make_user(), "subscribed", "Subscribed to Tech Fund.")])
+
+    async def failed():
+        return len(await storage.outbox.find("failed")) == 1
+
+    await wait_for(failed)
+    await dispatcher.stop()
+
+    notification = (await storage.outbox.find())[0]
+    assert notification["attempts"] == 2
+    assert notification["last_error"] == "provider unavailable"
+
+
+@pytest.mark.asyncio
+async def test_pending_outbox_is_picked_up_after_restart():
+
+    await storage.reset()
+    await storage.outbox.insert_many([build_notification(make_user(), "subscribed", "Subscribed to Tech Fund.")])
+
+    sender = FakeSender()
+    dispatcher = make_dispatcher({"Email": sender})
+    dispatcher.start()
+
+    async def sent():
+        return len(sender.sent) == 1
+
+    await wait_for(sent)
+    await dispatcher.stop()
@@ -0,0 +1,60 @@
+import datetime
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from app.pagination import after, decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+
+    timestamp = datetime.datetime(2024, 5, 1, 12, 30, 15, 123000)
+    _id = ObjectId()
+
+    assert decode_cursor(encode_cursor(timestamp, _id), (datetime.datetime, ObjectId)) == [timestamp, _id]
+    assert decode_cursor(encode_cursor("Tech Fund", 1000.0, _id), (str, float, ObjectId)) == ["Tech Fund", 1000.0, _id]
+
+
+def test_invalid_cursor():
+
+    with pytest.raises(HTTPException) as error:
+        decode_cursor("not-a-cursor", (datetime.datetime, ObjectId))
+
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize("cursor", [
+    "WzFd",                                         # [1]
+    encode_cursor("Tech Fund", ObjectId()),         # a /funds/list cursor
+    encode_cursor(datetime.datetime(2024, 5, 1), "not an id"),
+    encode_cursor(datetime.datetime(2024, 5, 1), ObjectId(), 1),
+    encode_cursor({"a": 1}, ObjectId()),
+])
+def test_cursor_of_another_shape(cursor):
+
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, (datetime.datetime, ObjectId))
+
+    assert error.value.status_code == 400
+
+
+def test_fund_cursor_sort_value_must_match_sort():
+
+    cursor = encode_cursor("Tech Fund", ObjectId())
+
+    assert decode_cursor(cursor, (str, ObjectId))[0] == "Tech Fund"
+    with pytest.raises(HTTPException):
+        decode_cursor(cursor, ((int, float), ObjectId))
+    with pytest.raises(HTTPException):
+        decode_cursor(encode_cursor(True, ObjectId()), ((int, float), ObjectId))
+
+
+def test_after_clause():
+
+    timestamp = datetime.datetime(2024, 5, 1)
+    _id = ObjectId()
+
+    assert after("timestamp", timestamp, _id) == {
+        "timestamp": {"$gte": timestamp},
+        "$or": [{"timestamp": {"$gt": timestamp}}, {"timestamp": timestamp, "_id": {"$gt": _id}}]
+    }
+    assert after("name", "B", _id, descending=True)["name"] == {"$lte": "B"}
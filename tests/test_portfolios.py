@@ -0,0 +1,60 @@
+import datetime
+import pytest
+from app.storage import storage
+from app.storage.base import replay_portfolio
+from app.portfolios import rebuild_portfolios
+
+
+def ledger(customer_id, *entries):
+
+    start = datetime.datetime(2024, 1, 1)
+    return [
+        {"customer_id": customer_id, "fund_id": fund_id, "type": kind, "amount": amount if kind == "Open" else -amount,
+         "timestamp": start + datetime.timedelta(minutes=i), "fundName": f"Fund {fund_id}", "fundCategory": "FIC"}
+        for i, (kind, fund_id, amount) in enumerate(entries)
+    ]
+
+
+def test_replay_keeps_open_positions():
+
+    portfolio = replay_portfolio("user", ledger("user", ("Open", "a", 50.0), ("Open", "b", 80.0), ("Close", "a", 50.0), ("Open", "a", 50.0)))
+
+    assert sorted(portfolio["funds"]) == ["a", "b"]
+    assert (portfolio["invested"], portfolio["opens"], portfolio["closes"]) == (130.0, 3, 1)
+
+
+@pytest.mark.asyncio
+async def test_rebuild_repairs_missing_and_stale_portfolios():
+
+    await storage.reset()
+    first = ledger("first", ("Open", "a", 50.0), ("Close", "a", 50.0), ("Open", "b", 80.0))
+    second = ledger("second", ("Open", "a", 50.0))
+    await storage.transactions.insert_many(first + second)
+    await storage.portfolios.apply("first", first[:1])
+
+    report = await rebuild_portfolios(check_only=True)
+    assert sorted(report["mismatched"]) == ["first", "second"]
+    assert report["rebuilt"] == 0
+
+    report = await rebuild_portfolios()
+    assert report["rebuilt"] == 2
+
+    portfolio = await storage.portfolios.get("first")
+    assert list(portfolio["funds"]) == ["b"]
+    assert (portfolio["invested"], portfolio["opens"], portfolio["closes"]) == (80.0, 2, 1)
+    assert (await rebuild_portfolios(check_only=True))["mismatched"] == []
+
+
+@pytest.mark.asyncio
+async def test_replace_refuses_a_portfolio_changed_since_it_was_read():
+
+    await storage.reset()
+    entries = ledger("user", ("Open", "a", 50.0), ("Open", "b", 80.0))
+    await storage.portfolios.apply("user", entries[:1])
+    stored = await storage.portfolios.get("user")
+
+    await storage.portfolios.apply("user", entries[1:])
+
+    assert not await storage.portfolios.replace(replay_portfolio("user", entries[:1]), stored)
+    assert await storage.portfolios.replace(replay_portfolio("other", entries), None)
+    assert not await storage.portfolios.replace(replay_portfolio("other", entries), None)
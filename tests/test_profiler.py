@@ -0,0 +1,72 @@
+import pytest
+from types import SimpleNamespace
+from httpx import ASGITransport, AsyncClient
+from app.main import app
+from app.storage import storage
+from app.profiler import QueryProfiler, RequestProfile, current_request, query_shape
+
+
+def command_events(command_name, command, duration_micros, request_id=1):
+
+    started = SimpleNamespace(command_name=command_name, command=command, connection_id=("localhost", 27017),
+                              request_id=request_id, database_name="BTG_DB")
+    succeeded = SimpleNamespace(command_name=command_name, connection_id=("localhost", 27017), request_id=request_id,
+                                database_name="BTG_DB", duration_micros=duration_micros)
+    return started, succeeded
+
+
+def test_query_shape_drops_values():
+
+    assert query_shape("find", {"find": "User", "filter": {"email": "a@example.com"}}) == '{"email": "?"}'
+    assert query_shape("find", {"find": "Transaction", "filter": {"timestamp": {"$gte": 1}, "fund_id": {"$in": ["a", "b"]}}}) \
+        == '{"timestamp": {"$gte": "?"}, "fund_id": {"$in": "?"}}'
+    assert query_shape("update", {"update": "User", "updates": [{"q": {"_id": 1, "balance": {"$gte": 50}}, "u": {}}]}) \
+        == '{"_id": "?", "balance": {"$gte": "?"}}'
+    assert query_shape("aggregate", {"aggregate": "Transaction", "pipeline": [{"$match": {"customer_id": "x"}}, {"$sort": {"timestamp": 1}}]}) \
+        == '{"pipeline": ["$match", "$sort"], "match": {"customer_id": "?"}}'
+
+
+def test_commands_are_grouped_and_charged_to_the_request():
+
+    profiler = QueryProfiler(slow_ms=5, slow_log_size=10)
+    profile = RequestProfile()
+    token = current_request.set(profile)
+
+    try:
+        for request_id, (email, micros) in enumerate([("a@example.com", 1000), ("b@example.com", 8000)]):
+            started, succeeded = command_events("find", {"find": "User", "filter": {"email": email}}, micros, request_id)
+            profiler.started(started)
+            profiler.succeeded(succeeded)
+    finally:
+        current_request.reset(token)
+
+    profiler.record_request("GET", "/funds/list", profile)
+    stats = profiler.stats()
+
+    assert profile.commands == 2
+    assert profile.db_ms == 9.0
+    assert stats["commands"] == [{"collection": "User", "command": "find", "shape": '{"email": "?"}', "count": 2,
+                                  "total_ms": 9.0, "mean_ms": 4.5, "max_ms": 8.0}]
+    assert stats["routes"][0]["route"] == "/funds/list"
+    assert stats["routes"][0]["commands_per_request"] == 2
+    assert [(slow["collection"], slow["duration_ms"]) for slow in stats["slow"]] == [("User", 8.0)]
+    assert "b@example.com" not in str(stats)
+
+
+@pytest.mark.asyncio
+async def test_admin_query_stats():
+
+    await storage.reset()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+
+        await ac.post("/auth/register", json={"email": "admin@example.com", "password": "adminpassword", "name": "Admin User", "roles": ["Admin"]})
+        response = await ac.post("/auth/login", data={"username": "admin@example.com", "password": "adminpassword"})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        response = await ac.get("/admin/queries", headers=headers)
+        assert response.status_code == 200
+        assert any(route["route"] == "/auth/login" for route in response.json()["routes"])
+
+        response = await ac.delete("/admin/queries", headers=headers)
+        assert response.status_code == 204
@@ -0,0 +1,25 @@
+import datetime
+from typing import List
+from bson import ObjectId
+from pydantic import TypeAdapter
+from app.models import TransactionDetails
+from app.serialization import FastJSONResponse, dumps
+
+
+def test_fast_path_matches_response_model():
+
+    rows = [
+        {"_id": ObjectId(), "customerId": "customer", "customerName": "Simple User", "amount": 50.0, "type": "Open",
+         "fundName": "Tech Fund", "fundCategory": "Technology", "timestamp": datetime.datetime(2024, 1, 1, 9, 30, 0, 123456)},
+        {"_id": ObjectId(), "customerId": "customer", "customerName": "Simple User", "amount": -50.0, "type": "Close",
+         "fundName": "Tech Fund", "fundCategory": "Technology", "timestamp": datetime.datetime(2024, 1, 2, tzinfo=datetime.UTC)},
+    ]
+    adapter = TypeAdapter(List[TransactionDetails])
+
+    assert dumps(rows) == adapter.dump_json(adapter.validate_python(rows), by_alias=True)
+
+
+def test_response_passes_bytes_through():
+
+    assert FastJSONResponse(b'[{"_id":"1"}]').body == b'[{"_id":"1"}]'
+    assert FastJSONResponse([{"_id": ObjectId("000000000000000000000001")}]).body == b'[{"_id":"000000000000000000000001"}]'
@@ -0,0 +1,35 @@
+import os
+import uvicorn
+from app import server
+from app.server import server_options
+
+
+def test_server_options_recycle_workers_only_when_configured():
+
+    options = server_options(workers=4, max_requests=1000, max_requests_jitter=100)
+    assert (options["workers"], options["limit_max_requests"], options["limit_max_requests_jitter"]) == (4, 1000, 100)
+
+    options = server_options(workers=1, max_requests=0, max_requests_jitter=100)
+    assert (options["limit_max_requests"], options["limit_max_requests_jitter"]) == (None, 0)
+
+
+def test_server_options_are_accepted_by_uvicorn():
+
+    config = uvicorn.Config(server.APP, **server_options(workers=2))
+    assert config.workers == 2
+    assert config.loop in ("uvloop", "asyncio")
+    assert config.http in ("httptools", "h11")
+
+
+def test_workers_share_metrics_through_a_fresh_directory(monkeypatch, tmp_path):
+
+    (tmp_path / "12345.json").write_text("{}")
+    monkeypatch.setattr(server, "METRICS_MULTIPROCESS_DIR", str(tmp_path))
+    monkeypatch.setattr(server.uvicorn, "run", lambda app, **options: None)
+    monkeypatch.setenv("METRICS_MULTIPROCESS_DIR", "")
+    monkeypatch.setenv("HASH_MAX_WORKERS", "1")
+
+    server.run(workers=2)
+
+    assert os.environ["METRICS_MULTIPROCESS_DIR"] == str(tmp_path)
+    assert list(tmp_path.iterdir()) == []
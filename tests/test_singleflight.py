@@ -0,0 +1,132 @@
+import asyncio
+import datetime
+import pytest
+from httpx import ASGITransport, AsyncClient
+from app.main import app
+from app.storage import storage
+from app.auth import create_access_token, get_current_user, invalidate_user, principal_cache, user_lookups
+from app.singleflight import SingleFlight
+from tests.test_fund_router import drop_collections, register_and_login
+
+
+class SlowRead:
+    """A read that takes a while and counts how often it ran."""
+
+    def __init__(self, result="value", error=None):
+        self.result = result
+        self.error = error
+        self.runs = 0
+
+    async def __call__(self, *args):
+        self.runs += 1
+        await asyncio.sleep(0.01)
+        if self.error:
+            raise self.error
+        return self.result
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+
+    flight = SingleFlight(enabled=True)
+    read = SlowRead()
+
+    results = await asyncio.gather(*(flight.do("key", read, "arg") for _ in range(10)))
+
+    assert results == ["value"] * 10
+    assert read.runs == 1
+    assert flight.stats()["coalescing_ratio"] == 0.9
+
+    # nothing is cached once the call finished
+    await flight.do("key", read, "arg")
+    assert read.runs == 2
+
+
+@pytest.mark.asyncio
+async def test_errors_are_shared_and_cancelled_callers_do_not_cancel_the_call():
+
+    flight = SingleFlight(enabled=True)
+    failing = SlowRead(error=ValueError("down"))
+
+    results = await asyncio.gather(*(flight.do("key", failing) for _ in range(3)), return_exceptions=True)
+    assert [type(result) for result in results] == [ValueError] * 3
+    assert failing.runs == 1
+
+    read = SlowRead()
+    first = asyncio.ensure_future(flight.do("key", read))
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(flight.do("key", read))
+    first.cancel()
+
+    assert await second == "value"
+    assert read.runs == 1
+
+
+@pytest.mark.asyncio
+async def test_disabled_flight_runs_every_call():
+
+    flight = SingleFlight(enabled=False)
+    read = SlowRead()
+
+    await asyncio.gather(*(flight.do("key", read) for _ in range(3)))
+    assert read.runs == 3
+
+
+@pytest.mark.asyncio
+async def test_parallel_requests_with_a_new_token_read_the_user_once(monkeypatch):
+
+    await drop_collections()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+
+        await register_and_login(ac, "simpleuser@example.com", "simpleuser", "Simple User")
+        principal_cache.clear()
+
+        find_by_email = storage.users.find_by_email
+        reads = []
+
+        async def slow_find_by_email(email):
+            reads.append(email)
+            await asyncio.sleep(0.01)
+            return await find_by_email(email)
+
+        monkeypatch.setattr(storage.users, "find_by_email", slow_find_by_email)
+        monkeypatch.setattr(user_lookups, "enabled", True)
+
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'simpleuser@example.com'})}"}
+        responses = await asyncio.gather(*(ac.get("/funds/portfolio", headers=headers) for _ in range(10)))
+
+        assert {response.status_code for response in responses} == {200}
+        assert reads == ["simpleuser@example.com"]
+
+
+@pytest.mark.asyncio
+async def test_user_read_after_an_invalidation_does_not_join_an_older_flight(monkeypatch):
+
+    await drop_collections()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+
+        await register_and_login(ac, "simpleuser@example.com", "simpleuser", "Simple User")
+        principal_cache.clear()
+
+        find_by_email = storage.users.find_by_email
+        reads = []
+
+        async def slow_find_by_email(email):
+            reads.append(email)
+            await asyncio.sleep(0.05)
+            return await find_by_email(email)
+
+        monkeypatch.setattr(storage.users, "find_by_email", slow_find_by_email)
+        monkeypatch.setattr(user_lookups, "enabled", True)
+
+        first = asyncio.ensure_future(get_current_user(create_access_token(data={"sub": "simpleuser@example.com"})))
+        await asyncio.sleep(0.01)
+
+        # a write lands while the first read is in flight
+        invalidate_user("simpleuser@example.com")
+        await get_current_user(create_access_token(data={"sub": "simpleuser@example.com"}, expires_delta=datetime.timedelta(minutes=5)))
+        await first
+
+        assert len(reads) == 2
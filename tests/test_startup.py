@@ -0,0 +1,21 @@
+import subprocess
+import sys
+
+# Loaded on first use, not when the app is imported
+LAZY_MODULES = ["passlib", "jose", "bcrypt"]
+
+
+def test_importing_the_app_defers_auth_libraries():
+
+    code = f"import sys, app.main; print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == ""
+
+
+def test_importing_the_app_starts_no_thread():
+
+    code = "import threading, app.main; print(threading.active_count())"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == "1"
@@ -0,0 +1,233 @@
+import datetime
+import pytest
+from bson import ObjectId
+from app.archive import archive_transactions
+from app.storage import storage, DuplicateError
+from app.storage.archive import TransactionArchive
+
+
+async def create_user(email="simpleuser@example.com", balance=500.0):
+
+    return await storage.users.insert({"name": "Simple User", "email": email, "hashed_password": "x", "balance": balance})
+
+
+@pytest.mark.asyncio
+async def test_user_email_is_unique():
+
+    await storage.reset()
+    await create_user()
+
+    with pytest.raises(DuplicateError):
+        await create_user()
+
+
+@pytest.mark.asyncio
+async def test_balance_update_is_guarded():
+
+    await storage.reset()
+    user_id = await create_user(balance=100.0)
+
+    assert await storage.users.update_balance(user_id, -80.0, minimum=80.0) == 20.0
+    assert await storage.users.update_balance(user_id, -80.0, minimum=80.0) is None
+    assert await storage.users.update_balance(user_id, 80.0) == 100.0
+    assert (await storage.users.find_by_id(user_id))["balance"] == 100.0
+
+
+@pytest.mark.asyncio
+async def test_subscription_is_unique_per_user_and_fund():
+
+    await storage.reset()
+    now = datetime.datetime.now()
+    await storage.subscriptions.insert("user", "fund", now)
+
+    with pytest.raises(DuplicateError):
+        await storage.subscriptions.insert("user", "fund", now)
+
+    assert await storage.subscriptions.find_fund_ids("user", ["fund", "other"]) == {"fund"}
+    assert await storage.subscriptions.delete("user", "fund", now)
+    assert not await storage.subscriptions.delete("user", "fund", now)
+
+
+@pytest.mark.asyncio
+async def test_batch_claims_block_single_cancel():
+
+    await storage.reset()
+    now = datetime.datetime.now()
+    batch_id = ObjectId()
+    await storage.subscriptions.insert("user", "a", now)
+    await storage.subscriptions.insert("user", "b", now)
+
+    locked_until = now + datetime.timedelta(minutes=1)
+
+    failed, claimed = await storage.subscriptions.write_batch("user", ["a", "c"], ["b", "d"], batch_id, now, locked_until)
+
+    assert failed == {"a"}
+    assert claimed == {"b"}
+    assert not await storage.subscriptions.delete("user", "b", now)
+    assert (await storage.subscriptions.write_batch("user", [], ["b"], ObjectId(), now, locked_until))[1] == set()
+
+    await storage.subscriptions.release_batch("user", ["c"], ["b"], batch_id)
+    assert await storage.subscriptions.find_fund_ids("user", ["a", "b", "c"]) == {"a", "b"}
+
+    await storage.subscriptions.write_batch("user", [], ["b"], batch_id, now, locked_until)
+    await storage.subscriptions.delete_claimed(batch_id)
+    assert await storage.subscriptions.count("user") == 1
+
+
+@pytest.mark.asyncio
+async def test_expired_batch_claims_are_taken_over():
+
+    await storage.reset()
+    now = datetime.datetime.now()
+    later = now + datetime.timedelta(minutes=2)
+    await storage.subscriptions.insert("user", "a", now)
+    await storage.subscriptions.insert("user", "b", now)
+
+    # a worker claimed both and died before finishing its batch
+    await storage.subscriptions.write_batch("user", [], ["a", "b"], ObjectId(), now, now + datetime.timedelta(minutes=1))
+
+    assert (await storage.subscriptions.write_batch("user", [], ["a"], ObjectId(), later, later))[1] == {"a"}
+    assert await storage.subscriptions.delete("user", "b", later)
+
+
+@pytest.mark.asyncio
+async def test_transaction_pages_follow_timestamp_order():
+
+    await storage.reset()
+    start = datetime.datetime(2024, 1, 1)
+    await storage.transactions.insert_many([
+        {"customer_id": "user", "fund_id": "fund", "type": "Open" if i % 2 else "Close", "amount": 50.0,
+         "timestamp": start + datetime.timedelta(days=9 - i), "customerName": "Simple User",
+         "fundName": "Tech Fund", "fundCategory": "Technology"}
+        for i in range(10)
+    ] + [{"customer_id": "other", "fund_id": "fund", "type": "Open", "amount": 50.0, "timestamp": start}])
+
+    first = await storage.transactions.page("user", 4)
+    assert [row["timestamp"].day for row in first] == [1, 2, 3, 4]
+    assert first[0]["customerId"] == "user"
+
+    second = await storage.transactions.page("user", 4, after=(first[-1]["timestamp"], first[-1]["_id"]))
+    assert [row["timestamp"].day for row in second] == [5, 6, 7, 8]
+
+    ranged = await storage.transactions.page("user", 100, from_date=start + datetime.timedelta(days=2),
+                                             to_date=start + datetime.timedelta(days=6), transaction_type="Open")
+    assert [row["timestamp"].day for row in ranged] == [3, 5]
+
+    streamed = [transaction async for transaction in storage.transactions.stream()]
+    assert [transaction["customer_id"] for transaction in streamed] == ["other"] + ["user"] * 10
+    assert await storage.transactions.count("user") == 10
+
+
+async def insert_monthly_transactions(customer_ids=("user",)):
+    """Two transactions per customer on the 1st and 15th of January to April 2024."""
+
+    await storage.transactions.insert_many([
+        {"customer_id": customer_id, "fund_id": "fund", "type": "Open", "amount": 50.0,
+         "timestamp": datetime.datetime(2024, month, day), "customerName": "Simple User",
+         "fundName": "Tech Fund", "fundCategory": "Technology"}
+        for customer_id in customer_ids for month in range(1, 5) for day in (1, 15)
+    ])
+
+
+@pytest.mark.asyncio
+async def test_transactions_are_read_across_month_buckets():
+
+    await storage.reset()
+    await insert_monthly_transactions(("user", "other"))
+
+    assert await storage.transactions.months() == ["2024_01", "2024_02", "2024_03", "2024_04"]
+
+    first = await storage.transactions.page("user", 3)
+    assert [(row["timestamp"].month, row["timestamp"].day) for row in first] == [(1, 1), (1, 15), (2, 1)]
+
+    second = await storage.transactions.page("user", 3, after=(first[-1]["timestamp"], first[-1]["_id"]))
+    assert [(row["timestamp"].month, row["timestamp"].day) for row in second] == [(2, 15), (3, 1), (3, 15)]
+
+    ranged = await storage.transactions.page("user", 100, from_date=datetime.datetime(2024, 2, 10),
+                                             to_date=datetime.datetime(2024, 4, 1))
+    assert [(row["timestamp"].month, row["timestamp"].day) for row in ranged] == [(2, 15), (3, 1), (3, 15)]
+
+    streamed = [(t["customer_id"], t["timestamp"].month) async for t in storage.transactions.stream()]
+    assert streamed == [(customer_id, month) for customer_id in ("other", "user") for month in range(1, 5) for _ in (1, 15)]
+    assert await storage.transactions.count("user") == 8
+
+
+@pytest.mark.asyncio
+async def test_pages_only_read_the_months_of_the_customer(monkeypatch):
+
+    await storage.reset()
+    await insert_monthly_transactions(("user",))
+    await storage.transactions.insert({"customer_id": "other", "fund_id": "fund", "type": "Open", "amount": 50.0,
+                                       "timestamp": datetime.datetime(2024, 3, 5)})
+    page_month = storage.transactions.page_month
+    months = []
+
+    async def recorded(month, *args):
+        months.append(month)
+        return await page_month(month, *args)
+
+    monkeypatch.setattr(storage.transactions, "page_month", recorded)
+
+    assert await storage.transactions.span("other") == ("2024_03", "2024_03")
+    assert len(await storage.transactions.page("other", 10)) == 1
+    assert months == ["2024_03"]
+    assert await storage.transactions.span("nobody") is None
+
+
+@pytest.mark.asyncio
+async def test_archived_months_stay_readable(tmp_path):
+
+    await storage.reset()
+    storage.transactions.archive = TransactionArchive(str(tmp_path))
+    await insert_monthly_transactions(("user", "other"))
+
+    archived = await archive_transactions(keep_months=1, now=datetime.datetime(2024, 4, 20))
+
+    assert archived == {"2024_01": 4, "2024_02": 4}
+    assert await storage.transactions.months() == ["2024_03", "2024_04"]
+    assert storage.transactions.archive.months() == ["2024_01", "2024_02"]
+
+    rows = await storage.transactions.page("user", 3, from_date=datetime.datetime(2024, 1, 10))
+    assert [(row["timestamp"].month, row["timestamp"].day) for row in rows] == [(1, 15), (2, 1), (2, 15)]
+    assert rows[0]["customerId"] == "user"
+
+    # a report from the start only reads the database buckets
+    rows = await storage.transactions.page("user", 100)
+    assert [row["timestamp"].month for row in rows] == [3, 3, 4, 4]
+
+    streamed = [(t["customer_id"], t["timestamp"].month) async for t in storage.transactions.stream()]
+    assert streamed == [(customer_id, month) for customer_id in ("other", "user") for month in range(1, 5) for _ in (1, 15)]
+    assert await storage.transactions.count() == 16
+    assert await storage.transactions.count("user") == 8
+
+
+@pytest.mark.asyncio
+async def test_fund_catalog_version():
+
+    await storage.reset()
+    version = await storage.funds.get_version()
+    await storage.funds.insert({"name": "Tech Fund", "minimumFee": 50.0, "category": "Technology"})
+    await storage.funds.bump_version()
+
+    assert await storage.funds.get_version() == version + 1
+    assert [fund["name"] for fund in await storage.funds.find_all()] == ["Tech Fund"]
+
+
+@pytest.mark.asyncio
+async def test_idempotency_claim_is_exclusive_until_its_lock_expires():
+
+    await storage.reset()
+    now = datetime.datetime(2024, 1, 1)
+    later = now + datetime.timedelta(minutes=2)
+    expires_at = now + datetime.timedelta(days=1)
+
+    assert await storage.idempotency.claim("key", "body", now, now + datetime.timedelta(minutes=1), expires_at)
+    assert not await storage.idempotency.claim("key", "body", now, now + datetime.timedelta(minutes=1), expires_at)
+
+    # the holder never finished: its lock has passed
+    assert await storage.idempotency.claim("key", "body", later, later + datetime.timedelta(minutes=1), expires_at)
+
+    await storage.idempotency.complete("key", {"status_code": 201, "headers": [], "body": b"{}"})
+    assert not await storage.idempotency.claim("key", "body", later, later, expires_at)
+    assert (await storage.idempotency.get("key", later))["response"]["body"] == b"{}"
+    assert await storage.idempotency.get("key", expires_at) is None